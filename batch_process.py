@@ -0,0 +1,300 @@
+# batch_process.py
+"""
+Headless batch processing: runs the TreeDetector + MTL pipeline over video files on
+every core, without the Flask services, and bulk-writes the detections to the database.
+
+Usage:
+    python batch_process.py videos/ "more_videos/*.mp4" --workers 8
+    python batch_process.py --benchmark --benchmark-frames 2000
+    python batch_process.py videos/ --store postgres --store-dsn "dbname=plant_monitor host=db1"
+"""
+import argparse
+import glob
+import multiprocessing as mp
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+
+from utils import database_manager
+from utils.database_manager import init_db, create_monitoring_job, update_job_status, \
+                                   insert_detections_bulk, commit_detections_with_checkpoint, close_db_connections
+from utils.detection_store import DETECTION_STORE, DETECTION_STORE_DSN, get_detection_store
+from utils.tree_detector import TreeDetector
+from utils.mtl_model import MTLClassifier
+
+DEFAULT_YOLO_MODEL_PATH = 'C:/Users/USER/Downloads/fyp project chatbot/models/best.pt'
+DEFAULT_MTL_MODEL_PATH = 'C:/Users/USER/Downloads/fyp project chatbot/models/MultitaskModelMobileNetV2_clean_data.pth'
+VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mov', '.mkv'}
+
+# Per-process state, set up once by the pool initializer
+_tree_detector = None
+_classifier = None
+_options = None
+
+
+def find_videos(inputs: list) -> list:
+    """Expands directories and glob patterns into a sorted list of video files."""
+    videos = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            candidates = [os.path.join(item, name) for name in os.listdir(item)]
+        else:
+            candidates = glob.glob(item)
+        for path in candidates:
+            if os.path.isfile(path) and os.path.splitext(path)[1].lower() in VIDEO_EXTENSIONS:
+                videos.add(os.path.abspath(path))
+    return sorted(videos)
+
+
+def file_version(path: str) -> str:
+    if not path or not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return f"{os.path.basename(path)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+
+def _init_worker(options: dict):
+    global _tree_detector, _classifier, _options
+    _options = options
+    # One intra-op thread per worker process; parallelism comes from the pool
+    torch.set_num_threads(options['torch_threads'])
+    cv2.setNumThreads(1)
+    if options['benchmark']:
+        _tree_detector = TreeDetector.random_init() if options['tree_detection'] else None
+        _classifier = MTLClassifier(None)
+    else:
+        _tree_detector = TreeDetector(options['yolo_model']) if options['tree_detection'] else None
+        _classifier = MTLClassifier(options['mtl_model'])
+
+
+def _random_crops(frame, count: int) -> list:
+    """Synthetic tree crops so a randomly initialised detector still feeds the classifier in benchmarks."""
+    h, w, _ = frame.shape
+    crops = []
+    for _ in range(count):
+        x1, y1 = random.randint(0, w // 2), random.randint(0, h // 2)
+        x2, y2 = random.randint(x1 + 16, w), random.randint(y1 + 16, h)
+        crops.append(Image.fromarray(cv2.cvtColor(frame[y1:y2, x1:x2], cv2.COLOR_BGR2RGB)))
+    return crops
+
+
+def _crops_for_frame(frame) -> list:
+    if _tree_detector is None:
+        return [Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))]
+    crops = _tree_detector.detect_trees(frame, _options['confidence'])
+    if _options['benchmark'] and len(crops) < _options['benchmark_crops']:
+        crops += _random_crops(frame, _options['benchmark_crops'] - len(crops))
+    return crops
+
+
+def _iter_frames(video_path: str, start: int, end: int, step: int):
+    """Yields (frame_index, frame) for sampled frames; skipped frames are only grabbed, not decoded to BGR."""
+    if _options['benchmark']:
+        width, height = _options['frame_size']
+        for index in range(start, end):
+            if index % step == 0:
+                yield index, np.random.randint(0, 256, (height, width, 3), dtype=np.uint8)
+        return
+
+    capture = cv2.VideoCapture(video_path)
+    capture.set(cv2.CAP_PROP_POS_FRAMES, start)
+    try:
+        for index in range(start, end):
+            if index % step != 0:
+                if not capture.grab():
+                    return
+                continue
+            ret, frame = capture.read()
+            if not ret:
+                return
+            yield index, frame
+    finally:
+        capture.release()
+
+
+def process_segment(task: tuple) -> dict:
+    """Runs detection + classification over frames [start, end) of one video."""
+    video_path, start, end, step = task
+    video_name = os.path.basename(video_path)
+    rows = []
+    pending = []  # (frame_index, tree_index, crop) waiting for a batched forward pass
+    frames_sampled = 0
+    crops = 0
+
+    def flush():
+        predictions = _classifier.predict_batch([crop for _, _, crop in pending])
+        timestamp = datetime.now().isoformat()
+        for (frame_index, tree_index, _), prediction in zip(pending, predictions):
+            rows.append({
+                'timestamp': timestamp,
+                'fruit_type': prediction['fruit'],
+                'ripeness': prediction['ripeness'],
+                'disease': prediction['disease'],
+                'confidence_fruit': prediction['confidence_fruit'],
+                'confidence_ripeness': prediction['confidence_ripeness'],
+                'confidence_disease': prediction['confidence_disease'],
+                'video_name': video_name,
+                'frame_index': frame_index,
+                'track_index': tree_index
+            })
+        pending.clear()
+
+    for frame_index, frame in _iter_frames(video_path, start, end, step):
+        frames_sampled += 1
+        for tree_index, crop in enumerate(_crops_for_frame(frame)):
+            pending.append((frame_index, tree_index, crop))
+            crops += 1
+        if len(pending) >= _options['classify_batch_size']:
+            flush()
+    if pending:
+        flush()
+
+    return {'video_path': video_path, 'rows': rows, 'frames': end - start,
+            'frames_sampled': frames_sampled, 'crops': crops}
+
+
+def plan_tasks(videos: list, interval_seconds: float, segment_frames: int) -> tuple:
+    """Splits every video into frame-range segments so long videos are spread over all workers."""
+    tasks = []
+    video_info = {}
+    for video_path in videos:
+        capture = cv2.VideoCapture(video_path)
+        if not capture.isOpened():
+            print(f"WARNING: Skipping {video_path}: cannot be opened.")
+            continue
+        frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        capture.release()
+        # Sample every interval_seconds of video time; index-aligned so segmenting never changes the samples
+        step = max(1, int(round(fps * interval_seconds)))
+        video_info[video_path] = {'frame_count': frame_count, 'step': step}
+        for start in range(0, frame_count, segment_frames):
+            tasks.append((video_path, start, min(start + segment_frames, frame_count), step))
+    return tasks, video_info
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run tree detection + MTL classification over video files without the web server.")
+    parser.add_argument('inputs', nargs='*', help="Video files, directories or glob patterns.")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Worker processes (default: all cores).")
+    parser.add_argument('--torch-threads', type=int, default=1, help="Torch intra-op threads per worker.")
+    parser.add_argument('--detection-interval', type=float, default=5.0, help="Seconds of video between sampled frames.")
+    parser.add_argument('--no-tree-detection', action='store_true', help="Classify full frames instead of tree crops.")
+    parser.add_argument('--confidence', type=float, default=0.5, help="Tree detector confidence threshold.")
+    parser.add_argument('--yolo-model', default=DEFAULT_YOLO_MODEL_PATH)
+    parser.add_argument('--mtl-model', default=DEFAULT_MTL_MODEL_PATH)
+    parser.add_argument('--segment-frames', type=int, default=3000, help="Frames per work unit.")
+    parser.add_argument('--classify-batch-size', type=int, default=32, help="Crops per MTL forward pass.")
+    parser.add_argument('--db-batch-size', type=int, default=5000, help="Rows per bulk insert transaction.")
+    parser.add_argument('--database', help="SQLite database to write to (default: the monitoring database; a temporary one in benchmark mode).")
+    parser.add_argument('--store', default=DETECTION_STORE, choices=['sqlite', 'duckdb', 'postgres'],
+                        help="Backend the detection rows are written to (jobs are always tracked in the SQLite database).")
+    parser.add_argument('--store-dsn', default=DETECTION_STORE_DSN, help="DuckDB file or Postgres connection string for --store.")
+    parser.add_argument('--benchmark', action='store_true', help="Dry run on synthetic frames with randomly initialised models.")
+    parser.add_argument('--benchmark-frames', type=int, default=1000, help="Synthetic frames in benchmark mode (all sampled).")
+    parser.add_argument('--benchmark-crops', type=int, default=4, help="Minimum crops per synthetic frame.")
+    parser.add_argument('--frame-size', default='1280x720', help="Synthetic frame size WIDTHxHEIGHT.")
+    args = parser.parse_args(argv)
+    if not args.benchmark and not args.inputs:
+        parser.error("give at least one video, directory or glob (or use --benchmark)")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    temp_database = None
+    if args.database:
+        database_manager.DATABASE_NAME = args.database
+    elif args.benchmark:
+        fd, temp_database = tempfile.mkstemp(suffix='.db', prefix='batch_benchmark_')
+        os.close(fd)
+        database_manager.DATABASE_NAME = temp_database
+    init_db()
+    # Detections go to another backend only when asked; the SQLite path keeps rollups and the aggregate cache
+    store = get_detection_store(args.store, args.store_dsn) if args.store != 'sqlite' else None
+    if store is not None:
+        store.init()
+    write_rows = (lambda rows: len(store.insert_detections(rows))) if store is not None else insert_detections_bulk
+
+    if args.benchmark:
+        per_worker = max(1, args.benchmark_frames // args.workers)
+        tasks = [('synthetic', start, min(start + per_worker, args.benchmark_frames), 1)
+                 for start in range(0, args.benchmark_frames, per_worker)]
+        video_info = {'synthetic': {'frame_count': args.benchmark_frames, 'step': 1}}
+    else:
+        videos = find_videos(args.inputs)
+        if not videos:
+            print("No video files found.")
+            return 1
+        tasks, video_info = plan_tasks(videos, args.detection_interval, args.segment_frames)
+
+    model_versions = {"tree_detector": 'random-init' if args.benchmark else file_version(args.yolo_model),
+                      "mtl": 'random-init' if args.benchmark else file_version(args.mtl_model)}
+    job_ids = {video_path: create_monitoring_job(video_path, args.detection_interval, not args.no_tree_detection,
+                                                 model_versions=model_versions,
+                                                 source_name=os.path.basename(video_path), kind='batch')
+               for video_path in video_info}
+
+    options = {
+        'benchmark': args.benchmark,
+        'tree_detection': not args.no_tree_detection,
+        'confidence': args.confidence,
+        'yolo_model': args.yolo_model,
+        'mtl_model': args.mtl_model,
+        'torch_threads': args.torch_threads,
+        'classify_batch_size': args.classify_batch_size,
+        'benchmark_crops': args.benchmark_crops,
+        'frame_size': tuple(int(v) for v in args.frame_size.lower().split('x'))
+    }
+
+    print(f"Processing {len(video_info)} video(s) as {len(tasks)} segment(s) on {args.workers} worker(s)...")
+    totals = {'frames': 0, 'frames_sampled': 0, 'crops': 0, 'rows': 0}
+    buffer = []
+    start_time = time.perf_counter()
+    with mp.get_context('spawn').Pool(args.workers, initializer=_init_worker, initargs=(options,)) as pool:
+        for result in pool.imap_unordered(process_segment, tasks):
+            job_id = job_ids[result['video_path']]
+            for row in result['rows']:
+                row['job_id'] = job_id
+            buffer.extend(result['rows'])
+            for key in ('frames', 'frames_sampled', 'crops'):
+                totals[key] += result[key]
+            if len(buffer) >= args.db_batch_size:
+                totals['rows'] += write_rows(buffer)
+                buffer = []
+    if buffer:
+        totals['rows'] += write_rows(buffer)
+    elapsed = time.perf_counter() - start_time
+
+    for video_path, job_id in job_ids.items():
+        frame_count = video_info[video_path]['frame_count']
+        commit_detections_with_checkpoint(job_id, frame_count, [], total_frames=frame_count)
+        update_job_status(job_id, 'completed')
+
+    print(f"\nFinished in {elapsed:.2f} s with {args.workers} worker(s)" + (" [benchmark, synthetic data]" if args.benchmark else ""))
+    print(f"  frames:  {totals['frames']:>10}  ({totals['frames'] / elapsed:,.1f} frames/s)")
+    print(f"  sampled: {totals['frames_sampled']:>10}  ({totals['frames_sampled'] / elapsed:,.1f} frames/s)")
+    print(f"  crops:   {totals['crops']:>10}  ({totals['crops'] / elapsed:,.1f} crops/s)")
+    print(f"  rows:    {totals['rows']:>10}  ({totals['rows'] / elapsed:,.1f} rows/s)")
+    print(f"  database: {database_manager.DATABASE_NAME}" + (" (temporary, removed)" if temp_database else ""))
+    if store is not None:
+        print(f"  detections written to: {store.name}")
+        store.close()
+
+    if temp_database:
+        close_db_connections()
+        for path in (temp_database, temp_database + '-wal', temp_database + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,111 @@
+# benchmark_serialization.py
+"""
+Times how the detection listings are turned into a JSON body: the previous path (tuples from the
+reader, dict(zip()) plus float() coercion per row, then jsonify's sorted-key json.dumps) against
+the shared one (row factory producing dicts, confidences coerced in SQL, utils.serialization.dumps).
+
+Usage:
+    python benchmark_serialization.py --rows 100000
+
+Runs on a temporary database filled with synthetic detections; both paths must produce the same
+JSON documents.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from utils import database_manager
+from utils.serialization import dumps, orjson
+from benchmark_storage import synthetic_detections
+
+CONFIDENCE_KEYS = ['confidence_fruit', 'confidence_ripeness', 'confidence_disease']
+
+
+def jsonify_dumps(value) -> bytes:
+    """What Flask's default JSON provider does outside debug mode."""
+    return json.dumps(value, ensure_ascii=True, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def previous_path(start: str, end: str, timings: dict) -> bytes:
+    started = time.perf_counter()
+    rows = database_manager.get_detections_in_time_range(start, end)
+    fetched = time.perf_counter()
+    detections_dicts = []
+    for row in rows:
+        detection_dict = dict(zip(database_manager.DETECTION_COLUMNS, row))
+        for key in CONFIDENCE_KEYS:
+            if detection_dict[key] is not None:
+                try:
+                    detection_dict[key] = float(detection_dict[key])
+                except ValueError:
+                    detection_dict[key] = None
+        detections_dicts.append(detection_dict)
+    built = time.perf_counter()
+    body = jsonify_dumps(detections_dicts)
+    done = time.perf_counter()
+    timings.update(fetch=fetched - started, build=built - fetched, encode=done - built, total=done - started)
+    return body
+
+
+def shared_path(start: str, end: str, timings: dict) -> bytes:
+    started = time.perf_counter()
+    rows = database_manager.get_detections_in_time_range(start, end, as_dicts=True)
+    fetched = time.perf_counter()
+    body = dumps(rows)
+    done = time.perf_counter()
+    timings.update(fetch=fetched - started, build=0.0, encode=done - fetched, total=done - started)
+    return body
+
+
+def best_of(repeat: int, path, start: str, end: str):
+    best, body = None, None
+    for _ in range(repeat):
+        timings = {}
+        body = path(start, end, timings)
+        if best is None or timings['total'] < best['total']:
+            best = timings
+    return best, body
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the detection JSON serialization paths.")
+    parser.add_argument('--rows', type=int, default=100000, help="Detections to serialize.")
+    parser.add_argument('--days', type=int, default=30, help="Time span the synthetic detections cover.")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per path; the fastest is reported.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    directory = tempfile.mkdtemp(prefix='serialization_benchmark_')
+    database_manager.DATABASE_NAME = os.path.join(directory, 'detections.db')
+    try:
+        database_manager.init_db()
+        database_manager.insert_detections_bulk(synthetic_detections(args.rows, args.days))
+        start = (datetime.now() - timedelta(days=args.days + 1)).isoformat()
+        end = (datetime.now() + timedelta(days=1)).isoformat()
+
+        previous, previous_body = best_of(args.repeat, previous_path, start, end)
+        shared, shared_body = best_of(args.repeat, shared_path, start, end)
+        if json.loads(previous_body) != json.loads(shared_body):
+            print("Warning: the two paths produced different documents.")
+
+        print(f"\n{args.rows} detections, {len(shared_body) / 1e6:.1f} MB of JSON "
+              f"(encoder: {'orjson' if orjson is not None else 'json'})")
+        print(f"{'':<10}{'previous':>12}{'shared':>12}")
+        for label in ('fetch', 'build', 'encode', 'total'):
+            print(f"{label:<10}{previous[label] * 1000:>10.1f}ms{shared[label] * 1000:>10.1f}ms")
+        print(f"speed-up  {previous['total'] / shared['total']:>11.1f}x")
+    finally:
+        database_manager.close_db_connections()
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
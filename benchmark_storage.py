@@ -0,0 +1,129 @@
+# benchmark_storage.py
+"""
+Runs the same synthetic detection workload against each storage backend (utils/detection_store.py):
+single inserts, batched inserts, a time-range query, counts by disease and a full streaming export.
+
+Usage:
+    python benchmark_storage.py --rows 200000
+    python benchmark_storage.py --backends sqlite duckdb postgres --postgres-dsn "dbname=bench host=localhost"
+
+SQLite and DuckDB run on temporary files. Postgres needs a running server and should point at an
+empty scratch database: rows are added to its detections table and left there.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from utils import database_manager
+from utils.detection_store import get_detection_store
+
+FRUITS = ['apple', 'grapes', 'banana']
+DISEASES = ['Apple___Apple_scab', 'Apple___Black_rot', 'Apple___healthy', 'Grape___Black_rot',
+            'Grape___Leaf_blight_(Isariopsis_Leaf_Spot)', 'Grape___healthy', 'Banana___healthy']
+RIPENESS = ['ripe', 'unripe', 'overripe']
+
+
+def synthetic_detections(count: int, days: int, seed: int = 0) -> list:
+    """Detections spread evenly over the last `days` days, oldest first."""
+    rng = random.Random(seed)
+    start = datetime.now() - timedelta(days=days)
+    step = timedelta(days=days) / max(count, 1)
+    return [{
+        'timestamp': (start + step * i).isoformat(),
+        'fruit_type': rng.choice(FRUITS),
+        'ripeness': rng.choice(RIPENESS),
+        'disease': rng.choice(DISEASES),
+        'confidence_fruit': rng.random(),
+        'confidence_ripeness': rng.random(),
+        'confidence_disease': rng.random(),
+        'video_name': f"orchard_{i % 5}.mp4",
+        'frame_index': i,
+        'track_index': i % 4,
+    } for i in range(count)]
+
+
+def timed(label: str, work, results: dict, units: int = None):
+    start = time.perf_counter()
+    value = work()
+    elapsed = time.perf_counter() - start
+    results[label] = elapsed
+    rate = f"  ({units / elapsed:,.0f} rows/s)" if units else ''
+    print(f"  {label:<16} {elapsed * 1000:>10.1f} ms{rate}")
+    return value
+
+
+def run_backend(backend: str, dsn: str, detections: list, args) -> dict:
+    store = get_detection_store(backend, dsn)
+    results = {}
+    try:
+        store.init()
+        singles = detections[:args.single_inserts]
+        timed('single inserts', lambda: [store.insert_detection(d) for d in singles], results, len(singles))
+        rest = detections[args.single_inserts:]
+        timed('batched inserts', lambda: [store.insert_detections(rest[i:i + args.batch_size])
+                                          for i in range(0, len(rest), args.batch_size)], results, len(rest))
+        end = datetime.now()
+        start = end - timedelta(days=1)
+        rows = timed('range (1 day)', lambda: store.get_detections_in_time_range(start.isoformat(), end.isoformat()), results)
+        print(f"  {'':<16} {len(rows)} rows")
+        timed('counts/disease', lambda: store.get_counts('disease'), results)
+        exported = timed('export (all)', lambda: sum(len(chunk) for chunk in store.iter_detection_chunks(chunk_size=args.chunk_size)),
+                         results)
+        print(f"  {'':<16} {exported} rows")
+    finally:
+        store.close()
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare detection storage backends on the same workload.")
+    parser.add_argument('--backends', nargs='+', default=['sqlite', 'duckdb', 'postgres'],
+                        choices=['sqlite', 'duckdb', 'postgres'])
+    parser.add_argument('--rows', type=int, default=100000, help="Detections to insert per backend.")
+    parser.add_argument('--days', type=int, default=30, help="Time span the synthetic detections cover.")
+    parser.add_argument('--single-inserts', type=int, default=500, help="Rows inserted one transaction at a time.")
+    parser.add_argument('--batch-size', type=int, default=5000, help="Rows per batched insert.")
+    parser.add_argument('--chunk-size', type=int, default=1000, help="Rows per export chunk.")
+    parser.add_argument('--postgres-dsn', help="Connection string of a scratch Postgres database (Postgres is skipped without it).")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    detections = synthetic_detections(args.rows, args.days)
+    temporary_files = []
+    summary = {}
+    for backend in args.backends:
+        if backend == 'postgres' and not args.postgres_dsn:
+            print("\npostgres: skipped (no --postgres-dsn)")
+            continue
+        dsn = args.postgres_dsn
+        if backend in ('sqlite', 'duckdb'):
+            directory = tempfile.mkdtemp(prefix='storage_benchmark_')
+            dsn = os.path.join(directory, 'detections.' + ('db' if backend == 'sqlite' else 'duckdb'))
+            temporary_files.append(directory)
+        print(f"\n{backend}:")
+        try:
+            summary[backend] = run_backend(backend, dsn, detections, args)
+        except Exception as e:
+            print(f"  skipped: {e}")
+
+    if summary:
+        labels = list(next(iter(summary.values())))
+        print("\n" + f"{'':<16}" + ''.join(f"{backend:>12}" for backend in summary))
+        for label in labels:
+            print(f"{label:<16}" + ''.join(f"{results.get(label, float('nan')) * 1000:>10.1f}ms" for results in summary.values()))
+
+    database_manager.close_db_connections()
+    for directory in temporary_files:
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,6 +1,9 @@
 // script.js (Vanilla JavaScript for both Monitoring and Chatbot)
 
 document.addEventListener('DOMContentLoaded', () => {
+    // Server-Sent Events stream of detections and progress ticks from monitor_api.py
+    const MONITOR_EVENTS_URL = 'http://localhost:5002/api/monitoring/events';
+
     // --- Dark Mode Toggle (present on all pages) ---
     const themeToggle = document.getElementById('theme-toggle');
     if (themeToggle) {
@@ -32,18 +35,116 @@ document.addEventListener('DOMContentLoaded', () => {
         const totalFramesStatus = document.getElementById('totalFramesStatus');
 
         let uploadedVideoURL = null;
-        let progressIntervalId = null;
+        let progressEventSource = null;
 
         /**
-         * Clears any active monitoring intervals (progress).
+         * Closes the progress event stream, if one is open.
          */
         function clearMonitoringIntervals() {
-            if (progressIntervalId) {
-                clearInterval(progressIntervalId);
-                progressIntervalId = null;
+            if (progressEventSource) {
+                progressEventSource.close();
+                progressEventSource = null;
             }
         }
 
+        /**
+         * Subscribes to progress ticks pushed by the monitoring API instead of polling.
+         */
+        function subscribeToProgress() {
+            clearMonitoringIntervals();
+            progressEventSource = new EventSource(MONITOR_EVENTS_URL);
+            progressEventSource.addEventListener('progress', (event) => {
+                const progressData = JSON.parse(event.data);
+                updateProgress(
+                    progressData.processed_frames,
+                    progressData.total_frames,
+                    progressData.is_monitoring_active
+                );
+            });
+        }
+
+        const MONITOR_API_URL = 'http://localhost:5002';
+        const UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024; // 8 MB per request
+        const UPLOAD_MAX_RETRIES = 5;
+
+        /**
+         * Uploads a video through the resumable chunked protocol. An upload interrupted by a
+         * network error or page reload continues from the server's committed offset.
+         * Monitoring starts on the server as soon as enough of the video has arrived.
+         * @param {File} file - The video file.
+         * @param {Object} settings - detectionInterval and enableTreeDetection.
+         * @returns {Promise<{response: Response, data: Object}>} The last server response.
+         */
+        async function uploadVideoInChunks(file, settings) {
+            const resumeKey = `chunked-upload:${file.name}:${file.size}:${file.lastModified}`;
+            let uploadId = localStorage.getItem(resumeKey);
+            let offset = 0;
+            let response = null;
+            let data = null;
+
+            if (uploadId) {
+                response = await fetch(`${MONITOR_API_URL}/upload_video/chunked/${uploadId}`);
+                data = await response.json();
+                if (response.ok && data.status === 'uploading') {
+                    offset = data.offset;
+                } else {
+                    uploadId = null;
+                }
+            }
+            if (!uploadId) {
+                response = await fetch(`${MONITOR_API_URL}/upload_video/chunked`, {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ filename: file.name, total_size: file.size, ...settings })
+                });
+                data = await response.json();
+                if (!response.ok) {
+                    return { response, data };
+                }
+                uploadId = data.upload_id;
+                localStorage.setItem(resumeKey, uploadId);
+            }
+
+            let retries = 0;
+            while (offset < file.size) {
+                try {
+                    response = await fetch(`${MONITOR_API_URL}/upload_video/chunked/${uploadId}?offset=${offset}`, {
+                        method: 'PUT',
+                        body: file.slice(offset, offset + UPLOAD_CHUNK_SIZE)
+                    });
+                    data = await response.json();
+                } catch (error) {
+                    if (++retries > UPLOAD_MAX_RETRIES) {
+                        throw error;
+                    }
+                    // Connection dropped: wait, then ask the server where to resume
+                    await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+                    const statusResponse = await fetch(`${MONITOR_API_URL}/upload_video/chunked/${uploadId}`).catch(() => null);
+                    if (statusResponse && statusResponse.ok) {
+                        offset = (await statusResponse.json()).offset;
+                    }
+                    continue;
+                }
+                if (response.status === 409 && data.offset !== undefined && data.status === 'uploading') {
+                    offset = data.offset; // Server committed a different offset; resume from there
+                    continue;
+                }
+                if (!response.ok) {
+                    localStorage.removeItem(resumeKey);
+                    return { response, data };
+                }
+                retries = 0;
+                offset = data.offset;
+                const percent = ((offset / file.size) * 100).toFixed(1);
+                responseMessage.textContent = `Uploading video... ${percent}%` + (data.job_id ? ' (monitoring already running on the received part)' : '');
+                if (data.job_id && !progressEventSource) {
+                    subscribeToProgress();
+                }
+            }
+            localStorage.removeItem(resumeKey);
+            return { response, data };
+        }
+
         /**
          * Handles the video file upload and initiates monitoring.
          * @param {Event} event - The form submission event.
@@ -51,11 +152,11 @@ document.addEventListener('DOMContentLoaded', () => {
         uploadForm.addEventListener('submit', async function(event) {
             event.preventDefault(); // Prevent default form submission
 
-            const formData = new FormData(uploadForm); // Use the form element directly
-
-            // Append selected detection interval and tree detection preference
-            formData.append('detectionInterval', detectionIntervalSelect.value);
-            formData.append('enableTreeDetection', enableTreeDetectionCheckbox.checked);
+            // Selected detection interval and tree detection preference
+            const settings = {
+                detectionInterval: detectionIntervalSelect.value,
+                enableTreeDetection: enableTreeDetectionCheckbox.checked
+            };
 
             // Update UI to show uploading state
             responseMessage.textContent = 'Uploading video and starting monitoring... Please wait, this may take a moment.';
@@ -70,15 +171,16 @@ document.addEventListener('DOMContentLoaded', () => {
             clearMonitoringIntervals(); // Clear any previous monitoring sessions
 
             try {
-                const response = await fetch('http://localhost:5002/upload_video', {
-                    method: 'POST',
-                    body: formData
-                });
-
-                const data = await response.json();
+                const selectedFile = videoFile.files.item(0);
+                if (!selectedFile) {
+                    responseMessage.textContent = 'Please choose a video file first.';
+                    responseMessage.className = 'message-box error';
+                    return;
+                }
+                const { response, data } = await uploadVideoInChunks(selectedFile, settings);
 
                 if (response.ok) {
-                    responseMessage.textContent = `Success! Monitoring initiated. Server message: ${JSON.stringify(data.status || data, null, 2)}`;
+                    responseMessage.textContent = `Success! Video uploaded (sha256 ${data.sha256}) and monitoring initiated as job ${data.job_id}.`;
                     responseMessage.className = 'message-box success';
                     
                     // Revoke previous video URL if exists to free memory
@@ -97,8 +199,8 @@ document.addEventListener('DOMContentLoaded', () => {
                         currentVideoStatus.textContent = `Monitoring video: ${videoFileObj.name}`;
                     }
 
-                    // Start polling for progress
-                    progressIntervalId = setInterval(fetchProgress, 1000); // Every 1 second
+                    // Listen for pushed progress updates
+                    subscribeToProgress();
 
                 } else {
                     // Handle server-side errors
@@ -161,7 +263,7 @@ document.addEventListener('DOMContentLoaded', () => {
                     clearMonitoringIntervals(); // Ensure intervals are cleared once finished
                 } else {
                     currentVideoStatus.textContent = `Monitoring Inactive.`;
-                    if(progressIntervalId) { // Only clear progress interval if it exists
+                    if (progressEventSource) { // Only close the progress stream if it exists
                         clearMonitoringIntervals();
                     }
                 }
@@ -176,26 +278,40 @@ document.addEventListener('DOMContentLoaded', () => {
             }
         }
 
-        // Initial data fetch when the page loads
-        fetchProgress();
+        // Initial data fetch when the page loads, then follow pushed updates
+        fetchProgress().then(subscribeToProgress);
     }
 
     // --- Latest Detections Section Logic (for detections.html) ---
     const predictionTableBody = document.getElementById('predictionTableBody');
     if (predictionTableBody) { // Check if detections table is present on this page
-        let detectionsIntervalId = null; // Declare here for this scope
+        let detectionsEventSource = null; // Declare here for this scope
+
+        const loadMoreButton = document.getElementById('loadMoreDetections');
+        const DETECTIONS_PAGE_SIZE = 50;
+        // Only the columns the table renders
+        const DETECTION_FIELDS = 'id,timestamp,fruit_type,ripeness,disease,confidence_fruit,confidence_ripeness,confidence_disease,notes';
+        let nextPageCursor = null;
 
         /**
-         * Fetches the latest predictions from the monitoring API and updates the table.
+         * Fetches a page of predictions from the monitoring API and updates the table.
+         * @param {boolean} append - Add the next page below the current rows instead of reloading the first page.
          */
-        async function fetchPredictions() {
-            const url = 'http://localhost:5002/api/monitoring/detections';
+        async function fetchPredictions(append = false) {
+            let url = `http://localhost:5002/api/monitoring/detections?limit=${DETECTIONS_PAGE_SIZE}&fields=${DETECTION_FIELDS}`;
+            if (append && nextPageCursor) {
+                url += `&cursor=${encodeURIComponent(nextPageCursor)}`;
+            }
             
             try {
                 const response = await fetch(url);
                 if (response.ok) {
                     const predictions = await response.json();
-                    displayPredictions(predictions);
+                    nextPageCursor = response.headers.get('X-Next-Cursor');
+                    if (loadMoreButton) {
+                        loadMoreButton.style.display = nextPageCursor ? '' : 'none';
+                    }
+                    displayPredictions(predictions, append);
                 } else {
                     console.error(`Failed to fetch predictions: HTTP Status ${response.status}`);
                     predictionTableBody.innerHTML = '<tr><td colspan="5" class="no-data">Failed to load predictions. Please check server.</td></tr>';
@@ -207,60 +323,20 @@ document.addEventListener('DOMContentLoaded', () => {
         }
 
         /**
-         * Displays the fetched predictions in the table.
+         * Displays the fetched predictions in the table (already newest first).
          * @param {Array<Object>} predictions - An array of prediction objects.
+         * @param {boolean} append - Keep the rows already shown and add these below them.
          */
-        function displayPredictions(predictions) {
-            predictionTableBody.innerHTML = ''; // Clear existing rows
+        function displayPredictions(predictions, append = false) {
+            if (!append) {
+                predictionTableBody.innerHTML = ''; // Clear existing rows
+            }
 
             if (predictions && predictions.length > 0) {
-                // Sort predictions by timestamp in descending order (newest first)
-                predictions.sort((a, b) => new Date(b.timestamp) - new Date(a.timestamp));
-
                 predictions.forEach(prediction => {
-                    const row = document.createElement('tr'); 
-
-                    // Time Cell
-                    const timeCell = document.createElement('td');
-                    // Format time to be more readable, e.g., HH:MM:SS
-                    timeCell.textContent = new Date(prediction.timestamp).toLocaleTimeString('en-US', { hour: '2-digit', minute: '2-digit', second: '2-digit' });
-                    row.appendChild(timeCell);
-
-                    // Fruit Type Cell
-                    const fruitCell = document.createElement('td');
-                    let fruitText = prediction.fruit_type && prediction.fruit_type.toLowerCase() !== 'unknown' ? prediction.fruit_type : 'N/A';
-                    if (prediction.confidence_fruit !== null && prediction.confidence_fruit !== undefined) {
-                        fruitText += ` (${(prediction.confidence_fruit * 100).toFixed(2)}%)`;
-                    }
-                    fruitCell.textContent = fruitText;
-                    row.appendChild(fruitCell);
-
-                    // Ripeness Cell
-                    const ripenessCell = document.createElement('td');
-                    let ripenessText = prediction.ripeness && prediction.ripeness.toLowerCase() !== 'unknown' ? prediction.ripeness : 'N/A';
-                    if (prediction.confidence_ripeness !== null && prediction.confidence_ripeness !== undefined) {
-                        ripenessText += ` (${(prediction.confidence_ripeness * 100).toFixed(2)}%)`;
-                    }
-                    ripenessCell.textContent = ripenessText;
-                    row.appendChild(ripenessCell);
-
-                    // Disease Cell
-                    const diseaseCell = document.createElement('td');
-                    let diseaseText = prediction.disease && prediction.disease.toLowerCase() !== 'unknown' ? prediction.disease : 'N/A';
-                    if (prediction.confidence_disease !== null && prediction.confidence_disease !== undefined) {
-                        diseaseText += ` (${(prediction.confidence_disease * 100).toFixed(2)}%)`;
-                    }
-                    diseaseCell.textContent = diseaseText;
-                    row.appendChild(diseaseCell);
-
-                    // Notes Cell
-                    const notesCell = document.createElement('td');
-                    notesCell.textContent = prediction.notes && prediction.notes.toLowerCase() !== 'unknown' ? prediction.notes : '';
-                    row.appendChild(notesCell);
-
-                    predictionTableBody.appendChild(row);
+                    predictionTableBody.appendChild(createPredictionRow(prediction));
                 });
-            } else {
+            } else if (!append) {
                 const noPredictionsRow = document.createElement('tr');
                 const noPredictionsCell = document.createElement('td');
                 noPredictionsCell.colSpan = 5;
@@ -271,9 +347,79 @@ document.addEventListener('DOMContentLoaded', () => {
             }
         }
 
-        // Start polling for detections
-        detectionsIntervalId = setInterval(fetchPredictions, 3000); // Every 3 seconds
-        fetchPredictions(); // Initial fetch
+        if (loadMoreButton) {
+            loadMoreButton.addEventListener('click', () => fetchPredictions(true));
+        }
+
+        /**
+         * Adds a single pushed prediction to the top of the table.
+         * @param {Object} prediction - A prediction object.
+         */
+        function prependPrediction(prediction) {
+            const placeholder = predictionTableBody.querySelector('.no-data');
+            if (placeholder) {
+                predictionTableBody.innerHTML = '';
+            }
+            predictionTableBody.insertBefore(createPredictionRow(prediction), predictionTableBody.firstChild);
+        }
+
+        /**
+         * Builds the table row for one prediction.
+         * @param {Object} prediction - A prediction object.
+         * @returns {HTMLTableRowElement} The populated row.
+         */
+        function createPredictionRow(prediction) {
+            const row = document.createElement('tr'); 
+
+            // Time Cell
+            const timeCell = document.createElement('td');
+            // Format time to be more readable, e.g., HH:MM:SS
+            timeCell.textContent = new Date(prediction.timestamp).toLocaleTimeString('en-US', { hour: '2-digit', minute: '2-digit', second: '2-digit' });
+            row.appendChild(timeCell);
+
+            // Fruit Type Cell
+            const fruitCell = document.createElement('td');
+            let fruitText = prediction.fruit_type && prediction.fruit_type.toLowerCase() !== 'unknown' ? prediction.fruit_type : 'N/A';
+            if (prediction.confidence_fruit !== null && prediction.confidence_fruit !== undefined) {
+                fruitText += ` (${(prediction.confidence_fruit * 100).toFixed(2)}%)`;
+            }
+            fruitCell.textContent = fruitText;
+            row.appendChild(fruitCell);
+
+            // Ripeness Cell
+            const ripenessCell = document.createElement('td');
+            let ripenessText = prediction.ripeness && prediction.ripeness.toLowerCase() !== 'unknown' ? prediction.ripeness : 'N/A';
+            if (prediction.confidence_ripeness !== null && prediction.confidence_ripeness !== undefined) {
+                ripenessText += ` (${(prediction.confidence_ripeness * 100).toFixed(2)}%)`;
+            }
+            ripenessCell.textContent = ripenessText;
+            row.appendChild(ripenessCell);
+
+            // Disease Cell
+            const diseaseCell = document.createElement('td');
+            let diseaseText = prediction.disease && prediction.disease.toLowerCase() !== 'unknown' ? prediction.disease : 'N/A';
+            if (prediction.confidence_disease !== null && prediction.confidence_disease !== undefined) {
+                diseaseText += ` (${(prediction.confidence_disease * 100).toFixed(2)}%)`;
+            }
+            diseaseCell.textContent = diseaseText;
+            row.appendChild(diseaseCell);
+
+            // Notes Cell
+            const notesCell = document.createElement('td');
+            notesCell.textContent = prediction.notes && prediction.notes.toLowerCase() !== 'unknown' ? prediction.notes : '';
+            row.appendChild(notesCell);
+
+            return row;
+        }
+
+        // Initial fetch, then new detections are pushed by the server as they are stored
+        fetchPredictions();
+        detectionsEventSource = new EventSource(MONITOR_EVENTS_URL);
+        detectionsEventSource.addEventListener('detection', (event) => {
+            prependPrediction(JSON.parse(event.data));
+        });
+        // The server could not replay everything we missed while disconnected; reload the table
+        detectionsEventSource.addEventListener('reset', () => fetchPredictions());
     }
 
 
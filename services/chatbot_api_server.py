@@ -1,5 +1,5 @@
 # chatbot_api_server.py
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS # Import CORS for cross-origin requests
 import os
 import sys
@@ -10,6 +10,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 
 from utils.chatbot_agents import run_chatbot, agent_executor
+from utils.metrics import REGISTRY, PROMETHEUS_CONTENT_TYPE
 
 app = Flask(__name__)
 CORS(app) # Enable CORS for all routes - important for frontend to talk to backend
@@ -22,6 +23,15 @@ if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
+chat_requests_total = REGISTRY.counter('chatbot_requests_total', 'Requests to /chat by outcome.', labelnames=('outcome',))
+chat_seconds = REGISTRY.histogram('chatbot_response_seconds', 'Time spent producing a chatbot answer in seconds.',
+                                  buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics for the chatbot service."""
+    return Response(REGISTRY.render(), mimetype=PROMETHEUS_CONTENT_TYPE)
+
 @app.route('/chat', methods=['POST'])
 def chat():
     if agent_executor is None:
@@ -46,9 +56,12 @@ def chat():
     try:
         # Call the run_chatbot function from chatbot_agents.py
         # Pass the image_path directly, as run_chatbot expects it now
-        chatbot_response = run_chatbot(user_message, image_path=image_path)
+        with chat_seconds.time():
+            chatbot_response = run_chatbot(user_message, image_path=image_path)
+        chat_requests_total.labels(outcome='ok').inc()
         return jsonify({"response": chatbot_response})
     except Exception as e:
+        chat_requests_total.labels(outcome='error').inc()
         print(f"ERROR: An error occurred during chatbot interaction: {e}")
         return jsonify({"error": f"An internal error occurred: {e}"}), 500
     finally:
@@ -6,8 +6,11 @@ import requests
 import io
 import threading
 import uuid
-from datetime import datetime
-from flask import Flask, jsonify, Response, request, send_from_directory
+import hashlib
+import atexit
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+from flask import Flask, jsonify, Response, request, send_from_directory, stream_with_context
 from flask_cors import CORS
 from PIL import Image
 from werkzeug.utils import secure_filename
@@ -15,27 +18,83 @@ import base64
 
 # Import TreeDetector and database manager
 from utils.tree_detector import TreeDetector
-from utils.database_manager import init_db, insert_detection, get_all_detections, \
+from utils.frame_broadcaster import FrameBroadcaster
+from utils.event_stream import EventBroker
+from utils.chunked_upload import ChunkedUploadManager, UploadError
+from utils.video_fingerprint import save_stream_with_hash, compute_prefix_hash, fingerprint_video, fingerprints_match
+from utils.metrics import REGISTRY, PROMETHEUS_CONTENT_TYPE, stage_timer, hot_path_log
+from utils.profiling import CProfileCapture, register_profiling_routes
+from utils.sampling_controller import AdaptiveSamplingController
+from utils.crop_store import CropStore
+from utils.detection_writer import DetectionWriter
+from utils.retention import RetentionManager
+from utils.detection_export import stream_export, EXPORT_FORMATS
+from utils.search_query import parse_search_query
+from utils.serialization import dumps
+from utils.database_manager import init_db, get_detections_page, DETECTION_COLUMNS, \
+                                   get_detections_since, get_latest_detection_id, to_epoch_ms, get_aggregate_cache, \
+                                   iter_detection_chunks, search_detections, \
                                    get_total_detections, get_detection_counts_by_fruit, \
-                                   get_detection_counts_by_disease, get_detections_in_time_range
+                                   get_detection_counts_by_disease, get_detections_in_time_range, get_detection_trend, \
+                                   create_monitoring_job, get_monitoring_job, get_interrupted_job, \
+                                   update_job_status, \
+                                   get_video_upload_by_path, set_video_upload_job, \
+                                   insert_video_fingerprint, get_reusable_fingerprints, get_detections_for_job, \
+                                   get_alert_engine, create_alert_rule, get_alert_rules, delete_alert_rule
 
 app = Flask(__name__)
-CORS(app)
+# Pagination and cache validator headers must be readable by the dashboard's fetch() calls
+CORS(app, expose_headers=['X-Next-Cursor', 'Link', 'ETag', 'X-Latest-Id'])
 
 # --- Configuration ---
 YOLO_MODEL_PATH = 'C:/Users/USER/Downloads/fyp project chatbot/models/best.pt' 
 MTL_API_URL = 'http://localhost:5001/predict_image'
+MTL_MODEL_VERSION = 'MultitaskModelMobileNetV2_clean_data' # Recorded with each monitoring job
+
+# Job checkpointing: progress is persisted at least this often (seconds) so a restart resumes the video
+CHECKPOINT_INTERVAL_SECONDS = 5
+RESUME_INTERRUPTED_JOB_ON_STARTUP = True
+
+# MJPEG stream settings for /video_feed
+STREAM_MAX_FPS = 15
+STREAM_JPEG_QUALITY = 80
+STREAM_OUTPUT_SIZE = None # e.g. (640, 360) to downscale the stream; None keeps the source resolution
+
+# Rows fetched per query by the streaming export (Parquet writes one row group per chunk)
+EXPORT_CHUNK_ROWS = 1000
+EXPORT_PARQUET_ROW_GROUP = 50000
+
+# Page size of /api/monitoring/detections when the client does not ask for one, and the largest allowed
+DETECTIONS_DEFAULT_PAGE_SIZE = 100
+DETECTIONS_MAX_PAGE_SIZE = 1000
+SEARCH_DEFAULT_PAGE_SIZE = 50
+
+# Range of /api/monitoring/trends when the client gives no start_time
+TREND_DEFAULT_SPANS = {'minute': timedelta(hours=2), 'hour': timedelta(days=2), 'day': timedelta(days=30)}
+
+# Minimum spacing (seconds) between progress events pushed to /api/monitoring/events
+PROGRESS_EVENT_INTERVAL = 0.5
+
+# Adaptive sampling: the detection interval chosen at upload is only the starting point. While a
+# video is processed the interval is retuned from measured per-frame processing time so detections
+# stay within the latency target and the pipeline uses at most DETECTION_CPU_BUDGET of wall time.
+ADAPTIVE_SAMPLING_ENABLED = True
+TARGET_DETECTION_LATENCY_SECONDS = 2.0
+DETECTION_CPU_BUDGET = 0.5
+MIN_DETECTION_INTERVAL = 0.5
+MAX_DETECTION_INTERVAL = 60.0
 
 # --- Global Variables for Video Capture and Threading ---
 cap = None
 is_monitoring_active = False
 detection_thread = None
-latest_frame = None
 current_video_path = None
+current_job_id = None
 video_playback_pos = 0 
 total_video_frames = 0 
 current_detection_interval = 5 
 enable_tree_detection_global = True 
+sampling_controller = None # AdaptiveSamplingController of the running job
 
 # --- Video Upload Configuration ---
 UPLOAD_FOLDER = 'uploads'
@@ -43,9 +102,78 @@ ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# Chunked uploads: monitoring starts once this many bytes have arrived, and while the
+# upload is still running the monitor waits this long (seconds) for more data when it catches up
+STREAMING_START_BYTES = 16 * 1024 * 1024
+UPLOAD_WAIT_SECONDS = 1.0
+upload_manager = ChunkedUploadManager(UPLOAD_FOLDER)
+
+# Re-uploads whose fingerprint matches a video already processed with the same models and
+# sampling config reuse its detections. Frames match if their perceptual hashes differ in at most this many bits.
+FINGERPRINT_PREFIX_BYTES = 1024 * 1024
+FINGERPRINT_MAX_HAMMING_DISTANCE = 6
+
+# Detected crops are kept in a content-addressed store (written by a background thread) and their
+# path is recorded in detections.image_capture_path; least recently used crops go beyond the cap
+CROP_STORE_FOLDER = 'crops'
+CROP_STORE_MAX_BYTES = 2 * 1024 ** 3
+crop_store = CropStore(CROP_STORE_FOLDER, max_bytes=CROP_STORE_MAX_BYTES)
+atexit.register(crop_store.close)
+
+# Detections are committed by a write-behind writer in batches of up to DETECTION_WRITE_BATCH_ROWS rows,
+# at most DETECTION_WRITE_MAX_DELAY seconds after they were produced. A finishing job waits at most
+# DETECTION_WRITE_FLUSH_TIMEOUT seconds for its last rows to become durable.
+DETECTION_WRITE_BATCH_ROWS = 200
+DETECTION_WRITE_MAX_DELAY = 1.0
+DETECTION_WRITE_FLUSH_TIMEOUT = 60.0
+detection_writer = DetectionWriter(max_rows=DETECTION_WRITE_BATCH_ROWS, max_delay=DETECTION_WRITE_MAX_DELAY)
+atexit.register(detection_writer.close)
+
+# Single encoder shared by every /video_feed client
+frame_broadcaster = FrameBroadcaster(max_fps=STREAM_MAX_FPS,
+                                     jpeg_quality=STREAM_JPEG_QUALITY,
+                                     output_size=STREAM_OUTPUT_SIZE)
+
+# --- Metrics ---
+frames_read_total = REGISTRY.counter('monitor_frames_read_total', 'Video frames decoded by the monitoring loop.')
+frames_sampled_total = REGISTRY.counter('monitor_frames_sampled_total', 'Frames sent through detection.')
+crops_total = REGISTRY.counter('monitor_crops_total', 'Tree crops produced by the tree detector.')
+detections_stored_total = REGISTRY.counter('monitor_detections_stored_total', 'Detection rows committed to the database.')
+mtl_errors_total = REGISTRY.counter('monitor_mtl_errors_total', 'Failed requests to the MTL API.')
+stream_subscribers_gauge = REGISTRY.gauge('monitor_stream_subscribers', 'Clients connected to /video_feed.')
+
+# On-demand profiling of the live process (/admin/profile/...); monitoring_loop opts in to cProfile captures
+cprofile_capture = CProfileCapture()
+register_profiling_routes(app, cprofile_capture)
+
+# Push channel for detections and progress ticks (Server-Sent Events)
+event_broker = EventBroker()
+
 # Ensure database is initialized on startup
 init_db()
 
+# The total/by-fruit/by-disease endpoints are served from an in-memory cache that inserts keep current;
+# it is reloaded from the rollups this often (seconds) to pick up rows written by other processes
+AGGREGATE_RECONCILE_SECONDS = 60
+get_aggregate_cache().start_reconciliation(AGGREGATE_RECONCILE_SECONDS)
+
+# Disease alert rules are evaluated as detections are committed; alerts fired in this process are
+# pushed to event stream subscribers as 'alert' events (and posted to webhooks by the engine itself)
+get_alert_engine().subscribe(lambda alert, rule: event_broker.publish('alert', alert))
+
+# Retention: detections older than RETENTION_HOT_DAYS move to one compressed archive file per day
+# (time-range queries still read them); archives older than ARCHIVE_MAX_AGE_DAYS are deleted and
+# only the rollups remain. Runs every RETENTION_INTERVAL_SECONDS in the process that serves requests.
+# A database created before auto_vacuum=INCREMENTAL needs one full VACUUM, which would hold the write
+# lock for minutes next to the detection writer; run that conversion offline, with the service stopped:
+#   RetentionManager(ARCHIVE_FOLDER, convert_to_incremental_vacuum=True).run_once()
+ARCHIVE_FOLDER = 'archive'
+RETENTION_HOT_DAYS = 30
+ARCHIVE_MAX_AGE_DAYS = 365
+RETENTION_INTERVAL_SECONDS = 3600
+retention_manager = RetentionManager(ARCHIVE_FOLDER, hot_days=RETENTION_HOT_DAYS, archive_days=ARCHIVE_MAX_AGE_DAYS,
+                                     convert_to_incremental_vacuum=False)
+
 # --- Initialize Tree Detector ---
 tree_detector = None
 try:
@@ -60,160 +188,317 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def send_image_to_mtl_api(pil_image: Image.Image):
-    """Sends a PIL Image to the MTL API as a Base64 encoded JSON."""
+def encode_jpeg(pil_image: Image.Image) -> bytes:
+    byte_arr = io.BytesIO()
+    pil_image.save(byte_arr, format='JPEG')
+    return byte_arr.getvalue()
+
+def send_image_to_mtl_api(pil_image: Image.Image = None, image_bytes: bytes = None):
+    """
+    Sends an image to the MTL API as a Base64 encoded JSON. Pass image_bytes to reuse
+    a JPEG that was already encoded (e.g. the one also kept in the crop store).
+    """
+    response = None
     try:
-        byte_arr = io.BytesIO()
-        pil_image.save(byte_arr, format='JPEG')
-        image_bytes = byte_arr.getvalue()
+        if image_bytes is None:
+            image_bytes = encode_jpeg(pil_image)
 
         image_base64 = base64.b64encode(image_bytes).decode('utf-8')
 
         json_payload = {"image_base64": image_base64}
         
-        print("Sending image to MTL API as JSON...")
-        response = requests.post(MTL_API_URL, json=json_payload)
+        with stage_timer('mtl_http'):
+            response = requests.post(MTL_API_URL, json=json_payload)
         response.raise_for_status()
         
         predictions = response.json()
-        print(f"Received MTL predictions: {predictions}")
+        hot_path_log('mtl_predictions', f"Received MTL predictions: {predictions}")
         return predictions
     except requests.exceptions.ConnectionError:
-        print(f"ERROR: Could not connect to MTL API at {MTL_API_URL}. Is it running?")
+        mtl_errors_total.inc()
+        hot_path_log('mtl_connection_error', f"ERROR: Could not connect to MTL API at {MTL_API_URL}. Is it running?")
         return None
     except requests.exceptions.RequestException as e:
-        print(f"ERROR: Request to MTL API failed: {e}")
-        if response is not None:
-            print(f"MTL API Response Content: {response.text}")
+        mtl_errors_total.inc()
+        hot_path_log('mtl_request_error', f"ERROR: Request to MTL API failed: {e}"
+                     + (f" MTL API Response Content: {response.text}" if response is not None else ""))
         return None
     except Exception as e:
-        print(f"An unexpected error occurred while sending to MTL API: {e}")
+        mtl_errors_total.inc()
+        hot_path_log('mtl_unexpected_error', f"An unexpected error occurred while sending to MTL API: {e}")
         return None
 
+def get_model_versions() -> dict:
+    """Identifies the models in use so a job's results can be tied to them."""
+    tree_detector_version = None
+    if os.path.exists(YOLO_MODEL_PATH):
+        stat = os.stat(YOLO_MODEL_PATH)
+        tree_detector_version = f"{os.path.basename(YOLO_MODEL_PATH)}:{stat.st_size}:{int(stat.st_mtime)}"
+    return {"tree_detector": tree_detector_version, "mtl": MTL_MODEL_VERSION}
+
+def build_detection(mtl_results: dict, video_name: str, frame_index: int, track_index: int = None,
+                    image_bytes: bytes = None) -> dict:
+    """
+    Turns one MTL prediction into a detection row (not yet stored), queueing its crop for the crop store.
+    track_index is the tree's index in the frame, None for a full-frame detection.
+    """
+    image_capture_path = None
+    if image_bytes is not None:
+        relative_path = crop_store.put(image_bytes)
+        if relative_path is not None:
+            image_capture_path = os.path.join(CROP_STORE_FOLDER, relative_path).replace(os.sep, '/')
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'fruit_type': mtl_results.get('fruit', 'unknown'),
+        'ripeness': mtl_results.get('ripeness', 'unknown'),
+        'disease': mtl_results.get('disease', 'unknown'),
+        'confidence_fruit': mtl_results.get('confidence_fruit', None),
+        'confidence_ripeness': mtl_results.get('confidence_ripeness', None),
+        'confidence_disease': mtl_results.get('confidence_disease', None),
+        'image_capture_path': image_capture_path,
+        'video_name': video_name,
+        'frame_index': frame_index,
+        'track_index': track_index
+    }
+
+def commit_frame(detections: list, job_id: int, processed_frames: int, total_frames: int):
+    """
+    Hands a frame's detections, together with the checkpoint of job_id (frames processed so far
+    and the video's frame count), to the write-behind writer. They are committed in the same
+    transaction, and the stored rows are pushed to event stream subscribers once durable.
+    """
+    def on_commit(inserted_ids):
+        for detection, detection_id in zip(detections, inserted_ids):
+            if detection_id is None:
+                continue  # dropped by the writer
+            detections_stored_total.inc()
+            detection['id'] = detection_id
+            detection['job_id'] = job_id
+            event_broker.publish('detection', detection)
+
+    return detection_writer.submit(detections, job_id=job_id,
+                                   checkpoint=(processed_frames, total_frames),
+                                   on_commit=on_commit)
+
+def current_progress() -> dict:
+    """Snapshot of the monitoring progress, shared by the REST endpoint and the event stream."""
+    progress = {
+        "processed_frames": video_playback_pos,
+        "total_frames": total_video_frames,
+        "is_monitoring_active": is_monitoring_active,
+        "configured_detection_interval": current_detection_interval,
+        "detection_interval": effective_detection_interval(),
+        "adaptive_sampling": ADAPTIVE_SAMPLING_ENABLED
+    }
+    if sampling_controller is not None:
+        progress["sampling"] = sampling_controller.snapshot()
+    return progress
+
+def effective_detection_interval() -> float:
+    """Interval currently used between sampled frames (adaptive if enabled, else the configured one)."""
+    if ADAPTIVE_SAMPLING_ENABLED and sampling_controller is not None:
+        return sampling_controller.interval
+    return current_detection_interval
+
+def new_sampling_controller():
+    return AdaptiveSamplingController(current_detection_interval,
+                                      min_interval=MIN_DETECTION_INTERVAL,
+                                      max_interval=MAX_DETECTION_INTERVAL,
+                                      target_latency=TARGET_DETECTION_LATENCY_SECONDS,
+                                      cpu_budget=DETECTION_CPU_BUDGET)
+
+def video_still_uploading(video_path) -> bool:
+    """True while a chunked upload is still writing to video_path."""
+    upload = get_video_upload_by_path(video_path)
+    return upload is not None and upload['status'] == 'uploading'
+
+def open_video_capture(video_path):
+    """
+    Opens video_path, waiting for more bytes if it is a chunked upload whose
+    container header has not fully arrived yet.
+    """
+    capture = cv2.VideoCapture(video_path)
+    while not capture.isOpened() and is_monitoring_active and video_still_uploading(video_path):
+        capture.release()
+        time.sleep(UPLOAD_WAIT_SECONDS)
+        capture = cv2.VideoCapture(video_path)
+    return capture
+
+def publish_progress():
+    event_broker.publish('progress', current_progress(), coalesce=True)
+
+def start_monitoring_thread():
+    global is_monitoring_active, detection_thread
+    is_monitoring_active = True
+    detection_thread = threading.Thread(target=monitoring_loop, name='monitoring_loop')
+    detection_thread.daemon = True
+    detection_thread.start()
+
 # --- Main Monitoring Logic Thread ---
 def monitoring_loop():
-    global cap, is_monitoring_active, latest_frame, current_video_path, video_playback_pos, total_video_frames, current_detection_interval, enable_tree_detection_global
+    global cap, is_monitoring_active, current_video_path, video_playback_pos, total_video_frames, current_detection_interval, enable_tree_detection_global, sampling_controller
 
-    if not current_video_path:
+    # The job this thread works on. A new job can start while this thread is still finishing a frame,
+    # so its checkpoints and final status use these locals, and it stops once the job is replaced.
+    job_id, video_path = current_job_id, current_video_path
+    if not video_path or not job_id:
         print("ERROR: No video file has been uploaded to start monitoring.")
         is_monitoring_active = False
         return
 
-    if cap and cap.isOpened():
-        cap.release()
+    def is_current():
+        return current_job_id == job_id
 
-    print(f"Attempting to open video file: {current_video_path}")
-    cap = cv2.VideoCapture(current_video_path)
-    if not cap.isOpened():
-        print(f"ERROR: Could not open video file {current_video_path}. Please check file path and format.")
-        is_monitoring_active = False
-        current_video_path = None
+    job = get_monitoring_job(job_id)
+    start_frame = job['last_committed_frame'] if job else 0
+
+    # A previous thread releases its own capture when it exits
+    print(f"Attempting to open video file: {video_path}")
+    capture = cap = open_video_capture(video_path)
+    if not capture.isOpened():
+        print(f"ERROR: Could not open video file {video_path}. Please check file path and format.")
+        if is_current():
+            is_monitoring_active = False
+            current_video_path = None
+        update_job_status(job_id, 'failed')
         return
 
-    total_video_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    print(f"Total video frames: {total_video_frames}")
+    total_frames = total_video_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    print(f"Total video frames: {total_frames}")
 
-    video_playback_pos = 0
-    cap.set(cv2.CAP_PROP_POS_FRAMES, video_playback_pos)
+    # Resume right after the last checkpointed frame; detections up to it are already stored
+    playback_pos = video_playback_pos = start_frame
+    capture.set(cv2.CAP_PROP_POS_FRAMES, playback_pos)
+    update_job_status(job_id, 'running')
+    sampling_controller = new_sampling_controller() if ADAPTIVE_SAMPLING_ENABLED else None
+    detection_interval = effective_detection_interval()
 
     last_detection_time = time.time()
-    print("Monitoring loop started for video file.")
+    last_progress_event_time = 0
+    last_checkpoint_time = time.time()
+    reached_end = False
+    print(f"Monitoring loop started for video file (job {job_id}, resuming at frame {start_frame}).")
     print(f"Tree detection enabled: {enable_tree_detection_global}")
 
-    while is_monitoring_active:
-        ret, frame = cap.read()
+    while is_monitoring_active and is_current():
+        cprofile_capture.tick()
+        with stage_timer('decode'):
+            ret, frame = capture.read()
+        if not ret and video_still_uploading(video_path):
+            # Caught up with a chunked upload; reopen once more bytes have arrived and continue at the same frame
+            time.sleep(UPLOAD_WAIT_SECONDS)
+            capture.release()
+            capture = open_video_capture(video_path)
+            if is_current():
+                cap = capture
+            if capture.isOpened():
+                total_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+                capture.set(cv2.CAP_PROP_POS_FRAMES, playback_pos)
+            continue
+        if not ret and not (is_monitoring_active and is_current()):
+            break  # stopped or replaced while reading (the capture may have been released under us)
         if not ret:
             print("INFO: End of video stream or failed to grab frame. Monitoring loop stopping.")
-            is_monitoring_active = False
+            if is_current():
+                is_monitoring_active = False
+            reached_end = True
             break
 
-        latest_frame = frame
-        video_playback_pos += 1
+        frame_broadcaster.publish(frame)
+        playback_pos += 1
+        if is_current():
+            video_playback_pos, total_video_frames = playback_pos, total_frames
+        frames_read_total.inc()
 
         current_time = time.time()
-        if current_time - last_detection_time >= current_detection_interval:
+        if current_time - last_progress_event_time >= PROGRESS_EVENT_INTERVAL:
+            last_progress_event_time = current_time
+            publish_progress()
+
+        if current_time - last_detection_time >= detection_interval:
             last_detection_time = current_time
-            print(f"Processing frame {video_playback_pos} for detection at {datetime.now().strftime('%H:%M:%S')}")
+            processing_start = time.perf_counter()
+            frame_detections = []
+            frames_sampled_total.inc()
+            hot_path_log('processing_frame', f"Processing frame {playback_pos} for detection at {datetime.now().strftime('%H:%M:%S')}")
 
             if enable_tree_detection_global and tree_detector: # Tree detection enabled and detector loaded
                 try:
                     cropped_tree_images = tree_detector.detect_trees(frame)
 
+                    crops_total.inc(len(cropped_tree_images))
                     if cropped_tree_images:
-                        print(f"Detected {len(cropped_tree_images)} trees. Sending to MTL API...")
+                        hot_path_log('trees_detected', f"Detected {len(cropped_tree_images)} trees. Sending to MTL API...")
                         for i, tree_img_pil in enumerate(cropped_tree_images):
-                            mtl_results = send_image_to_mtl_api(tree_img_pil)
+                            image_bytes = encode_jpeg(tree_img_pil)
+                            mtl_results = send_image_to_mtl_api(image_bytes=image_bytes)
                             
                             if mtl_results:
-                                fruit_type = mtl_results.get('fruit', 'unknown')
-                                ripeness = mtl_results.get('ripeness', 'unknown')
-                                disease = mtl_results.get('disease', 'unknown')
-                                confidence_fruit = mtl_results.get('confidence_fruit', None)
-                                confidence_ripeness = mtl_results.get('confidence_ripeness', None)
-                                confidence_disease = mtl_results.get('confidence_disease', None)
-                                
-                                insert_detection(
-                                    fruit_type=fruit_type,
-                                    ripeness=ripeness,
-                                    disease=disease,
-                                    confidence_fruit=confidence_fruit,
-                                    confidence_ripeness=confidence_ripeness,
-                                    confidence_disease=confidence_disease,
-                                    notes=f"Detection from video stream: {os.path.basename(current_video_path)} (Frame {video_playback_pos}, Tree {i+1}) - Tree detection ON"
+                                detection = build_detection(
+                                    mtl_results,
+                                    os.path.basename(video_path), playback_pos - 1, track_index=i,
+                                    image_bytes=image_bytes
                                 )
-                                print(f"Stored detection: {fruit_type}, {ripeness}, {disease}")
+                                frame_detections.append(detection)
+                                hot_path_log('detection', f"Detection: {detection['fruit_type']}, {detection['ripeness']}, {detection['disease']}")
                             else:
-                                print(f"MTL API did not return valid results for tree {i+1}.")
+                                hot_path_log('mtl_no_results', f"MTL API did not return valid results for tree {i+1}.")
                     else:
-                        print(f"No trees detected in frame {video_playback_pos}.")
+                        hot_path_log('no_trees', f"No trees detected in frame {playback_pos}.")
                 except Exception as e:
-                    print(f"ERROR: Error during tree detection or MTL processing: {e}")
+                    hot_path_log('detection_error', f"ERROR: Error during tree detection or MTL processing: {e}")
             elif not enable_tree_detection_global: # Tree detection NOT enabled, send full frame
-                print("Tree detection is OFF. Sending full frame to MTL API...")
+                hot_path_log('full_frame', "Tree detection is OFF. Sending full frame to MTL API...")
                 if frame is not None:
                     try:
                         pil_img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-                        mtl_results = send_image_to_mtl_api(pil_img)
+                        image_bytes = encode_jpeg(pil_img)
+                        mtl_results = send_image_to_mtl_api(image_bytes=image_bytes)
 
                         if mtl_results:
-                            fruit_type = mtl_results.get('fruit', 'unknown')
-                            ripeness = mtl_results.get('ripeness', 'unknown')
-                            disease = mtl_results.get('disease', 'unknown')
-                            confidence_fruit = mtl_results.get('confidence_fruit', None)
-                            confidence_ripeness = mtl_results.get('confidence_ripeness', None)
-                            confidence_disease = mtl_results.get('confidence_disease', None)
-
-                            insert_detection(
-                                fruit_type=fruit_type,
-                                ripeness=ripeness,
-                                disease=disease,
-                                confidence_fruit=confidence_fruit,
-                                confidence_ripeness=confidence_ripeness,
-                                confidence_disease=confidence_disease,
-                                notes=f"Detection from video stream: {os.path.basename(current_video_path)} (Frame {video_playback_pos}) - Tree detection OFF (Full frame)"
+                            detection = build_detection(
+                                mtl_results,
+                                os.path.basename(video_path), playback_pos - 1,
+                                image_bytes=image_bytes
                             )
-                            print(f"Stored full frame detection: {fruit_type}, {ripeness}, {disease}")
+                            frame_detections.append(detection)
+                            hot_path_log('detection', f"Full frame detection: {detection['fruit_type']}, {detection['ripeness']}, {detection['disease']}")
                         else:
-                            print("MTL API did not return valid results for full frame.")
+                            hot_path_log('mtl_no_results', "MTL API did not return valid results for full frame.")
                     except Exception as e:
-                        print(f"ERROR: Error converting frame or sending full frame to MTL API: {e}")
+                        hot_path_log('detection_error', f"ERROR: Error converting frame or sending full frame to MTL API: {e}")
                 else:
-                    print("WARNING: Frame is None, cannot send to MTL API.")
+                    hot_path_log('frame_none', "WARNING: Frame is None, cannot send to MTL API.")
             else: # tree_detector is None
-                print("Tree detector not initialized. Skipping detection (even if enabled).")
+                hot_path_log('no_detector', "Tree detector not initialized. Skipping detection (even if enabled).")
+
+            commit_frame(frame_detections, job_id, playback_pos, total_frames)
+            last_checkpoint_time = time.time()
+            if sampling_controller is not None:
+                detection_interval = sampling_controller.observe(time.perf_counter() - processing_start)
+        elif current_time - last_checkpoint_time >= CHECKPOINT_INTERVAL_SECONDS:
+            commit_frame([], job_id, playback_pos, total_frames)
+            last_checkpoint_time = current_time
         
         time.sleep(0.01)
 
     print("Monitoring loop stopped for video file.")
-    if cap:
-        cap.release()
+    cprofile_capture.release()
+    commit_frame([], job_id, playback_pos, total_frames)
+    # The final checkpoint must be durable before the job is marked finished
+    if not detection_writer.flush(timeout=DETECTION_WRITE_FLUSH_TIMEOUT):
+        print(f"WARNING: Detections of job {job_id} were not committed within {DETECTION_WRITE_FLUSH_TIMEOUT} s.")
+    update_job_status(job_id, 'completed' if reached_end else 'stopped')
+    capture.release()
+    if is_current():
         cap = None
+        publish_progress()
 
 # --- Flask API Endpoints ---
 
 @app.route('/upload_video', methods=['POST'])
 def upload_video():
-    global current_video_path, is_monitoring_active, detection_thread, current_detection_interval, enable_tree_detection_global
+    global current_detection_interval, enable_tree_detection_global
 
     if 'video' not in request.files:
         return jsonify({"error": "No video file part in the request"}), 400
@@ -237,36 +522,183 @@ def upload_video():
     if file and allowed_file(file.filename):
         filename = secure_filename(str(uuid.uuid4()) + os.path.splitext(file.filename)[1])
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        
-        current_video_path = filepath
+        content_hash = save_stream_with_hash(file.stream, filepath)
+        fingerprint = fingerprint_video(filepath, content_hash, FINGERPRINT_PREFIX_BYTES)
+        job_id, linked_job_id = process_or_link_video(filepath, file.filename, fingerprint)
+        if linked_job_id:
+            return jsonify({"status": f"Video '{file.filename}' was already processed with the same models and settings. Reusing the detections of job {linked_job_id}.",
+                            "job_id": job_id,
+                            "linked_job_id": linked_job_id}), 200
         
-        if is_monitoring_active:
-            is_monitoring_active = False
-            if detection_thread and detection_thread.is_alive():
-                detection_thread.join(timeout=2)
-                print("Old monitoring thread stopped.")
-
-        is_monitoring_active = True
-        detection_thread = threading.Thread(target=monitoring_loop)
-        detection_thread.daemon = True
-        detection_thread.start()
-        
-        return jsonify({"status": f"Video '{file.filename}' uploaded and monitoring started with {current_detection_interval}s interval. Tree detection: {'ON' if enable_tree_detection_global else 'OFF'}."}), 200
+        return jsonify({"status": f"Video '{file.filename}' uploaded and monitoring started with {current_detection_interval}s interval. Tree detection: {'ON' if enable_tree_detection_global else 'OFF'}.",
+                        "job_id": job_id}), 200
     else:
         return jsonify({"error": "Invalid file type. Allowed types are: " + ', '.join(ALLOWED_EXTENSIONS)}), 400
 
+def begin_monitoring_job(video_path, source_name):
+    """Stops any running monitoring, registers a job for video_path and starts processing it."""
+    global current_video_path, current_job_id, is_monitoring_active
+    if is_monitoring_active:
+        is_monitoring_active = False
+        if detection_thread and detection_thread.is_alive():
+            detection_thread.join(timeout=2)
+            print("Old monitoring thread stopped.")
+
+    current_video_path = video_path
+    current_job_id = create_monitoring_job(video_path, current_detection_interval, enable_tree_detection_global,
+                                           model_versions=get_model_versions(), source_name=source_name)
+    start_monitoring_thread()
+    return current_job_id
+
+def find_reusable_job(fingerprint):
+    """Returns the id of a completed job that processed the same video with the current models and sampling config."""
+    candidates = get_reusable_fingerprints(get_model_versions(), current_detection_interval, enable_tree_detection_global,
+                                           content_hash=fingerprint['content_hash'],
+                                           total_size=fingerprint['total_size'],
+                                           frame_count=fingerprint['frame_count'])
+    for candidate in candidates:
+        if fingerprints_match(fingerprint, candidate, FINGERPRINT_MAX_HAMMING_DISTANCE):
+            return candidate['job_id']
+    return None
+
+def prefix_may_match_processed_video(video_path, total_size):
+    """True if an already processed video of the same size starts with the same bytes as this (partial) upload."""
+    prefix_hash = compute_prefix_hash(video_path, FINGERPRINT_PREFIX_BYTES)
+    candidates = get_reusable_fingerprints(get_model_versions(), current_detection_interval, enable_tree_detection_global,
+                                           total_size=total_size)
+    return any(candidate['prefix_hash'] == prefix_hash for candidate in candidates)
+
+def process_or_link_video(video_path, source_name, fingerprint):
+    """
+    Links the video to an earlier job's detections if its fingerprint matches one,
+    otherwise starts monitoring it. Returns (job_id, linked_job_id or None).
+    """
+    previous_job_id = find_reusable_job(fingerprint)
+    if previous_job_id:
+        job_id = create_monitoring_job(video_path, current_detection_interval, enable_tree_detection_global,
+                                       model_versions=get_model_versions(), source_name=source_name,
+                                       linked_job_id=previous_job_id)
+        print(f"Video '{source_name}' matches job {previous_job_id}; linked its detections to job {job_id} instead of reprocessing.")
+        return job_id, previous_job_id
+    job_id = begin_monitoring_job(video_path, source_name)
+    insert_video_fingerprint(job_id, fingerprint)
+    return job_id, None
+
+def upload_response(upload):
+    return {
+        "upload_id": upload['upload_id'],
+        "offset": upload['received_bytes'],
+        "total_size": upload['total_size'],
+        "status": upload['status'],
+        "sha256": upload['sha256'],
+        "job_id": upload['job_id'],
+        "waiting_for_fingerprint": upload['job_id'] is None and upload['received_bytes'] >= STREAMING_START_BYTES
+    }
+
+@app.route('/upload_video/chunked', methods=['POST'])
+def create_chunked_upload():
+    """
+    Starts a resumable upload. JSON body: filename, total_size, optional sha256,
+    detectionInterval and enableTreeDetection. Chunks are then sent with
+    PUT /upload_video/chunked/<upload_id>?offset=N (raw bytes as the request body).
+    """
+    data = request.get_json(silent=True) or {}
+    filename = data.get('filename', '')
+    if not filename or not allowed_file(filename):
+        return jsonify({"error": "Invalid file type. Allowed types are: " + ', '.join(ALLOWED_EXTENSIONS)}), 400
+    try:
+        total_size = int(data.get('total_size', 0))
+    except (TypeError, ValueError):
+        return jsonify({"error": "'total_size' must be an integer number of bytes."}), 400
+
+    try:
+        detection_interval = int(data.get('detectionInterval', 5))
+        if detection_interval <= 0:
+            detection_interval = 5
+    except (TypeError, ValueError):
+        detection_interval = 5
+    enable_tree_detection = str(data.get('enableTreeDetection', 'true')).lower() == 'true'
+
+    try:
+        upload = upload_manager.create(secure_filename(filename) or filename, total_size, data.get('sha256'),
+                                       detection_interval=detection_interval,
+                                       enable_tree_detection=enable_tree_detection)
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    return jsonify(upload_response(upload)), 201
+
+@app.route('/upload_video/chunked/<upload_id>', methods=['GET'])
+def get_chunked_upload(upload_id):
+    """Returns the committed offset of an upload so an interrupted client knows where to resume."""
+    try:
+        return jsonify(upload_response(upload_manager.status(upload_id)))
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status_code
+
+@app.route('/upload_video/chunked/<upload_id>', methods=['PUT'])
+def put_upload_chunk(upload_id):
+    """
+    Appends one chunk. The offset (query parameter or Upload-Offset header) must equal the
+    committed offset; on mismatch a 409 response carries the offset to resume from.
+    Monitoring starts as soon as STREAMING_START_BYTES have arrived.
+    """
+    global current_detection_interval, enable_tree_detection_global, is_monitoring_active
+    offset_str = request.args.get('offset') or request.headers.get('Upload-Offset')
+    try:
+        offset = int(offset_str)
+    except (TypeError, ValueError):
+        return jsonify({"error": "An integer 'offset' is required."}), 400
+
+    try:
+        upload = upload_manager.append(upload_id, offset, request.stream)
+    except UploadError as e:
+        body = {"error": str(e)}
+        if e.upload:
+            body.update(upload_response(e.upload))
+        return jsonify(body), e.status_code
+
+    if upload['status'] == 'failed':
+        print(f"ERROR: Checksum mismatch for upload {upload_id}; expected {upload['expected_sha256']}, got {upload['sha256']}.")
+        if upload['job_id'] and upload['job_id'] == current_job_id:
+            is_monitoring_active = False
+        return jsonify({"error": "Checksum mismatch; the upload must be restarted.", **upload_response(upload)}), 422
+
+    complete = upload['status'] == 'complete'
+    if upload['job_id'] is None and (upload['received_bytes'] >= STREAMING_START_BYTES or complete):
+        current_detection_interval = upload['detection_interval'] or current_detection_interval
+        enable_tree_detection_global = bool(upload['enable_tree_detection'])
+        job_id = None
+        if complete:
+            fingerprint = fingerprint_video(upload['stored_path'], upload['sha256'], FINGERPRINT_PREFIX_BYTES)
+            job_id, _ = process_or_link_video(upload['stored_path'], upload['filename'], fingerprint)
+        elif not prefix_may_match_processed_video(upload['stored_path'], upload['total_size']):
+            job_id = begin_monitoring_job(upload['stored_path'], upload['filename'])
+        # Otherwise wait for the full upload: it may be a re-upload whose results can be reused
+        if job_id:
+            set_video_upload_job(upload_id, job_id)
+            upload['job_id'] = job_id
+    elif complete:
+        # Processing started on the prefix; fingerprint the finished video for future re-uploads
+        insert_video_fingerprint(upload['job_id'],
+                                 fingerprint_video(upload['stored_path'], upload['sha256'], FINGERPRINT_PREFIX_BYTES))
+
+    return jsonify(upload_response(upload))
+
 @app.route('/start_monitoring', methods=['POST'])
 def start_monitoring():
-    global is_monitoring_active, detection_thread
+    global current_job_id
     if not current_video_path:
         return jsonify({"error": "No video uploaded. Please upload a video first."}), 400
 
     if not is_monitoring_active:
-        is_monitoring_active = True
-        detection_thread = threading.Thread(target=monitoring_loop)
-        detection_thread.daemon = True
-        detection_thread.start()
+        job = get_monitoring_job(current_job_id) if current_job_id else None
+        if job is None or job['status'] in ('completed', 'failed'):
+            # Finished jobs are re-run as a new job; stopped ones resume from their checkpoint
+            current_job_id = create_monitoring_job(current_video_path, current_detection_interval,
+                                                   enable_tree_detection_global,
+                                                   model_versions=get_model_versions(),
+                                                   source_name=os.path.basename(current_video_path))
+        start_monitoring_thread()
         return jsonify({"status": "Monitoring started for uploaded video."})
     return jsonify({"status": "Monitoring already active."})
 
@@ -288,18 +720,57 @@ def stop_monitoring():
 @app.route('/video_feed')
 def video_feed():
     """Streams the live video feed (from uploaded video) as MJPEG."""
-    def generate_frames():
-        global latest_frame
-        while True:
-            if latest_frame is not None:
-                ret, buffer = cv2.imencode('.jpg', latest_frame)
-                if not ret:
-                    continue
-                frame_bytes = buffer.tobytes()
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-            time.sleep(0.03)
-    return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return Response(frame_broadcaster.frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@app.route('/api/crops/<key>', methods=['GET'])
+def get_crop(key):
+    """
+    Serves a stored crop by its SHA-256 key (the file name in image_capture_path).
+    GET /api/crops/<key>?thumbnail=1 returns the thumbnail instead.
+    Crops are immutable, so responses are cacheable indefinitely and revalidate by ETag.
+    """
+    key = key.rsplit('.', 1)[0].lower()
+    if not CropStore.is_valid_key(key):
+        return jsonify({"error": "Invalid crop key"}), 400
+    thumbnail = request.args.get('thumbnail', '0').lower() in ('1', 'true')
+    etag = f'"{key}{"-thumb" if thumbnail else ""}"'
+    headers = {'ETag': etag, 'Cache-Control': 'public, max-age=31536000, immutable'}
+    if etag in request.headers.get('If-None-Match', ''):
+        return Response(status=304, headers=headers)
+    data = crop_store.get(key, thumbnail=thumbnail)
+    if data is None:
+        return jsonify({"error": "Crop not found"}), 404
+    return Response(data, mimetype='image/jpeg', headers=headers)
+
+def json_response(payload, status: int = 200):
+    """
+    jsonify for detection listings: rows come from the database as dicts (row factory, confidences
+    coerced in SQL) and are encoded by utils.serialization (orjson when installed) without sorting keys.
+    """
+    return Response(dumps(payload), status=status, mimetype='application/json')
+
+@app.route('/api/monitoring/jobs/<int:job_id>', methods=['GET'])
+def get_job_endpoint(job_id):
+    """Returns a monitoring job, including its checkpoint and the job it reuses results from (if any)."""
+    job = get_monitoring_job(job_id)
+    if job is None:
+        return jsonify({"error": f"Job {job_id} not found"}), 404
+    return jsonify(job)
+
+@app.route('/api/monitoring/jobs/<int:job_id>/detections', methods=['GET'])
+def get_job_detections_endpoint(job_id):
+    """Returns the detections of a job; linked jobs return the detections of the job they reuse."""
+    try:
+        return json_response(get_detections_for_job(job_id, as_dicts=True))
+    except Exception as e:
+        print(f"Error fetching detections for job {job_id}: {e}")
+        return jsonify({"error": "Failed to fetch job detections"}), 500
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics: per-stage latency histograms and pipeline counters."""
+    stream_subscribers_gauge.set(frame_broadcaster.subscriber_count)
+    return Response(REGISTRY.render(), mimetype=PROMETHEUS_CONTENT_TYPE)
 
 @app.route('/api/monitoring/status', methods=['GET'])
 def get_monitoring_status():
@@ -311,44 +782,112 @@ def get_monitoring_status():
     return jsonify({
         "monitoring_status": status_message,
         "current_video_file": video_filename,
-        "is_active": is_monitoring_active
+        "current_job_id": current_job_id,
+        "is_active": is_monitoring_active,
+        "stream_subscribers": frame_broadcaster.subscriber_count
     })
 
+def encode_page_cursor(key) -> str:
+    return f"{key[0]}_{key[1]}" if key else None
+
+def decode_page_cursor(cursor: str):
+    """Parses a cursor produced by encode_page_cursor; raises ValueError if malformed."""
+    epoch_ms, detection_id = cursor.split('_')
+    return int(epoch_ms), int(detection_id)
+
+def detections_etag(latest_id: int) -> str:
+    """
+    Validator for detection listings: the newest id plus the query, so a poll only has to compare
+    it against If-None-Match (one primary key lookup) to learn that nothing was added.
+    """
+    args = '&'.join(f"{key}={value}" for key, value in sorted(request.args.items(multi=True)))
+    return f"{latest_id}-{hashlib.sha1(f'{request.path}?{args}'.encode()).hexdigest()[:16]}"
+
+def not_modified(etag: str, latest_id: int):
+    """Returns a 304 response if the client already has this version, else None."""
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        response.headers['X-Latest-Id'] = str(latest_id)
+        return response
+    return None
+
+def with_validators(response, etag: str, latest_id: int):
+    response.set_etag(etag, weak=True)
+    response.headers['X-Latest-Id'] = str(latest_id)
+    response.headers['Cache-Control'] = 'no-cache' # always revalidate, which is cheap
+    return response
+
 @app.route('/api/monitoring/detections', methods=['GET'])
 def get_monitoring_detections():
     """
-    Fetches detections from the database, with an optional limit.
-    GET /api/monitoring/detections?limit=X
+    Fetches one page of detections, newest first.
+    GET /api/monitoring/detections?limit=X&cursor=C&fields=timestamp,disease,...
+    The body is the list of detections; if more rows exist, the X-Next-Cursor header (and a
+    Link rel="next" header) holds the cursor of the following page. limit defaults to
+    DETECTIONS_DEFAULT_PAGE_SIZE and is capped at DETECTIONS_MAX_PAGE_SIZE.
+
+    Pollers can ask only for what is new with since_id=<id> or since_time=<ISO 8601>; those rows come
+    oldest first (X-Next-Cursor is then the since_id for the rest). Every response carries an ETag and
+    X-Latest-Id, and a request whose If-None-Match still matches gets an empty 304.
     """
     limit_str = request.args.get('limit')
-    limit = None
+    limit = DETECTIONS_DEFAULT_PAGE_SIZE
     if limit_str and limit_str.lower() != 'all':
         try:
             limit = int(limit_str)
             if limit <= 0:
-                limit = None
+                limit = DETECTIONS_DEFAULT_PAGE_SIZE
         except ValueError:
-            limit = None
-    
+            limit = DETECTIONS_DEFAULT_PAGE_SIZE
+    limit = min(limit, DETECTIONS_MAX_PAGE_SIZE)
+
+    before = since_id = since_epoch_ms = None
     try:
-        detections = get_all_detections(limit=limit) 
-        
-        column_names = ['id', 'timestamp', 'fruit_type', 'ripeness', 'disease', 
-                        'confidence_fruit', 'confidence_ripeness', 'confidence_disease', 
-                        'image_capture_path', 'notes'] 
-        
-        detections_dicts = []
-        for row in detections:
-            detection_dict = dict(zip(column_names, row))
-            for key in ['confidence_fruit', 'confidence_ripeness', 'confidence_disease']:
-                if detection_dict[key] is not None:
-                    try:
-                        detection_dict[key] = float(detection_dict[key])
-                    except ValueError:
-                        detection_dict[key] = None
-            detections_dicts.append(detection_dict)
-        
-        return jsonify(detections_dicts)
+        if request.args.get('cursor'):
+            before = decode_page_cursor(request.args['cursor'])
+        if request.args.get('since_id'):
+            since_id = int(request.args['since_id'])
+        elif request.args.get('since_time'):
+            since_epoch_ms = to_epoch_ms(request.args['since_time'])
+    except ValueError:
+        return jsonify({"error": "Invalid 'cursor', 'since_id' or 'since_time' parameter."}), 400
+    delta = since_id is not None or since_epoch_ms is not None
+    if delta and before is not None:
+        return jsonify({"error": "'cursor' cannot be combined with 'since_id' or 'since_time'."}), 400
+    fields = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip()] or None
+
+    try:
+        latest_id = get_latest_detection_id()
+        etag = detections_etag(latest_id)
+        cached = not_modified(etag, latest_id)
+        if cached is not None:
+            return cached
+        if since_id is not None and since_id >= latest_id:
+            return with_validators(json_response([]), etag, latest_id) # nothing new, no query needed
+
+        next_cursor = None
+        if delta:
+            detections, next_id = get_detections_since(limit, since_id=since_id, since_epoch_ms=since_epoch_ms,
+                                                       fields=fields, as_dicts=True)
+        else:
+            detections, next_key = get_detections_page(limit, before=before, fields=fields, as_dicts=True)
+            next_cursor = encode_page_cursor(next_key)
+
+        response = json_response(detections)
+        next_args = request.args.to_dict()
+        if delta and next_id is not None:
+            next_cursor = str(next_id)
+            next_args.pop('since_time', None)
+            next_args.update(since_id=next_cursor, limit=limit)
+        elif next_cursor:
+            next_args.update(cursor=next_cursor, limit=limit)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+            response.headers['Link'] = f'<{request.base_url}?{urlencode(next_args)}>; rel="next"'
+        return with_validators(response, etag, latest_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print(f"Error fetching detections for chatbot: {e}")
         return jsonify({"error": "Failed to fetch monitoring detections"}), 500
@@ -359,6 +898,7 @@ def get_monitoring_detections_in_range():
     Fetches detections from the database within a specified time range.
     Requires 'start_time' and 'end_time' query parameters in ISO 8601 format.
     GET /api/monitoring/detections_in_range?start_time=YYYY-MM-DDTHH:MM:SS&end_time=YYYY-MM-DDTHH:MM:SS
+    Supports If-None-Match like /api/monitoring/detections.
     """
     start_time_str = request.args.get('start_time')
     end_time_str = request.args.get('end_time')
@@ -367,60 +907,168 @@ def get_monitoring_detections_in_range():
         return jsonify({"error": "Both 'start_time' and 'end_time' query parameters are required."}), 400
 
     try:
-        detections = get_detections_in_time_range(start_time_str, end_time_str)
-        
-        column_names = ['id', 'timestamp', 'fruit_type', 'ripeness', 'disease', 
-                        'confidence_fruit', 'confidence_ripeness', 'confidence_disease', 
-                        'image_capture_path', 'notes'] 
-        
-        detections_dicts = []
-        for row in detections:
-            detection_dict = dict(zip(column_names, row))
-            for key in ['confidence_fruit', 'confidence_ripeness', 'confidence_disease']:
-                if detection_dict[key] is not None:
-                    try:
-                        detection_dict[key] = float(detection_dict[key])
-                    except ValueError:
-                        detection_dict[key] = None
-            detections_dicts.append(detection_dict)
-        
-        return jsonify(detections_dicts)
+        latest_id = get_latest_detection_id()
+        etag = detections_etag(latest_id)
+        cached = not_modified(etag, latest_id)
+        if cached is not None:
+            return cached
+        detections = get_detections_in_time_range(start_time_str, end_time_str, as_dicts=True)
+        return with_validators(json_response(detections), etag, latest_id)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid 'start_time' or 'end_time' (expected ISO 8601): {e}"}), 400
     except Exception as e:
         print(f"Error fetching detections in time range: {e}")
         return jsonify({"error": f"Failed to fetch detections in time range: {e}"}), 500
 
+@app.route('/api/monitoring/detections/export', methods=['GET'])
+def export_detections():
+    """
+    Streams detections as a download, oldest first, without building the result in memory.
+    GET /api/monitoring/detections/export?format=ndjson|csv|parquet&start_time=...&end_time=...&fields=...
+    All parameters are optional (default: every column of every detection as NDJSON). Archived
+    days are included when the window reaches them. Parquet needs pyarrow.
+    """
+    export_format = request.args.get('format', 'ndjson').lower()
+    fields = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip()] or None
+    try:
+        start_ms = to_epoch_ms(request.args['start_time']) if request.args.get('start_time') else None
+        end_ms = to_epoch_ms(request.args['end_time']) if request.args.get('end_time') else None
+        columns = fields or list(DETECTION_COLUMNS)
+        chunk_size = EXPORT_PARQUET_ROW_GROUP if export_format == 'parquet' else EXPORT_CHUNK_ROWS
+        chunks = iter_detection_chunks(start_ms, end_ms, fields=fields, chunk_size=chunk_size)
+        body = stream_export(chunks, columns, export_format)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    filename = f"detections_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@app.route('/api/monitoring/detections/search', methods=['GET'])
+def search_detections_endpoint():
+    """
+    Full-text search over labels, video names and notes, best matches first.
+    GET /api/monitoring/detections/search?q=black rot in orchard_3.mp4 last week&limit=X&offset=N&fields=...
+    A time phrase in q ('last week', 'past 3 days', 'yesterday', 'since 2024-05-01', ...) becomes
+    the window; explicit start_time/end_time (ISO 8601) take precedence. The remaining words must
+    all match, as prefixes. next_offset is the offset of the following page (null on the last one).
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "The 'q' query parameter is required."}), 400
+    limit = min(request.args.get('limit', SEARCH_DEFAULT_PAGE_SIZE, type=int) or SEARCH_DEFAULT_PAGE_SIZE,
+                DETECTIONS_MAX_PAGE_SIZE)
+    offset = max(request.args.get('offset', 0, type=int) or 0, 0)
+    fields = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip()] or None
+
+    parsed = parse_search_query(query)
+    try:
+        start_time = request.args.get('start_time') or (parsed['start'] and parsed['start'].isoformat())
+        end_time = request.args.get('end_time') or (parsed['end'] and parsed['end'].isoformat())
+        if parsed['match'] is None and start_time is None and end_time is None:
+            return jsonify({"error": "Nothing to search for in 'q'."}), 400
+        rows, has_more = search_detections(parsed['match'], to_epoch_ms(start_time), to_epoch_ms(end_time),
+                                           limit=max(limit, 1), offset=offset, fields=fields, as_dicts=True)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error searching detections: {e}")
+        return jsonify({"error": "Failed to search detections"}), 500
+
+    return json_response({
+        "query": query,
+        "match": parsed['match'],
+        "start_time": start_time,
+        "end_time": end_time,
+        "results": rows,
+        "next_offset": offset + len(rows) if has_more else None
+    })
+
+def aggregate_window():
+    """Optional start_time/end_time (ISO 8601) query parameters of the aggregate endpoints."""
+    return request.args.get('start_time'), request.args.get('end_time')
+
 @app.route('/api/monitoring/total_detections', methods=['GET'])
 def get_total_detections_endpoint():
-    """Returns the total number of detections."""
+    """
+    Returns the total number of detections, read from the rollup tables.
+    Optional ?start_time=...&end_time=... limit it to a window (resolved to whole hours).
+    """
     try:
-        total_count = get_total_detections()
+        total_count = get_total_detections(*aggregate_window())
         return jsonify({"total_detections": total_count})
+    except ValueError as e:
+        return jsonify({"error": f"Invalid 'start_time' or 'end_time' (expected ISO 8601): {e}"}), 400
     except Exception as e:
         print(f"Error fetching total detections: {e}")
         return jsonify({"error": "Failed to fetch total detections"}), 500
 
 @app.route('/api/monitoring/detections_by_fruit', methods=['GET'])
 def get_detections_by_fruit_endpoint():
-    """Returns detection counts grouped by fruit type."""
+    """Returns detection counts grouped by fruit type (optionally within ?start_time=...&end_time=...)."""
     try:
-        fruit_counts = get_detection_counts_by_fruit()
+        fruit_counts = get_detection_counts_by_fruit(*aggregate_window())
         result = [{'fruit_type': row[0], 'count': row[1]} for row in fruit_counts]
         return jsonify(result)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid 'start_time' or 'end_time' (expected ISO 8601): {e}"}), 400
     except Exception as e:
         print(f"Error fetching detections by fruit: {e}")
         return jsonify({"error": "Failed to fetch detections by fruit"}), 500
 
 @app.route('/api/monitoring/detections_by_disease', methods=['GET'])
 def get_detections_by_disease_endpoint():
-    """Returns detection counts grouped by disease type."""
+    """Returns detection counts grouped by disease type (optionally within ?start_time=...&end_time=...)."""
     try:
-        disease_counts = get_detection_counts_by_disease()
+        disease_counts = get_detection_counts_by_disease(*aggregate_window())
         result = [{'disease': row[0], 'count': row[1]} for row in disease_counts]
         return jsonify(result)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid 'start_time' or 'end_time' (expected ISO 8601): {e}"}), 400
     except Exception as e:
         print(f"Error fetching detections by disease: {e}")
         return jsonify({"error": "Failed to fetch detections by disease"}), 500
 
+@app.route('/api/monitoring/trends', methods=['GET'])
+def get_detection_trend_endpoint():
+    """
+    Counts and mean confidences per time bucket, for charts and "how is X trending" questions.
+    GET /api/monitoring/trends?interval=minute|hour|day&group_by=fruit_type|disease|ripeness
+                              &disease=scab&fruit_type=...&ripeness=...&start_time=...&end_time=...
+    interval defaults to 'hour'; end_time to now and start_time to TREND_DEFAULT_SPANS[interval]
+    before it. The label filters keep labels containing the given text (case-insensitive).
+    Buckets without detections are omitted.
+    """
+    interval = request.args.get('interval', 'hour').lower()
+    group_by = request.args.get('group_by') or None
+    filters = {column: request.args.get(column) for column in ('fruit_type', 'disease', 'ripeness')}
+    try:
+        end = datetime.fromisoformat(request.args['end_time']) if request.args.get('end_time') else datetime.now()
+        if request.args.get('start_time'):
+            start = datetime.fromisoformat(request.args['start_time'])
+        elif interval in TREND_DEFAULT_SPANS:
+            start = end - TREND_DEFAULT_SPANS[interval]
+        else:
+            start = end
+        rows = get_detection_trend(interval, start.isoformat(), end.isoformat(), group_by=group_by, filters=filters)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error computing detection trend: {e}")
+        return jsonify({"error": "Failed to compute detection trend"}), 500
+
+    buckets = [{
+        'bucket_start': datetime.fromtimestamp(bucket / 1000).isoformat(),
+        'label': label,
+        'count': count,
+        'mean_confidence_fruit': mean_fruit,
+        'mean_confidence_ripeness': mean_ripeness,
+        'mean_confidence_disease': mean_disease
+    } for bucket, label, count, mean_fruit, mean_ripeness, mean_disease in rows]
+    return jsonify({'interval': interval, 'group_by': group_by, 'start_time': start.isoformat(),
+                    'end_time': end.isoformat(), 'buckets': buckets})
+
 
 @app.route('/api/monitoring/progress', methods=['GET'])
 def get_monitoring_progress():
@@ -429,15 +1077,96 @@ def get_monitoring_progress():
     if not current_video_path or not cap or not cap.isOpened():
         video_playback_pos = 0
         total_video_frames = 0
-        is_monitoring_active_status = False
+        progress = current_progress()
+        progress["is_monitoring_active"] = False
     else:
-        is_monitoring_active_status = is_monitoring_active
+        progress = current_progress()
         
-    return jsonify({
-        "processed_frames": video_playback_pos,
-        "total_frames": total_video_frames,
-        "is_monitoring_active": is_monitoring_active_status
-    })
+    return jsonify(progress)
+
+@app.route('/api/monitoring/alerts/rules', methods=['GET'])
+def list_alert_rules():
+    """Returns all disease alert rules."""
+    return jsonify(get_alert_rules())
+
+@app.route('/api/monitoring/alerts/rules', methods=['POST'])
+def add_alert_rule():
+    """
+    Adds a disease alert rule: fire when at least min_count non-healthy detections of disease arrive
+    within window_minutes in video_name.
+    POST /api/monitoring/alerts/rules
+    {"min_count": 5, "window_minutes": 10, "disease": "Apple___Apple_scab", "video_name": "orchard_3.mp4",
+     "name": "Scab outbreak", "webhook_url": "https://..."}
+    Only min_count and window_minutes are required; without disease any disease counts, without
+    video_name the rule applies to every video.
+    """
+    body = request.get_json(silent=True) or {}
+    if body.get('min_count') is None or body.get('window_minutes') is None:
+        return jsonify({"error": "'min_count' and 'window_minutes' are required."}), 400
+    try:
+        rule = create_alert_rule(body['min_count'], body['window_minutes'], disease=body.get('disease') or None,
+                                 video_name=body.get('video_name') or None, name=body.get('name'),
+                                 webhook_url=body.get('webhook_url') or None)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(rule), 201
+
+@app.route('/api/monitoring/alerts/rules/<int:rule_id>', methods=['DELETE'])
+def remove_alert_rule(rule_id):
+    if not delete_alert_rule(rule_id):
+        return jsonify({"error": f"Alert rule {rule_id} not found"}), 404
+    return jsonify({"status": f"Alert rule {rule_id} deleted."})
+
+@app.route('/api/monitoring/alerts', methods=['GET'])
+def list_recent_alerts():
+    """
+    Alerts fired by this process since it started, newest first (they are also pushed as 'alert'
+    events on /api/monitoring/events). GET /api/monitoring/alerts?limit=X
+    """
+    limit = request.args.get('limit', type=int)
+    return jsonify(get_alert_engine().recent(limit))
+
+@app.route('/api/monitoring/events', methods=['GET'])
+def get_monitoring_events():
+    """
+    Server-Sent Events stream of new detections ('detection'), progress ticks ('progress') and
+    fired disease alerts ('alert').
+    Reconnecting clients resume from the Last-Event-ID header (or ?last_event_id=X).
+    GET /api/monitoring/events
+    """
+    last_event_id_str = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    last_event_id = None
+    if last_event_id_str:
+        try:
+            last_event_id = int(last_event_id_str)
+        except ValueError:
+            last_event_id = None
+
+    response = Response(event_broker.stream(last_event_id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def resume_interrupted_job():
+    """Restarts the job that was running when the process last exited, from its checkpoint."""
+    global current_video_path, current_job_id, current_detection_interval, enable_tree_detection_global
+    job = get_interrupted_job()
+    if job is None:
+        return
+    if not os.path.exists(job['video_path']):
+        print(f"WARNING: Cannot resume job {job['id']}: video {job['video_path']} no longer exists.")
+        update_job_status(job['id'], 'failed')
+        return
+    if job['model_versions'] != get_model_versions():
+        print(f"WARNING: Models changed since job {job['id']} started; resuming with the current models.")
+
+    current_video_path = job['video_path']
+    current_job_id = job['id']
+    current_detection_interval = job['detection_interval']
+    enable_tree_detection_global = job['enable_tree_detection']
+    print(f"Resuming interrupted job {job['id']} for {job['source_name']} at frame {job['last_committed_frame']}.")
+    start_monitoring_thread()
 
 
 if __name__ == '__main__':
@@ -446,4 +1175,9 @@ if __name__ == '__main__':
     print(f"MTL API URL set to: {MTL_API_URL}")
     print(f"Detection Interval: {current_detection_interval} seconds (Actual configured)")
     print(f"Video Uploads Folder: {UPLOAD_FOLDER}")
+    # The debug reloader runs this module twice; only resume and run retention in the process that serves requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        retention_manager.start(RETENTION_INTERVAL_SECONDS)
+        if RESUME_INTERRUPTED_JOB_ON_STARTUP:
+            resume_interrupted_job()
     app.run(host='0.0.0.0', port=5002, debug=True, threaded=True)
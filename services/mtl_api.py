@@ -1,64 +1,28 @@
 # mtl_api.py
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 import torch
-import torch.nn as nn
-from torchvision import models, transforms
 from PIL import Image
 import numpy as np
 import io
 import base64
 
+from utils.metrics import REGISTRY, PROMETHEUS_CONTENT_TYPE, stage_timer, hot_path_log
+from utils.profiling import CProfileCapture, TorchForwardProfiler, register_profiling_routes
+from utils.mtl_model import MultitaskModelMobileNetV2, fruit_class_names, disease_class_names, \
+                            ripeness_class_names, test_transforms
+
 app = Flask(__name__)
 
-# 1. Define your MultitaskModelMobileNetV2 class 
-class MultitaskModelMobileNetV2(nn.Module):
-    def __init__(self, num_fruit_classes, num_ripeness_classes, num_disease_classes, pretrained=True, freeze_backbone=False):
-        super(MultitaskModelMobileNetV2, self).__init__()
-        self.mobilenet = models.mobilenet_v2(pretrained=pretrained)
-        self.backbone = self.mobilenet.features
-        self.backbone_output_size = self.mobilenet.classifier[1].in_features
-
-        if freeze_backbone:
-            for param in self.backbone.parameters():
-                param.requires_grad = False
-
-        self.fc_fruit = nn.Sequential(
-            nn.Linear(self.backbone_output_size, 512),
-            nn.ReLU(),
-            nn.Dropout(0.5),
-            nn.Linear(512, num_fruit_classes)
-        )
-
-        self.fc_ripeness = nn.Sequential(
-            nn.Linear(self.backbone_output_size, 512),
-            nn.ReLU(),
-            nn.Dropout(0.5),
-            nn.Linear(512, num_ripeness_classes)
-        )
-
-        self.fc_disease = nn.Sequential(
-            nn.Linear(self.backbone_output_size, 512),
-            nn.ReLU(),
-            nn.Dropout(0.5),
-            nn.Linear(512, num_disease_classes)
-        )
-
-    def forward(self, x):
-        features = self.backbone(x)
-        features = torch.mean(features, [2, 3])
-        features = features.view(features.size(0), -1)
-        fruit_output = self.fc_fruit(features)
-        ripeness_output = self.fc_ripeness(features)
-        disease_output = self.fc_disease(features)
-        return fruit_output, ripeness_output, disease_output
-
-# 2. Define your class names 
-fruit_class_names = ['apple', 'grapes', 'orange', 'strawberry']
-disease_class_names = ['Apple___Apple_scab', 'Apple___Black_rot', 'Apple___Cedar_apple_rust', 'Apple___healthy', 'Grape___Black_rot', 'Grape___Esca_(Black_Measles)', 'Grape___Leaf_blight_(Isariopsis_Leaf_Spot)', 'Grape___healthy', 'Orange___Haunglongbing_(Citrus_greening)', 'Strawberry___Leaf_scorch', 'Strawberry___healthy']
-ripeness_class_names = ['ripe', 'unripe']
-
-# 3. Instantiate the model with the correct number of classes
+predict_requests_total = REGISTRY.counter('mtl_predict_requests_total', 'Requests to /predict_image by HTTP status.', labelnames=('status',))
+predict_seconds = REGISTRY.histogram('mtl_predict_seconds', 'End-to-end latency of /predict_image in seconds.')
+
+# On-demand profiling (/admin/profile/...): cProfile around requests, torch.profiler around the forward pass
+cprofile_capture = CProfileCapture()
+torch_profiler = TorchForwardProfiler()
+register_profiling_routes(app, cprofile_capture, torch_profiler)
+
+# Instantiate the model with the correct number of classes
 num_fruit_classes = len(fruit_class_names)
 num_ripeness_classes = len(ripeness_class_names)
 num_disease_classes = len(disease_class_names)
@@ -86,15 +50,20 @@ except Exception as e:
     print(f"An error occurred during model loading: {e}")
     mtl_model = None
 
-# 4. Define the same preprocessing transformations
-test_transforms = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
-])
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics: request counts and decode/preprocess/classify latencies."""
+    return Response(REGISTRY.render(), mimetype=PROMETHEUS_CONTENT_TYPE)
 
 @app.route('/predict_image', methods=['POST'])
 def predict_image():
+    with predict_seconds.time(), cprofile_capture.section():
+        response = _predict_image()
+    status = response[1] if isinstance(response, tuple) else 200
+    predict_requests_total.labels(status=status).inc()
+    return response
+
+def _predict_image():
     if mtl_model is None:
         return jsonify({"error": "MTL model not loaded. Check server logs."}), 500
 
@@ -105,27 +74,27 @@ def predict_image():
     try:
         image_base64 = data['image_base64']
         
-        try:
-            image_bytes = base64.b64decode(image_base64)
-            print(f"DEBUG (mtl_api.py): Successfully decoded base64. Bytes length: {len(image_bytes)}")
-        except Exception as e:
-            print(f"ERROR (mtl_api.py): Base64 decode failed: {e}")
-            return jsonify({"error": f"Invalid base64 encoding: {e}"}), 400
-        
-        try:
-            
-            image = Image.open(io.BytesIO(image_bytes)).convert("RGB") 
-            print("DEBUG (mtl_api.py): Successfully opened image with PIL.")
-        except Exception as e:
-            print(f"ERROR (mtl_api.py): PIL Image.open failed: {e}. Raw bytes length: {len(image_bytes)}")
-            return jsonify({"error": f"Failed to open image from bytes: {e}"}), 400
+        # One observation per request covers both the base64 and the image decode
+        with stage_timer('mtl_decode'):
+            try:
+                image_bytes = base64.b64decode(image_base64)
+            except Exception as e:
+                hot_path_log('base64_error', f"ERROR (mtl_api.py): Base64 decode failed: {e}")
+                return jsonify({"error": f"Invalid base64 encoding: {e}"}), 400
+
+            try:
+                image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+            except Exception as e:
+                hot_path_log('pil_error', f"ERROR (mtl_api.py): PIL Image.open failed: {e}. Raw bytes length: {len(image_bytes)}")
+                return jsonify({"error": f"Failed to open image from bytes: {e}"}), 400
         
 
         # Preprocess the image
-        image_tensor = test_transforms(image).unsqueeze(0).to(device)
+        with stage_timer('preprocess'):
+            image_tensor = test_transforms(image).unsqueeze(0).to(device)
 
         # Perform inference
-        with torch.no_grad():
+        with stage_timer('classify'), torch_profiler.forward(), torch.no_grad():
             fruit_output, ripeness_output, disease_output = mtl_model(image_tensor)
 
         # Get predicted labels (indices)
@@ -145,7 +114,7 @@ def predict_image():
         })
 
     except Exception as e:
-        print(f"ERROR (mtl_api.py): An unexpected error occurred during prediction: {e}")
+        hot_path_log('prediction_error', f"ERROR (mtl_api.py): An unexpected error occurred during prediction: {e}")
         return jsonify({"error": f"Error processing image: {e}"}), 500
 
 if __name__ == '__main__':
@@ -163,7 +163,9 @@ def monitoring_loop():
                                     confidence_fruit=confidence_fruit,
                                     confidence_ripeness=confidence_ripeness,
                                     confidence_disease=confidence_disease,
-                                    notes=f"Detection from video stream: {os.path.basename(current_video_path)} (Frame {video_playback_pos}, Tree {i+1})"
+                                    video_name=os.path.basename(current_video_path),
+                                    frame_index=video_playback_pos - 1,
+                                    track_index=i
                                 )
                                 print(f"Stored detection: {fruit_type}, {ripeness}, {disease}")
                             else:
@@ -0,0 +1,95 @@
+# aggregate_cache.py
+
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+
+class AggregateCache:
+    def __init__(self, loader):
+        """
+        In-process copy of the all-time aggregates (total, counts by fruit and by disease).
+        The insert path applies each committed batch to it, so reads never touch the database.
+
+        Writers wrap commit + apply() in committing(), and reconcile() reloads under the same
+        lock. A reconciliation snapshot therefore either contains a batch that was already
+        applied or is taken before that batch commits, so no batch is counted twice or lost.
+        Readers only take a short data lock and never wait for a commit.
+
+        Args:
+            loader (callable): Returns (total, {fruit: count}, {disease: count}) from the database.
+        """
+        self._loader = loader
+        self._commit_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._total = 0
+        self._by_fruit = Counter()
+        self._by_disease = Counter()
+
+    @contextmanager
+    def committing(self):
+        """Hold while committing an insert transaction and applying it to the cache."""
+        with self._commit_lock:
+            yield
+
+    def apply(self, labels):
+        """Adds committed detections, given as (fruit_type, disease) pairs."""
+        with self._lock:
+            if not self._loaded:
+                return  # the first read loads the committed state, which already includes these rows
+            for fruit_type, disease in labels:
+                self._total += 1
+                self._by_fruit[fruit_type] += 1
+                self._by_disease[disease] += 1
+
+    def reconcile(self) -> int:
+        """
+        Reloads the aggregates from the database, correcting drift (e.g. rows written by another
+        process such as batch_process.py).
+
+        Returns:
+            int: How far the cached total was off (0 when it was exact or not loaded yet).
+        """
+        with self._commit_lock:
+            total, by_fruit, by_disease = self._loader()
+            with self._lock:
+                drift = total - self._total if self._loaded else 0
+                self._total, self._by_fruit, self._by_disease = total, Counter(by_fruit), Counter(by_disease)
+                self._loaded = True
+        return drift
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.reconcile()
+
+    def total(self) -> int:
+        self._ensure_loaded()
+        with self._lock:
+            return self._total
+
+    def counts_by_fruit(self) -> list:
+        self._ensure_loaded()
+        with self._lock:
+            return [(label, count) for label, count in self._by_fruit.items() if count]
+
+    def counts_by_disease(self) -> list:
+        self._ensure_loaded()
+        with self._lock:
+            return [(label, count) for label, count in self._by_disease.items() if count]
+
+    def start_reconciliation(self, interval_seconds: float) -> threading.Thread:
+        """Reconciles every interval_seconds on a daemon thread."""
+        def run():
+            stop = threading.Event()
+            while not stop.wait(interval_seconds):
+                try:
+                    drift = self.reconcile()
+                    if drift:
+                        print(f"Aggregate cache reconciled (total was off by {drift}).")
+                except Exception as e:
+                    print(f"ERROR: Aggregate cache reconciliation failed: {e}")
+
+        thread = threading.Thread(target=run, name='aggregate_reconciliation', daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,204 @@
+# alert_rules.py
+
+import json
+import queue
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import deque
+from datetime import datetime
+
+from utils.metrics import REGISTRY
+
+alerts_fired_total = REGISTRY.counter('alerts_fired_total', 'Alerts fired by the disease alert rules.')
+alert_webhook_errors_total = REGISTRY.counter('alert_webhook_errors_total', 'Alert webhook deliveries that failed.')
+
+# Fields of an alert rule, as stored in the alert_rules table
+ALERT_RULE_FIELDS = ('id', 'name', 'disease', 'video_name', 'min_count', 'window_minutes', 'webhook_url')
+
+
+def check_webhook_url(url: str) -> str:
+    """
+    Validates an alert webhook URL: only absolute http and https URLs are posted to.
+    Raises:
+        ValueError: For any other scheme or a URL without a host.
+    """
+    parsed = urllib.parse.urlparse(url) if isinstance(url, str) else None
+    if parsed is None or parsed.scheme not in ('http', 'https') or not parsed.netloc:
+        raise ValueError(f"'webhook_url' must be an http or https URL, got '{url}'.")
+    return url
+
+
+def is_non_healthy(disease) -> bool:
+    """Whether a disease label reports a disease (the classifier's healthy classes end in 'healthy')."""
+    return disease is not None and 'healthy' not in disease.lower()
+
+
+class AlertEngine:
+    def __init__(self, loader, recent_size: int = 200):
+        """
+        Evaluates disease alert rules against detections as they are committed, without querying
+        the database. A rule fires when at least min_count non-healthy detections of its disease
+        arrive within window_minutes in one video:
+
+            {'disease': 'Apple___Apple_scab', 'video_name': 'orchard_3.mp4', 'min_count': 5, 'window_minutes': 10}
+
+        disease None matches any non-healthy disease, video_name None applies the rule to every video
+        separately. Rules are indexed by (disease, video_name), so a detection only looks at the four
+        keys it can match and never at unrelated rules. Each (rule, video) keeps the times of its
+        last min_count detections in a ring buffer: a rule fires when the oldest of them is within
+        the window of the newest, which is O(1) per matching rule and needs no expiry pass. After
+        firing the buffer is emptied, so the next alert needs min_count new detections.
+
+        Detection times are the detections' own timestamps, so batch runs over old videos are
+        evaluated as they happened; they are assumed to arrive in time order within a video.
+
+        Args:
+            loader (callable): Returns the rules as dicts with ALERT_RULE_FIELDS.
+            recent_size (int): How many fired alerts recent() keeps.
+        """
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._rules_by_key = {}  # (disease or None, video_name or None) -> [rule, ...]
+        self._windows = {}  # (rule id, video_name) -> deque of (epoch_ms, detection id)
+        self._loaded = False
+        self._listeners = []
+        self._recent = deque(maxlen=recent_size)
+
+    def reload(self):
+        """Reloads the rules (after they were changed); windows of unchanged rules keep their state."""
+        rules = self._loader()
+        by_key = {}
+        for rule in rules:
+            by_key.setdefault((rule['disease'], rule['video_name']), []).append(rule)
+        with self._lock:
+            thresholds = {rule['id']: rule['min_count'] for rule in rules}
+            self._windows = {key: window for key, window in self._windows.items()
+                             if thresholds.get(key[0]) == window.maxlen}
+            self._rules_by_key, self._loaded = by_key, True
+
+    @property
+    def has_rules(self) -> bool:
+        if not self._loaded:
+            self.reload()
+        return bool(self._rules_by_key)
+
+    def subscribe(self, listener):
+        """Calls listener(alert, rule) for every alert fired in this process (from the inserting thread)."""
+        self._listeners.append(listener)
+
+    def observe(self, detections):
+        """
+        Applies committed detections, given as (detection id, epoch_ms, disease, video_name) tuples.
+
+        Returns:
+            list: The alerts fired, as dicts.
+        """
+        if not self._loaded:
+            self.reload()
+        fired = []
+        with self._lock:
+            if not self._rules_by_key:
+                return fired
+            for detection_id, epoch_ms, disease, video_name in detections:
+                if not is_non_healthy(disease):
+                    continue
+                # A detection without a video only matches the rules that apply to every video
+                keys = ((disease, None), (None, None)) if video_name is None else \
+                       ((disease, video_name), (disease, None), (None, video_name), (None, None))
+                for key in keys:
+                    for rule in self._rules_by_key.get(key, ()):
+                        alert = self._count(rule, detection_id, epoch_ms, disease, video_name)
+                        if alert is not None:
+                            fired.append((alert, rule))
+            self._recent.extend(alert for alert, _ in fired)
+        for alert, rule in fired:
+            alerts_fired_total.inc()
+            for listener in self._listeners:
+                try:
+                    listener(alert, rule)
+                except Exception as e:
+                    print(f"ERROR: Alert listener failed: {e}")
+        return [alert for alert, _ in fired]
+
+    def _count(self, rule, detection_id, epoch_ms, disease, video_name):
+        window_key = (rule['id'], video_name)
+        window = self._windows.get(window_key)
+        if window is None:
+            window = self._windows[window_key] = deque(maxlen=rule['min_count'])
+        window.append((epoch_ms, detection_id))
+        if len(window) < rule['min_count'] or window[-1][0] - window[0][0] > rule['window_minutes'] * 60000:
+            return None
+        first_ms, first_id = window[0]
+        window.clear()
+        return {
+            'rule_id': rule['id'],
+            'rule_name': rule['name'],
+            'disease': disease if rule['disease'] is None else rule['disease'],
+            'video_name': video_name,
+            'count': rule['min_count'],
+            'window_minutes': rule['window_minutes'],
+            'first_detection_id': first_id,
+            'last_detection_id': detection_id,
+            'first_time': datetime.fromtimestamp(first_ms / 1000).isoformat(),
+            'last_time': datetime.fromtimestamp(epoch_ms / 1000).isoformat(),
+            'fired_at': datetime.now().isoformat(),
+        }
+
+    def recent(self, limit: int = None) -> list:
+        """The most recently fired alerts, newest first."""
+        with self._lock:
+            alerts = list(reversed(self._recent))
+        return alerts[:limit] if limit else alerts
+
+
+class WebhookNotifier:
+    def __init__(self, default_url: str = None, timeout: float = 5.0, max_pending: int = 1000):
+        """
+        Posts alerts as JSON to their rule's webhook_url (or default_url) from a background thread,
+        so a slow or unreachable endpoint never delays the insert path. Alerts that arrive while
+        max_pending are still waiting are dropped with a warning.
+
+        Args:
+            default_url (str): Webhook for rules without their own; None to only post for those that have one.
+            timeout (float): Seconds to wait for the webhook to answer.
+            max_pending (int): Bound of the delivery queue.
+        """
+        self.default_url = default_url
+        self.timeout = timeout
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name='alert_webhook', daemon=True)
+        self._thread.start()
+
+    def __call__(self, alert: dict, rule: dict):
+        url = rule['webhook_url'] or self.default_url
+        if not url:
+            return
+        try:
+            check_webhook_url(url)
+        except ValueError as e:
+            alert_webhook_errors_total.inc()
+            print(f"ERROR: Not delivering alert of rule {alert['rule_id']}: {e}")
+            return
+        try:
+            self._queue.put_nowait((url, alert))
+        except queue.Full:
+            alert_webhook_errors_total.inc()
+            print(f"WARNING: Alert webhook queue full; dropped alert of rule {alert['rule_id']}.")
+
+    def _run(self):
+        while True:
+            url, alert = self._queue.get()
+            for attempt in range(2):
+                try:
+                    post = urllib.request.Request(url, data=json.dumps(alert).encode('utf-8'), method='POST',
+                                                  headers={'Content-Type': 'application/json'})
+                    urllib.request.urlopen(post, timeout=self.timeout).close()  # raises on 4xx/5xx
+                    break
+                except OSError as e:
+                    if attempt:
+                        alert_webhook_errors_total.inc()
+                        print(f"ERROR: Could not deliver alert of rule {alert['rule_id']} to {url}: {e}")
+                    else:
+                        time.sleep(1.0)
@@ -98,11 +98,17 @@ class MonitorDetectionsTool(BaseTool):
     description: str = "Useful for retrieving a summary of recent plant, fruit, ripeness, and disease detections made by the automated video monitoring system. The detections include timestamps and confidence scores. Input should always be 'none'."
 
     monitor_api_url: ClassVar[str] = 'http://localhost:5002/api/monitoring/detections'
+    # Last (ETag, summary); when nothing was detected since, the API answers 304 and the summary is reused
+    _cached_summary: ClassVar[dict] = {}
 
     def _run(self, query: str = "none") -> str:
         """Use the tool to get recent plant detections."""
         try:
-            response = requests.get(self.monitor_api_url)
+            cached = MonitorDetectionsTool._cached_summary
+            headers = {'If-None-Match': cached['etag']} if cached.get('etag') else {}
+            response = requests.get(self.monitor_api_url, headers=headers)
+            if response.status_code == 304 and 'summary' in cached:
+                return cached['summary']
             response.raise_for_status()
             detections_data = response.json()
 
@@ -123,7 +129,9 @@ class MonitorDetectionsTool(BaseTool):
 
                 summary.append(f"At {timestamp}: Fruit: {fruit}{conf_fruit}, Ripeness: {ripeness}{conf_ripeness}, Disease: {disease}{conf_disease}. Notes: {notes}")
             
-            return "Recent Detections:\n" + "\n".join(summary)
+            result = "Recent Detections:\n" + "\n".join(summary)
+            MonitorDetectionsTool._cached_summary = {'etag': response.headers.get('ETag'), 'summary': result}
+            return result
 
         except requests.exceptions.ConnectionError:
             return "Error: Could not connect to the monitoring API. Is it running on port 5002?"
@@ -280,6 +288,58 @@ class GetDetectionsInTimeRangeTool(BaseTool):
     async def _arun(self, json_input: str):
         raise NotImplementedError("Async not supported.")
 
+# --- Get Detection Trend Tool ---
+class GetDetectionTrendTool(BaseTool):
+    name: str = "get_detection_trend"
+    description: str = (
+        "Useful for questions about how detections change over time, e.g. 'how is scab trending' or "
+        "'are black rot detections increasing this week'. Returns detection counts and mean confidences per time bucket. "
+        "The input MUST be a JSON object string with optional keys: \"interval\" ('minute', 'hour' or 'day'), "
+        "\"disease\", \"fruit_type\" or \"ripeness\" (text the label must contain, e.g. \"scab\"), "
+        "\"group_by\" ('fruit_type', 'disease' or 'ripeness'), \"start_time\" and \"end_time\" (YYYY-MM-DDTHH:MM:SS). "
+        "Example: `{\"interval\": \"day\", \"disease\": \"scab\", \"start_time\": \"2024-05-01T00:00:00\"}`."
+    )
+    monitor_api_url: ClassVar[str] = 'http://localhost:5002/api/monitoring/trends'
+    max_buckets_listed: ClassVar[int] = 60
+
+    def _run(self, json_input: str = "{}") -> str:
+        """Use the tool to get bucketed detection counts."""
+        try:
+            import json
+            params = json.loads(json_input or "{}")
+            query = {key: params[key] for key in ('interval', 'group_by', 'disease', 'fruit_type', 'ripeness',
+                                                  'start_time', 'end_time') if params.get(key)}
+            response = requests.get(self.monitor_api_url, params=query)
+            response.raise_for_status()
+            data = response.json()
+
+            buckets = data.get('buckets', [])
+            if not buckets:
+                return f"No matching detections between {data.get('start_time')} and {data.get('end_time')}."
+
+            lines = []
+            for bucket in buckets[-self.max_buckets_listed:]:
+                label = f" {bucket['label']}" if bucket.get('label') else ""
+                confidence = bucket.get('mean_confidence_disease')
+                confidence = f" (mean disease confidence {confidence:.2f})" if confidence is not None else ""
+                lines.append(f"{bucket['bucket_start']}{label}: {bucket['count']}{confidence}")
+            skipped = len(buckets) - len(lines)
+            header = (f"Detections per {data.get('interval')} between {data.get('start_time')} and {data.get('end_time')}"
+                      + (f" (earliest {skipped} buckets omitted)" if skipped > 0 else "") + ":")
+            return header + "\n" + "\n".join(lines)
+
+        except json.JSONDecodeError:
+            return "Error: Invalid JSON input format for the trend tool."
+        except requests.exceptions.ConnectionError:
+            return "Error: Could not connect to the monitoring API. Is it running on port 5002?"
+        except requests.exceptions.RequestException as e:
+            return f"Error from detection trend tool: {e} - {e.response.text if e.response else ''}"
+        except Exception as e:
+            return f"An unexpected error occurred in detection trend tool: {e}"
+
+    async def _arun(self, json_input: str = "{}"):
+        raise NotImplementedError("Async not supported.")
+
 # --- 2. Wikipedia Tool ---
 wikipedia_tool = WikipediaQueryRun(api_wrapper=WikipediaAPIWrapper())
 
@@ -300,7 +360,8 @@ tools = [
     GetTotalDetectionsTool(),         
     GetDetectionsByFruitTool(),       
     GetDetectionsByDiseaseTool(),
-    GetDetectionsInTimeRangeTool()    # NEW
+    GetDetectionsInTimeRangeTool(),
+    GetDetectionTrendTool()
 ]
 
 # --- 5. Prompt Template ---
@@ -323,7 +384,8 @@ Tool Descriptions:
 5. If the user asks for detections **grouped by fruit type** (e.g., "How many of each fruit have been detected?", "Group detections by fruit"), you **MUST** use the `get_detections_grouped_by_fruit` tool.
 6. If the user asks for detections **grouped by disease type** (e.g., "What diseases were found and how many times?", "Group detections by disease"), you **MUST** use the `get_detections_grouped_by_disease` tool.
 7. **If the user asks for detections within a specific time frame, for a particular date, or between two dates, you MUST use the `get_detections_in_time_range` tool.** You will need to parse the user's request to extract the `start_time` and `end_time` in ISO 8601 format (YYYY-MM-DDTHH:MM:SS or simpler YYYY-MM-DDTHH:MM:SS.ffffff) and provide it as a JSON string to the tool. For example, if the user asks for "detections from yesterday", you should calculate yesterday's start and end timestamps.
-8. For general questions about plants or diseases not related to image analysis or monitoring detections, use the `wikipedia_query_run` tool.
+8. If the user asks how detections are **trending or changing over time** (e.g., "How is scab trending?", "Are black rot detections increasing?"), you **MUST** use the `get_detection_trend` tool instead of fetching individual detections.
+9. For general questions about plants or diseases not related to image analysis or monitoring detections, use the `wikipedia_query_run` tool.
 
 
 
@@ -0,0 +1,123 @@
+# chunked_upload.py
+
+import hashlib
+import os
+import threading
+import uuid
+
+from utils.database_manager import create_video_upload, get_video_upload, update_video_upload
+
+
+class UploadError(Exception):
+    """Raised when a chunk cannot be accepted. Carries the HTTP status code to report."""
+    def __init__(self, message: str, status_code: int = 400, upload: dict = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.upload = upload
+
+
+class ChunkedUploadManager:
+    def __init__(self, upload_folder: str, read_size: int = 1024 * 1024):
+        """
+        Receives large videos as a sequence of byte ranges so an interrupted upload
+        can continue from the last committed offset.
+
+        Args:
+            upload_folder (str): Directory the videos are written to.
+            read_size (int): How many bytes are read from the request stream at a time.
+        """
+        self.upload_folder = upload_folder
+        self.read_size = read_size
+        self._hashers = {}  # upload_id -> running sha256 over the committed prefix
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def _lock_for(self, upload_id: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def create(self, filename: str, total_size: int, expected_sha256: str = None,
+               detection_interval: float = None, enable_tree_detection: bool = None) -> dict:
+        """Starts a new upload and returns its record."""
+        if total_size <= 0:
+            raise UploadError("total_size must be a positive number of bytes.")
+        upload_id = uuid.uuid4().hex
+        extension = os.path.splitext(filename)[1].lower()
+        stored_path = os.path.join(self.upload_folder, upload_id + extension)
+        open(stored_path, 'wb').close()
+        create_video_upload(upload_id, filename, stored_path, total_size,
+                            expected_sha256.lower() if expected_sha256 else None,
+                            detection_interval=detection_interval,
+                            enable_tree_detection=enable_tree_detection)
+        self._hashers[upload_id] = hashlib.sha256()
+        return get_video_upload(upload_id)
+
+    def status(self, upload_id: str) -> dict:
+        upload = get_video_upload(upload_id)
+        if upload is None:
+            raise UploadError(f"Unknown upload id '{upload_id}'.", 404)
+        return upload
+
+    def _hasher_for(self, upload: dict):
+        """Returns the running checksum, rebuilding it from disk after a server restart."""
+        hasher = self._hashers.get(upload['upload_id'])
+        if hasher is None:
+            hasher = hashlib.sha256()
+            remaining = upload['received_bytes']
+            with open(upload['stored_path'], 'rb') as f:
+                while remaining > 0:
+                    block = f.read(min(self.read_size, remaining))
+                    if not block:
+                        break
+                    hasher.update(block)
+                    remaining -= len(block)
+            self._hashers[upload['upload_id']] = hasher
+        return hasher
+
+    def append(self, upload_id: str, offset: int, stream) -> dict:
+        """
+        Writes the bytes of one chunk at the given offset.
+
+        Args:
+            upload_id (str): The upload being continued.
+            offset (int): Byte offset the chunk starts at; must equal the committed offset.
+            stream: File-like object the chunk bytes are read from.
+        Returns:
+            dict: The updated upload record. Its status becomes 'complete' once all bytes
+                  arrived and the checksum matched, or 'failed' if it did not.
+        """
+        with self._lock_for(upload_id):
+            upload = self.status(upload_id)
+            if upload['status'] != 'uploading':
+                raise UploadError(f"Upload is already {upload['status']}.", 409, upload)
+            if offset != upload['received_bytes']:
+                raise UploadError(f"Expected offset {upload['received_bytes']}, got {offset}.", 409, upload)
+
+            hasher = self._hasher_for(upload).copy()
+            received = upload['received_bytes']
+            with open(upload['stored_path'], 'r+b') as f:
+                # Drop bytes written after the last committed offset (e.g. a chunk cut off mid-way)
+                f.truncate(received)
+                f.seek(received)
+                while True:
+                    block = stream.read(self.read_size)
+                    if not block:
+                        break
+                    if received + len(block) > upload['total_size']:
+                        raise UploadError("Chunk extends past the declared total_size.", 400, upload)
+                    f.write(block)
+                    hasher.update(block)
+                    received += len(block)
+                f.flush()
+                os.fsync(f.fileno())
+
+            self._hashers[upload_id] = hasher
+            status = None
+            sha256 = None
+            if received == upload['total_size']:
+                sha256 = hasher.hexdigest()
+                expected = upload['expected_sha256']
+                status = 'complete' if not expected or expected == sha256 else 'failed'
+                self._hashers.pop(upload_id, None)
+            update_video_upload(upload_id, received, status=status, sha256=sha256)
+            return get_video_upload(upload_id)
@@ -0,0 +1,193 @@
+# crop_store.py
+
+import hashlib
+import io
+import os
+import queue
+import re
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+from utils.metrics import REGISTRY, hot_path_log
+
+_KEY_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+crops_written_total = REGISTRY.counter('crop_store_written_total', 'Crops written to the crop store.')
+crops_deduplicated_total = REGISTRY.counter('crop_store_deduplicated_total', 'Crops already present in the store.')
+crops_dropped_total = REGISTRY.counter('crop_store_dropped_total', 'Crops dropped because the write queue was full.')
+crops_evicted_total = REGISTRY.counter('crop_store_evicted_total', 'Crops evicted to stay under the size cap.')
+crop_store_bytes = REGISTRY.gauge('crop_store_bytes', 'Bytes used by stored crops and thumbnails.')
+
+
+class CropStore:
+    def __init__(self, root: str, max_bytes: int = 2 * 1024 ** 3, thumbnail_size: tuple = (160, 160),
+                 thumbnail_quality: int = 75, queue_size: int = 512):
+        """
+        Content-addressed store for detected crops. Each JPEG is keyed by its SHA-256, so
+        identical crops are stored once, and lives at <root>/<k[:2]>/<k[2:4]>/<k>.jpg with a
+        thumbnail under <root>/thumbs/. A background thread does all disk I/O; put() only
+        hashes and enqueues. Least recently used crops are evicted beyond max_bytes.
+
+        Args:
+            root (str): Directory of the store.
+            max_bytes (int): Size cap for crops plus thumbnails.
+            thumbnail_size (tuple): Bounding box of the generated thumbnails.
+            thumbnail_quality (int): JPEG quality of the thumbnails.
+            queue_size (int): Pending writes kept in memory; further crops are dropped, not waited on.
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.thumbnail_size = thumbnail_size
+        self.thumbnail_quality = thumbnail_quality
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._pending = {}  # key -> JPEG bytes not yet on disk, served from memory meanwhile
+        self._lru = OrderedDict()  # key -> bytes on disk (crop + thumbnail), oldest first
+        self._total_bytes = 0
+        os.makedirs(root, exist_ok=True)
+        self._load_index()
+        self._thread = threading.Thread(target=self._writer, name='crop_store_writer', daemon=True)
+        self._thread.start()
+
+    def _relative_path(self, key: str, thumbnail: bool = False) -> str:
+        path = os.path.join(key[:2], key[2:4], key + '.jpg')
+        return os.path.join('thumbs', path) if thumbnail else path
+
+    def path_for(self, key: str, thumbnail: bool = False) -> str:
+        return os.path.join(self.root, self._relative_path(key, thumbnail))
+
+    def _load_index(self):
+        """Rebuilds the LRU order from file modification times after a restart."""
+        entries = []
+        for directory, _, files in os.walk(self.root):
+            if os.path.relpath(directory, self.root).split(os.sep)[0] == 'thumbs':
+                continue
+            for name in files:
+                key = name[:-4]
+                if not name.endswith('.jpg') or not _KEY_PATTERN.match(key):
+                    continue
+                stat = os.stat(os.path.join(directory, name))
+                size = stat.st_size
+                thumbnail_path = self.path_for(key, thumbnail=True)
+                if os.path.exists(thumbnail_path):
+                    size += os.path.getsize(thumbnail_path)
+                entries.append((stat.st_mtime, key, size))
+        for _, key, size in sorted(entries):
+            self._lru[key] = size
+            self._total_bytes += size
+        crop_store_bytes.set(self._total_bytes)
+
+    @staticmethod
+    def is_valid_key(key: str) -> bool:
+        return bool(_KEY_PATTERN.match(key or ''))
+
+    def put(self, jpeg_bytes: bytes) -> str:
+        """
+        Queues a JPEG for storage without touching the disk.
+
+        Returns:
+            str: Path of the crop relative to the store root, or None if the write queue is full.
+        """
+        key = hashlib.sha256(jpeg_bytes).hexdigest()
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                crops_deduplicated_total.inc()
+                return self._relative_path(key)
+            if key in self._pending:
+                crops_deduplicated_total.inc()
+                return self._relative_path(key)
+            self._pending[key] = jpeg_bytes
+        try:
+            self._queue.put_nowait(key)
+        except queue.Full:
+            with self._lock:
+                self._pending.pop(key, None)
+            crops_dropped_total.inc()
+            hot_path_log('crop_store_full', "WARNING: Crop store write queue is full; crop not saved.")
+            return None
+        return self._relative_path(key)
+
+    def get(self, key: str, thumbnail: bool = False):
+        """
+        Returns the JPEG bytes of a crop (or its thumbnail), or None if it is not stored.
+        Crops still waiting for the writer are served from memory.
+        """
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is None and key in self._lru:
+                self._lru.move_to_end(key)
+        if pending is not None:
+            return self._make_thumbnail(pending) if thumbnail else pending
+        try:
+            with open(self.path_for(key, thumbnail), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _make_thumbnail(self, jpeg_bytes: bytes) -> bytes:
+        image = Image.open(io.BytesIO(jpeg_bytes))
+        image.thumbnail(self.thumbnail_size)
+        output = io.BytesIO()
+        image.convert('RGB').save(output, format='JPEG', quality=self.thumbnail_quality)
+        return output.getvalue()
+
+    def _write_file(self, path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = path + '.tmp'
+        with open(temporary_path, 'wb') as f:
+            f.write(data)
+        os.replace(temporary_path, path)
+
+    def _writer(self):
+        while True:
+            key = self._queue.get()
+            try:
+                if key is None:
+                    return
+                with self._lock:
+                    jpeg_bytes = self._pending.get(key)
+                if jpeg_bytes is not None:
+                    self._store(key, jpeg_bytes)
+            except Exception as e:
+                hot_path_log('crop_store_error', f"ERROR: Failed to store crop {key}: {e}")
+                with self._lock:
+                    self._pending.pop(key, None)
+            finally:
+                self._queue.task_done()
+
+    def _store(self, key: str, jpeg_bytes: bytes):
+        thumbnail = self._make_thumbnail(jpeg_bytes)
+        self._write_file(self.path_for(key), jpeg_bytes)
+        self._write_file(self.path_for(key, thumbnail=True), thumbnail)
+        size = len(jpeg_bytes) + len(thumbnail)
+        with self._lock:
+            self._pending.pop(key, None)
+            self._lru[key] = size
+            self._total_bytes += size
+            evicted = []
+            while self._total_bytes > self.max_bytes and len(self._lru) > 1:
+                old_key, old_size = self._lru.popitem(last=False)
+                self._total_bytes -= old_size
+                evicted.append(old_key)
+            crop_store_bytes.set(self._total_bytes)
+        crops_written_total.inc()
+        for old_key in evicted:
+            for thumbnail_flag in (False, True):
+                try:
+                    os.remove(self.path_for(old_key, thumbnail_flag))
+                except FileNotFoundError:
+                    pass
+            crops_evicted_total.inc()
+
+    def flush(self):
+        """Blocks until every queued crop has been written."""
+        self._queue.join()
+
+    def close(self):
+        """Writes the remaining crops and stops the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
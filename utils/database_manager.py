@@ -1,62 +1,961 @@
 # database_manager.py
+import os
 import sqlite3
+import json
 from datetime import datetime, timedelta 
 import time 
+import threading
+import re
+from functools import lru_cache
+from operator import itemgetter
+
+from utils.metrics import stage_timer
+from utils.aggregate_cache import AggregateCache
+from utils.label_map import LabelMap, LABEL_KINDS
+from utils.alert_rules import AlertEngine, WebhookNotifier, ALERT_RULE_FIELDS, check_webhook_url
+from utils.detection_archive import read_archive, ARCHIVE_COLUMNS
 
 DATABASE_NAME = 'plant_monitor.db'
 
-def connect_db():
-    """Establishes a connection to the SQLite database."""
-    return sqlite3.connect(DATABASE_NAME)
+# Connection pool settings. WAL lets the dashboard's readers run while the monitoring thread writes;
+# synchronous=NORMAL only fsyncs at checkpoints, which is safe in WAL mode (a power loss can drop
+# the last transactions but never corrupts the database).
+POOL_MAX_CONNECTIONS = 8
+POOL_ACQUIRE_TIMEOUT = 30.0
+BUSY_TIMEOUT_MS = 5000
+MMAP_SIZE_BYTES = 256 * 1024 * 1024
+CACHE_SIZE_KIB = 64 * 1024
 
-def init_db():
-    """Initializes the database schema if tables don't exist."""
-    with connect_db() as conn:
+# Webhook receiving the alerts of rules that have no webhook_url of their own (None: only those are posted)
+ALERT_WEBHOOK_URL = os.environ.get('ALERT_WEBHOOK_URL')
+
+class ConnectionPool:
+    def __init__(self, database: str, max_connections: int = POOL_MAX_CONNECTIONS):
+        """
+        Bounded pool of persistent connections to one database file. The pragmas are set once
+        per connection instead of paying for a new connection (and a cold page cache) per call.
+        """
+        self.database = database
+        self.max_connections = max_connections
+        self._condition = threading.Condition()
+        self._idle = []
+        self._open_count = 0
+        self._closed = False
+
+    def _open(self):
+        conn = sqlite3.connect(self.database, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        # Lets retention return freed pages gradually. Only takes effect on a new, empty database
+        # (an existing one is converted offline by utils/retention.py), so it must precede journal_mode.
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA mmap_size={MMAP_SIZE_BYTES}')
+        conn.execute(f'PRAGMA cache_size=-{CACHE_SIZE_KIB}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+        return conn
+
+    def acquire(self):
+        with self._condition:
+            deadline = time.monotonic() + POOL_ACQUIRE_TIMEOUT
+            while not self._idle and self._open_count >= self.max_connections:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise sqlite3.OperationalError(f"No free database connection after {POOL_ACQUIRE_TIMEOUT} s.")
+                self._condition.wait(remaining)
+            if self._idle:
+                return self._idle.pop()
+            self._open_count += 1
+        try:
+            return self._open()
+        except Exception:
+            with self._condition:
+                self._open_count -= 1
+                self._condition.notify()
+            raise
+
+    def release(self, conn):
+        conn.row_factory = None
+        if conn.in_transaction:
+            conn.rollback()
+        with self._condition:
+            if not self._closed:
+                self._idle.append(conn)
+                self._condition.notify()
+                return
+            self._open_count -= 1
+        conn.close()
+
+    def close(self):
+        """Closes the idle connections; connections still checked out are closed when returned."""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._open_count -= len(idle)
+        for conn in idle:
+            conn.close()
+
+class PooledConnection:
+    """
+    Context manager lending a pooled connection: commits on success, rolls back on error
+    and returns the connection to its pool (sqlite3's own context manager never closes).
+    """
+    def __init__(self, pool: ConnectionPool):
+        self._pool = pool
+        self._conn = None
+
+    def __enter__(self):
+        self._conn = self._pool.acquire()
+        return self._conn
+
+    def __exit__(self, exc_type, exc, tb):
+        conn, self._conn = self._conn, None
+        try:
+            if exc_type is None:
+                conn.commit()
+            else:
+                conn.rollback()
+        finally:
+            self._pool.release(conn)
+        return False
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def _get_pool(database: str = None) -> ConnectionPool:
+    # DATABASE_NAME is read on every call so tools like batch_process.py can point at another file
+    database = database or DATABASE_NAME
+    with _pools_lock:
+        pool = _pools.get(database)
+        if pool is None:
+            pool = _pools[database] = ConnectionPool(database)
+        return pool
+
+def connect_db(database: str = None):
+    """Lends a pooled connection to the SQLite database; use as `with connect_db() as conn:`."""
+    return PooledConnection(_get_pool(database))
+
+def close_db_connections():
+    """Closes the pooled connections of every database (e.g. before deleting a temporary database)."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+def _ensure_column(cursor, table, column, declaration):
+    """Adds a column to an existing table if an older database does not have it yet."""
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+# Public shape of a detection row (API responses, archives). The table stores labels and the video
+# name as integer ids (see utils.label_map) and notes as structured video/frame/track columns.
+DETECTION_COLUMNS = ('id', 'timestamp', 'fruit_type', 'ripeness', 'disease',
+                     'confidence_fruit', 'confidence_ripeness', 'confidence_disease',
+                     'image_capture_path', 'notes', 'job_id')
+
+_DETECTIONS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS detections (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT NOT NULL,
+        epoch_ms INTEGER,
+        fruit_type_id INTEGER REFERENCES labels(id),
+        ripeness_id INTEGER REFERENCES labels(id),
+        disease_id INTEGER REFERENCES labels(id),
+        confidence_fruit REAL,
+        confidence_ripeness REAL,
+        confidence_disease REAL,
+        image_capture_path TEXT,
+        video_id INTEGER REFERENCES videos(id),
+        frame_index INTEGER,
+        track_index INTEGER,
+        notes TEXT,
+        job_id INTEGER REFERENCES monitoring_jobs(id)
+    )
+'''
+
+def compose_notes(video_name, frame_index, track_index, notes):
+    """
+    Public notes text of a detection: '<video> (Frame <frame>, Tree <track + 1>)' followed by any
+    free-text note. Must match _NOTES_SQL.
+    """
+    if video_name is None:
+        return notes
+    text = video_name
+    if frame_index is not None:
+        text += f" (Frame {frame_index}" + (f", Tree {track_index + 1}" if track_index is not None else '') + ")"
+    return text + (f" - {notes}" if notes is not None else '')
+
+# compose_notes in SQL, for the detections_decoded view (d = detections, v = videos)
+_NOTES_SQL = '''CASE WHEN v.name IS NULL THEN d.notes
+                     ELSE v.name || COALESCE(' (Frame ' || d.frame_index || COALESCE(', Tree ' || (d.track_index + 1), '') || ')', '')
+                                 || COALESCE(' - ' || d.notes, '') END'''
+
+# Notes written before the structured columns existed, by the monitoring services and batch_process.py
+_LEGACY_NOTES = re.compile(r'^Detection from (video stream|batch run): (.+?) \(Frame (\d+)(?:, Tree (\d+))?\)(?: - (.*))?$', re.S)
+# Suffixes that only restate whether the tree detector ran, which track_index already records
+_LEGACY_NOTE_SUFFIXES = {'Tree detection ON', 'Tree detection OFF (Full frame)'}
+
+@lru_cache(maxsize=4096)
+def parse_legacy_notes(notes):
+    """
+    Splits notes in the old 'Detection from ...' format into their fields.
+    Returns:
+        tuple: (video_name, frame_index, track_index, remaining notes); (None, None, None, notes)
+        for notes in any other format.
+    """
+    match = _LEGACY_NOTES.match(notes) if notes else None
+    if match is None:
+        return None, None, None, notes
+    source, video_name, frame, tree, rest = match.groups()
+    # Both writers counted frames from 1: batch runs wrote index + 1, the services the playback
+    # position after reading the frame
+    frame_index = int(frame) - 1
+    track_index = int(tree) - 1 if tree is not None else None
+    return video_name, frame_index, track_index, None if rest in _LEGACY_NOTE_SUFFIXES else rest
+
+def _legacy_notes_part(notes, part):
+    return parse_legacy_notes(notes)[part]
+
+# Confidences leave SQL as REAL or NULL: REAL affinity already stores numeric text as a number, so
+# anything else is text that never parsed (the API used to map it to None after the fetch)
+_CONFIDENCE_COLUMNS = ('confidence_fruit', 'confidence_ripeness', 'confidence_disease')
+_CONFIDENCE_SQL = "CASE WHEN typeof({0}) IN ('real', 'integer') THEN CAST({0} AS REAL) END"
+
+def _detection_reader(columns, extra=(), as_dicts=False, database=None):
+    """
+    Builds the SELECT list for public detection columns followed by the raw extra columns, and a
+    function turning a fetched row into the public tuple (extras passed through at the end).
+    Label ids are decoded with the in-memory label map.
+
+    With as_dicts the function is a sqlite3 row factory (conn.row_factory = decode) producing a dict
+    keyed by column, extras included under their own names, ready for the JSON encoder.
+    """
+    labels = get_label_map(database)
+    select, getters, position = [], [], 0
+    for column in columns:
+        if column in LABEL_KINDS:
+            select.append(f'{column}_id')
+            getters.append(lambda row, i=position, kind=column, names=labels.names(column):
+                           names.get(row[i]) or labels.name(kind, row[i]))
+            position += 1
+        elif column == 'notes':
+            select.append('video_id, frame_index, track_index, notes')
+            getters.append(lambda row, i=position, videos=labels.names('video'):
+                           compose_notes(videos.get(row[i]) or labels.name('video', row[i]), *row[i + 1:i + 4]))
+            position += 4
+        else:
+            select.append(_CONFIDENCE_SQL.format(column) if column in _CONFIDENCE_COLUMNS else column)
+            getters.append(itemgetter(position))
+            position += 1
+    select.extend(extra)
+
+    if as_dicts:
+        named = list(zip(columns, getters)) + [(name, itemgetter(position + i)) for i, name in enumerate(extra)]
+
+        def decode(cursor, row):
+            return {name: getter(row) for name, getter in named}
+    else:
+        def decode(row):
+            return tuple(getter(row) for getter in getters) + tuple(row[position:])
+    return ', '.join(select), decode
+
+def check_fields(fields):
+    """
+    Validates requested detection fields.
+    Returns:
+        list: The fields, or all of DETECTION_COLUMNS if fields is empty.
+    Raises:
+        ValueError: If fields contains an unknown column.
+    """
+    columns = list(fields) if fields else list(DETECTION_COLUMNS)
+    unknown = [column for column in columns if column not in DETECTION_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown detection field(s): {', '.join(unknown)}")
+    return columns
+
+def _fetch_detections(conn, query, params, decode, as_dicts):
+    """Runs a query built from _detection_reader; as_dicts installs decode as the row factory."""
+    if as_dicts:
+        conn.row_factory = decode
+        return conn.execute(query, params).fetchall()
+    return [decode(row) for row in conn.execute(query, params).fetchall()]
+
+def _drop_extras(rows, columns, extra):
+    """Removes the extra columns that only served the query (not requested) from dict rows."""
+    drop = [name for name in extra if name not in columns]
+    for row in rows:
+        for name in drop:
+            del row[name]
+    return rows
+
+def to_epoch_ms(timestamp):
+    """
+    Converts an ISO 8601 string (or datetime) to integer milliseconds since the epoch.
+    Naive timestamps are local time, as written by datetime.now().isoformat().
+    """
+    if timestamp is None:
+        return None
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp.strip().replace('Z', '+00:00'))
+    return int(round(timestamp.timestamp() * 1000))
+
+def _iso_to_epoch_ms_or_null(timestamp):
+    try:
+        return to_epoch_ms(timestamp)
+    except (TypeError, ValueError):
+        return None
+
+def _backfill_epoch_ms(conn):
+    """Fills epoch_ms for rows written before the column existed; a no-op index lookup once done."""
+    conn.create_function('iso_to_epoch_ms', 1, _iso_to_epoch_ms_or_null, deterministic=True)
+    cursor = conn.execute('UPDATE detections SET epoch_ms = iso_to_epoch_ms(timestamp) '
+                          'WHERE epoch_ms IS NULL AND iso_to_epoch_ms(timestamp) IS NOT NULL')
+    if cursor.rowcount > 0:
+        print(f"Backfilled epoch_ms for {cursor.rowcount} detections.")
+
+def _migrate_to_compact_detections(conn):
+    """
+    Rewrites a detections table with text labels and free-text notes into the compact layout:
+    labels and video names become ids into the lookup tables and the notes written by the
+    services are split into video/frame/track columns. Ids (and the AUTOINCREMENT high-water
+    mark) are kept. Runs in init_db's transaction, so a failure leaves the old table in place.
+    """
+    sequence = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'detections'").fetchone()
+    conn.execute('ALTER TABLE detections RENAME TO detections_legacy')
+    conn.execute(_DETECTIONS_TABLE)
+    for kind in LABEL_KINDS:
+        conn.execute(f'INSERT OR IGNORE INTO labels (kind, name) '
+                     f'SELECT DISTINCT ?, {kind} FROM detections_legacy WHERE {kind} IS NOT NULL', (kind,))
+    conn.create_function('legacy_notes_part', 2, _legacy_notes_part, deterministic=True)
+    conn.execute('INSERT OR IGNORE INTO videos (name) SELECT DISTINCT legacy_notes_part(notes, 0) '
+                 'FROM detections_legacy WHERE legacy_notes_part(notes, 0) IS NOT NULL')
+    cursor = conn.execute('''
+        INSERT INTO detections (id, timestamp, epoch_ms, fruit_type_id, ripeness_id, disease_id,
+                                confidence_fruit, confidence_ripeness, confidence_disease, image_capture_path,
+                                video_id, frame_index, track_index, notes, job_id)
+        SELECT d.id, d.timestamp, d.epoch_ms, f.id, r.id, s.id,
+               d.confidence_fruit, d.confidence_ripeness, d.confidence_disease, d.image_capture_path,
+               v.id, legacy_notes_part(d.notes, 1), legacy_notes_part(d.notes, 2), legacy_notes_part(d.notes, 3), d.job_id
+        FROM detections_legacy d
+        LEFT JOIN labels f ON f.kind = 'fruit_type' AND f.name = d.fruit_type
+        LEFT JOIN labels r ON r.kind = 'ripeness' AND r.name = d.ripeness
+        LEFT JOIN labels s ON s.kind = 'disease' AND s.name = d.disease
+        LEFT JOIN videos v ON v.name = legacy_notes_part(d.notes, 0)
+    ''')
+    migrated = cursor.rowcount
+    conn.execute('DROP TABLE detections_legacy')
+    if sequence is not None:
+        conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'detections'", (sequence[0],))
+        if conn.execute('SELECT changes()').fetchone()[0] == 0:
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('detections', ?)", (sequence[0],))
+    print(f"Migrated {migrated} detections to dictionary-encoded labels "
+          "(freed pages are returned by the retention job's incremental VACUUM).")
+
+ROLLUP_GRANULARITIES = ('hour', 'day')
+
+def bucket_start_ms(epoch_ms, granularity):
+    """Start (epoch ms) of the local-time hour or day containing epoch_ms; 0 for rows without a time."""
+    if epoch_ms is None:
+        return 0
+    moment = datetime.fromtimestamp(epoch_ms / 1000).replace(minute=0, second=0, microsecond=0)
+    if granularity == 'day':
+        moment = moment.replace(hour=0)
+    return int(moment.timestamp() * 1000)
+
+_ROLLUP_UPSERT = '''
+    INSERT INTO detection_rollups (granularity, bucket_start_ms, fruit_type, disease, ripeness, count,
+                                   sum_confidence_fruit, n_confidence_fruit,
+                                   sum_confidence_ripeness, n_confidence_ripeness,
+                                   sum_confidence_disease, n_confidence_disease)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (granularity, bucket_start_ms, fruit_type, disease, ripeness) DO UPDATE SET
+        count = count + excluded.count,
+        sum_confidence_fruit = sum_confidence_fruit + excluded.sum_confidence_fruit,
+        n_confidence_fruit = n_confidence_fruit + excluded.n_confidence_fruit,
+        sum_confidence_ripeness = sum_confidence_ripeness + excluded.sum_confidence_ripeness,
+        n_confidence_ripeness = n_confidence_ripeness + excluded.n_confidence_ripeness,
+        sum_confidence_disease = sum_confidence_disease + excluded.sum_confidence_disease,
+        n_confidence_disease = n_confidence_disease + excluded.n_confidence_disease
+'''
+
+def _confidence_or_none(value):
+    """A confidence as the detections table ends up holding it (see _CONFIDENCE_SQL): a float, or None if it is not numeric."""
+    if value is None:
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value == value else None  # SQLite stores NaN as NULL
+
+def _update_rollups(conn, rows):
+    """
+    Adds inserted detections to the hourly and daily rollups in the caller's transaction.
+    rows are (epoch_ms, fruit_type, disease, ripeness, confidence_fruit, confidence_ripeness, confidence_disease).
+    Labels are stored as '' instead of NULL so they can be part of the primary key.
+    """
+    deltas = {}
+    for epoch_ms, fruit_type, disease, ripeness, *confidences in rows:
+        for granularity in ROLLUP_GRANULARITIES:
+            key = (granularity, bucket_start_ms(epoch_ms, granularity), fruit_type or '', disease or '', ripeness or '')
+            delta = deltas.get(key)
+            if delta is None:
+                delta = deltas[key] = [0, 0.0, 0, 0.0, 0, 0.0, 0]
+            delta[0] += 1
+            for i, confidence in enumerate(map(_confidence_or_none, confidences)):
+                if confidence is not None:
+                    delta[1 + 2 * i] += confidence
+                    delta[2 + 2 * i] += 1
+    conn.executemany(_ROLLUP_UPSERT, [key + tuple(delta) for key, delta in deltas.items()])
+
+def rebuild_rollups(conn):
+    """Recomputes the rollups from the detections table (used once when the rollup table is created)."""
+    conn.create_function('bucket_start_ms', 2, bucket_start_ms, deterministic=True)
+    conn.execute('DELETE FROM detection_rollups')
+    # Non-numeric confidences count as NULL, as in _update_rollups and the readers
+    confidence = {name: _CONFIDENCE_SQL.format(f'confidence_{name}') for name in ('fruit', 'ripeness', 'disease')}
+    for granularity in ROLLUP_GRANULARITIES:
+        conn.execute(f'''
+            INSERT INTO detection_rollups
+            SELECT ?, bucket_start_ms(epoch_ms, ?), COALESCE(fruit_type, ''), COALESCE(disease, ''),
+                   COALESCE(ripeness, ''), COUNT(*),
+                   COALESCE(SUM({confidence['fruit']}), 0), COUNT({confidence['fruit']}),
+                   COALESCE(SUM({confidence['ripeness']}), 0), COUNT({confidence['ripeness']}),
+                   COALESCE(SUM({confidence['disease']}), 0), COUNT({confidence['disease']})
+            FROM detections_decoded
+            GROUP BY 2, 3, 4, 5
+        ''', (granularity, granularity))
+
+# Full-text index of the labels, video name and free-text notes. Contentless: it stores only the
+# tokens and returns detection ids, which are then read from the detections table. Triggers keep it
+# in sync with inserts, updates and deletes (including retention's deletes of archived days).
+_FTS_COLUMNS = ('fruit_type', 'ripeness', 'disease', 'video_name', 'notes')
+
+def _fts_values(row):
+    """SQL expressions for the indexed text of a detections row ('new' or 'old' in a trigger)."""
+    return (f'(SELECT name FROM labels WHERE id = {row}.fruit_type_id), '
+            f'(SELECT name FROM labels WHERE id = {row}.ripeness_id), '
+            f'(SELECT name FROM labels WHERE id = {row}.disease_id), '
+            f'(SELECT name FROM videos WHERE id = {row}.video_id), {row}.notes')
+
+def _create_search_index(cursor):
+    """Creates the FTS5 index and its triggers, filling it on creation; returns False if FTS5 is unavailable."""
+    exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'detections_fts'").fetchone()
+    try:
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS detections_fts USING fts5(
+                {', '.join(_FTS_COLUMNS)}, content='', prefix='2 3', tokenize='unicode61 remove_diacritics 2'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"WARNING: Full-text search disabled ({e}).")
+        return False
+    columns = ', '.join(_FTS_COLUMNS)
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS detections_fts_insert AFTER INSERT ON detections BEGIN
+            INSERT INTO detections_fts (rowid, {columns}) VALUES (new.id, {_fts_values('new')});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS detections_fts_delete AFTER DELETE ON detections BEGIN
+            INSERT INTO detections_fts (detections_fts, rowid, {columns}) VALUES ('delete', old.id, {_fts_values('old')});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS detections_fts_update AFTER UPDATE ON detections BEGIN
+            INSERT INTO detections_fts (detections_fts, rowid, {columns}) VALUES ('delete', old.id, {_fts_values('old')});
+            INSERT INTO detections_fts (rowid, {columns}) VALUES (new.id, {_fts_values('new')});
+        END
+    ''')
+    if not exists:
+        cursor.execute(f'''
+            INSERT INTO detections_fts (rowid, {columns})
+            SELECT id, fruit_type, ripeness, disease, video_name, notes FROM (
+                SELECT d.id, f.name AS fruit_type, r.name AS ripeness, s.name AS disease, v.name AS video_name, d.notes
+                FROM detections d
+                LEFT JOIN labels f ON f.id = d.fruit_type_id
+                LEFT JOIN labels r ON r.id = d.ripeness_id
+                LEFT JOIN labels s ON s.id = d.disease_id
+                LEFT JOIN videos v ON v.id = d.video_id
+            )
+        ''')
+        if cursor.rowcount > 0:
+            print(f"Indexed {cursor.rowcount} detections for full-text search.")
+    return True
+
+def init_db(database: str = None):
+    """Initializes the database schema if tables don't exist (in DATABASE_NAME unless database is given)."""
+    with connect_db(database) as conn:
         cursor = conn.cursor()
+        # Dictionaries of the label strings and video names; detections reference them by id
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS detections (
+            CREATE TABLE IF NOT EXISTS labels (
+                id INTEGER PRIMARY KEY,
+                kind TEXT NOT NULL,
+                name TEXT NOT NULL,
+                UNIQUE (kind, name)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS videos (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE
+            )
+        ''')
+        # Monitoring jobs persist enough state to resume a video after a restart
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS monitoring_jobs (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp TEXT NOT NULL,
-                fruit_type TEXT,
-                ripeness TEXT,
+                video_path TEXT NOT NULL,
+                source_name TEXT,
+                detection_interval REAL,
+                enable_tree_detection INTEGER,
+                model_versions TEXT,
+                status TEXT NOT NULL,
+                last_committed_frame INTEGER NOT NULL DEFAULT 0,
+                total_frames INTEGER,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+        ''')
+        _ensure_column(cursor, 'monitoring_jobs', 'linked_job_id', 'INTEGER REFERENCES monitoring_jobs(id)')
+        # Which process runs the job: 'monitor' (the monitoring service, which resumes it) or 'batch' (batch_process.py)
+        _ensure_column(cursor, 'monitoring_jobs', 'kind', "TEXT NOT NULL DEFAULT 'monitor'")
+        cursor.execute("PRAGMA table_info(detections)")
+        if 'fruit_type' in [row[1] for row in cursor.fetchall()]:
+            # Older text-label layout: bring it up to date, then rewrite it in the compact layout
+            _ensure_column(cursor, 'detections', 'job_id', 'INTEGER REFERENCES monitoring_jobs(id)')
+            _ensure_column(cursor, 'detections', 'epoch_ms', 'INTEGER')
+            _backfill_epoch_ms(conn)
+            _migrate_to_compact_detections(conn)
+        cursor.execute(_DETECTIONS_TABLE)
+        # Integer time column: range scans and ORDER BY time use these indexes instead of scanning
+        # and sorting the ISO text. The implicit rowid (id) makes each index ordered by (..., epoch_ms, id).
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_detections_time ON detections (epoch_ms)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_detections_disease_time ON detections (disease_id, epoch_ms)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_detections_fruit_time ON detections (fruit_type_id, epoch_ms)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_detections_job ON detections (job_id)')
+        # Detections with their labels and notes as text, for ad-hoc SQL and bulk statements
+        cursor.execute(f'''
+            CREATE VIEW IF NOT EXISTS detections_decoded AS
+            SELECT d.id, d.timestamp, f.name AS fruit_type, r.name AS ripeness, s.name AS disease,
+                   d.confidence_fruit, d.confidence_ripeness, d.confidence_disease, d.image_capture_path,
+                   {_NOTES_SQL} AS notes,
+                   d.job_id, d.epoch_ms, v.name AS video_name, d.frame_index, d.track_index
+            FROM detections d
+            LEFT JOIN labels f ON f.id = d.fruit_type_id
+            LEFT JOIN labels r ON r.id = d.ripeness_id
+            LEFT JOIN labels s ON s.id = d.disease_id
+            LEFT JOIN videos v ON v.id = d.video_id
+        ''')
+        # Hourly and daily counts (and confidence sums) per fruit/disease/ripeness, maintained in the
+        # insert transaction, so aggregates never scan the detections table
+        rollups_exist = cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' "
+                                       "AND name = 'detection_rollups'").fetchone()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS detection_rollups (
+                granularity TEXT NOT NULL,
+                bucket_start_ms INTEGER NOT NULL,
+                fruit_type TEXT NOT NULL,
+                disease TEXT NOT NULL,
+                ripeness TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                sum_confidence_fruit REAL NOT NULL DEFAULT 0,
+                n_confidence_fruit INTEGER NOT NULL DEFAULT 0,
+                sum_confidence_ripeness REAL NOT NULL DEFAULT 0,
+                n_confidence_ripeness INTEGER NOT NULL DEFAULT 0,
+                sum_confidence_disease REAL NOT NULL DEFAULT 0,
+                n_confidence_disease INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (granularity, bucket_start_ms, fruit_type, disease, ripeness)
+            ) WITHOUT ROWID
+        ''')
+        if not rollups_exist:
+            rebuild_rollups(conn)
+        _create_search_index(cursor)
+        # Archive files holding detections moved out of the hot table by retention (one per local day)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS detection_archive_partitions (
+                path TEXT PRIMARY KEY,
+                day_start_ms INTEGER NOT NULL,
+                day_end_ms INTEGER NOT NULL,
+                row_count INTEGER NOT NULL,
+                max_id INTEGER NOT NULL,
+                created_at TEXT NOT NULL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_archive_partitions_day ON detection_archive_partitions (day_start_ms)')
+        # Days a retention pass is archiving, so passes in different processes never write the same day
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS detection_archive_claims (
+                day_start_ms INTEGER PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_ms INTEGER NOT NULL
+            )
+        ''')
+        # Disease alert rules, evaluated in memory by utils.alert_rules.AlertEngine as detections are committed
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS alert_rules (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT,
                 disease TEXT,
-                confidence_fruit REAL,
-                confidence_ripeness REAL,
-                confidence_disease REAL,
-                image_capture_path TEXT,
-                notes TEXT
+                video_name TEXT,
+                min_count INTEGER NOT NULL,
+                window_minutes REAL NOT NULL,
+                webhook_url TEXT,
+                created_at TEXT NOT NULL
+            )
+        ''')
+        # Fingerprints of processed videos, used to reuse results for re-uploaded clips
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS video_fingerprints (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id INTEGER NOT NULL REFERENCES monitoring_jobs(id),
+                content_hash TEXT NOT NULL,
+                prefix_hash TEXT NOT NULL,
+                total_size INTEGER NOT NULL,
+                frame_count INTEGER,
+                frame_hashes TEXT,
+                created_at TEXT NOT NULL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_fingerprints_content_hash ON video_fingerprints (content_hash)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_fingerprints_size ON video_fingerprints (total_size)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_fingerprints_frame_count ON video_fingerprints (frame_count)')
+        # Chunked uploads track how many bytes have been received so a client can resume
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS video_uploads (
+                upload_id TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                stored_path TEXT NOT NULL,
+                total_size INTEGER NOT NULL,
+                received_bytes INTEGER NOT NULL DEFAULT 0,
+                expected_sha256 TEXT,
+                sha256 TEXT,
+                status TEXT NOT NULL,
+                detection_interval REAL,
+                enable_tree_detection INTEGER,
+                job_id INTEGER REFERENCES monitoring_jobs(id),
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
             )
         ''')
         conn.commit()
-    print(f"Database '{DATABASE_NAME}' initialized.")
+    print(f"Database '{database or DATABASE_NAME}' initialized.")
+
+_DETECTION_INSERT = '''
+    INSERT INTO detections (timestamp, epoch_ms, fruit_type_id, ripeness_id, disease_id,
+                             confidence_fruit, confidence_ripeness, confidence_disease, image_capture_path,
+                             video_id, frame_index, track_index, notes, job_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+def _label_ids(conn, kind, names, database=None):
+    """
+    Ids of label strings (kind 'video' for video names), adding new ones in the caller's transaction.
+    Ids of new labels are not put into the label map; it picks them up from the database once committed.
+    """
+    labels = get_label_map(database)
+    ids = {}
+    for name in names:
+        if name is None or name in ids:
+            continue
+        label_id = labels.known_id(kind, name)
+        if label_id is None:
+            if kind == 'video':
+                conn.execute('INSERT OR IGNORE INTO videos (name) VALUES (?)', (name,))
+                label_id = conn.execute('SELECT id FROM videos WHERE name = ?', (name,)).fetchone()[0]
+            else:
+                conn.execute('INSERT OR IGNORE INTO labels (kind, name) VALUES (?, ?)', (kind, name))
+                label_id = conn.execute('SELECT id FROM labels WHERE kind = ? AND name = ?', (kind, name)).fetchone()[0]
+        ids[name] = label_id
+    return ids
+
+def _insert_detection_rows(conn, detections, job_id=None, database=None):
+    """
+    Inserts detection dicts with one executemany on an open connection (inside the caller's transaction).
+    Besides the insert_detection keyword arguments a dict may carry 'video_name', 'frame_index' and
+    'track_index'; without them, notes in the old 'Detection from ...' format are split into those fields.
+    Returns:
+        list: The ids of the inserted rows, in order.
+    """
+    now = datetime.now().isoformat()
+    structured = []
+    for d in detections:
+        if d.get('video_name') is not None:
+            structured.append((d['video_name'], d.get('frame_index'), d.get('track_index'), d.get('notes')))
+        else:
+            structured.append(parse_legacy_notes(d.get('notes')))
+    ids = {kind: _label_ids(conn, kind, {d.get(kind) for d in detections}, database) for kind in LABEL_KINDS}
+    video_ids = _label_ids(conn, 'video', {video_name for video_name, _, _, _ in structured}, database)
+    rows = []
+    for d, (video_name, frame_index, track_index, notes) in zip(detections, structured):
+        timestamp = d.get('timestamp') or now
+        rows.append((timestamp, _iso_to_epoch_ms_or_null(timestamp), ids['fruit_type'].get(d.get('fruit_type')),
+                     ids['ripeness'].get(d.get('ripeness')), ids['disease'].get(d.get('disease')),
+                     d.get('confidence_fruit'), d.get('confidence_ripeness'), d.get('confidence_disease'),
+                     d.get('image_capture_path'), video_ids.get(video_name), frame_index, track_index, notes,
+                     d.get('job_id', job_id)))
+    if not rows:
+        return []
+    conn.executemany(_DETECTION_INSERT, rows)
+    _update_rollups(conn, [(row[1], d.get('fruit_type'), d.get('disease'), d.get('ripeness'), *row[5:8])
+                           for d, row in zip(detections, rows)])
+    # The transaction holds the write lock, so AUTOINCREMENT hands out consecutive ids
+    last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+    return list(range(last_id - len(rows) + 1, last_id + 1))
 
 def insert_detection(fruit_type, ripeness, disease, 
                      confidence_fruit=None, confidence_ripeness=None, confidence_disease=None,
-                     image_capture_path=None, notes=None):
+                     image_capture_path=None, notes=None, timestamp=None, job_id=None,
+                     video_name=None, frame_index=None, track_index=None):
     """
     Inserts a new detection record into the database.
-    Timestamp is automatically generated.
+    Timestamp is automatically generated unless one is given. video_name, frame_index (0-based
+    frame position) and track_index (0-based tree index) locate the crop; notes is free text.
+    """
+    detection = {'timestamp': timestamp, 'fruit_type': fruit_type, 'ripeness': ripeness, 'disease': disease,
+                 'confidence_fruit': confidence_fruit, 'confidence_ripeness': confidence_ripeness,
+                 'confidence_disease': confidence_disease, 'image_capture_path': image_capture_path,
+                 'notes': notes, 'job_id': job_id, 'video_name': video_name, 'frame_index': frame_index,
+                 'track_index': track_index}
+    with stage_timer('db_insert'), connect_db() as conn:
+        detection_id = _insert_detection_rows(conn, [detection])[0]
+        _commit_detections(conn, [detection], [detection_id])
+        return detection_id
+
+def create_monitoring_job(video_path, detection_interval, enable_tree_detection,
+                          model_versions=None, source_name=None, linked_job_id=None, kind='monitor'):
+    """
+    Registers a new monitoring job and returns its id.
+    A job with linked_job_id reuses that job's detections instead of processing the video
+    and is stored with the status 'linked'.
+    Args:
+        video_path (str): Path of the video being processed.
+        detection_interval (float): Seconds between sampled frames.
+        enable_tree_detection (bool): Whether frames are cropped by the tree detector.
+        model_versions (dict): Versions of the models used, stored as JSON.
+        source_name (str): Original (user facing) name of the video.
+        linked_job_id (int): Earlier job whose results are reused for this video.
+        kind (str): 'monitor' for the monitoring service, 'batch' for batch_process.py; only
+            'monitor' jobs are resumed by the service.
     """
-    timestamp = datetime.now().isoformat()
+    now = datetime.now().isoformat()
+    status = 'linked' if linked_job_id else 'running'
     with connect_db() as conn:
         cursor = conn.cursor()
         cursor.execute('''
-            INSERT INTO detections (timestamp, fruit_type, ripeness, disease, 
-                                     confidence_fruit, confidence_ripeness, confidence_disease, 
-                                     image_capture_path, notes)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (timestamp, fruit_type, ripeness, disease, 
-              confidence_fruit, confidence_ripeness, confidence_disease, 
-              image_capture_path, notes))
+            INSERT INTO monitoring_jobs (video_path, source_name, detection_interval, enable_tree_detection,
+                                         model_versions, status, last_committed_frame, linked_job_id, kind,
+                                         created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, 0, ?, ?, ?, ?)
+        ''', (video_path, source_name, detection_interval, int(bool(enable_tree_detection)),
+              json.dumps(model_versions or {}, sort_keys=True), status, linked_job_id, kind, now, now))
         conn.commit()
-        print(f"Inserted detection: {fruit_type}, {ripeness}, {disease} at {timestamp}")
         return cursor.lastrowid
 
+def _job_row_to_dict(row):
+    if row is None:
+        return None
+    job = dict(row)
+    job['enable_tree_detection'] = bool(job['enable_tree_detection'])
+    job['model_versions'] = json.loads(job['model_versions']) if job['model_versions'] else {}
+    return job
+
+def get_monitoring_job(job_id):
+    """Fetches a monitoring job as a dict, or None if it does not exist."""
+    with connect_db() as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM monitoring_jobs WHERE id = ?', (job_id,))
+        return _job_row_to_dict(cursor.fetchone())
+
+def get_interrupted_job():
+    """
+    Returns the most recent monitoring service job still marked 'running' (i.e. the process died
+    mid-video), or None. Jobs of batch_process.py belong to that run and are never returned.
+    """
+    with connect_db() as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM monitoring_jobs WHERE status = 'running' AND kind = 'monitor' "
+                       "ORDER BY id DESC LIMIT 1")
+        return _job_row_to_dict(cursor.fetchone())
+
+def update_job_status(job_id, status):
+    """Sets a job's status ('running', 'stopped', 'completed' or 'failed')."""
+    with connect_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('UPDATE monitoring_jobs SET status = ?, updated_at = ? WHERE id = ?',
+                       (status, datetime.now().isoformat(), job_id))
+        conn.commit()
+
+def commit_detections_with_checkpoint(job_id, last_committed_frame, detections=(), total_frames=None):
+    """
+    Inserts a frame's detections and advances the job checkpoint in a single transaction,
+    so after a crash either both are stored or neither is.
+    Args:
+        job_id (int): The monitoring job the detections belong to.
+        last_committed_frame (int): Number of frames fully processed so far.
+        detections (list): Dicts with the keyword arguments accepted by insert_detection.
+        total_frames (int): Total frames of the video, recorded with the checkpoint if given.
+    Returns:
+        list: The ids of the inserted detection rows, in order.
+    """
+    return commit_detection_batch(detections, {job_id: (last_committed_frame, total_frames)}, job_id=job_id)
+
+def commit_detection_batch(detections, checkpoints=None, job_id=None, database=None):
+    """
+    Inserts detections of any number of frames and jobs with one executemany and advances
+    the given job checkpoints in the same transaction (used by the write-behind writer).
+    Args:
+        detections (list): Dicts with the keyword arguments accepted by insert_detection.
+        checkpoints (dict): job_id -> (last_committed_frame, total_frames or None).
+        job_id (int): Job the rows belong to, unless a row carries its own 'job_id'.
+        database (str): Database file; DATABASE_NAME if None.
+    Returns:
+        list: The ids of the inserted detection rows, in order.
+    """
+    now = datetime.now().isoformat()
+    with stage_timer('db_insert'), connect_db(database) as conn:
+        inserted_ids = _insert_detection_rows(conn, detections, job_id, database)
+        if checkpoints:
+            conn.executemany('''
+                UPDATE monitoring_jobs
+                SET last_committed_frame = ?, total_frames = COALESCE(?, total_frames), updated_at = ?
+                WHERE id = ?
+            ''', [(frame, total_frames, now, checkpoint_job_id)
+                  for checkpoint_job_id, (frame, total_frames) in checkpoints.items()])
+        _commit_detections(conn, detections, inserted_ids, database)
+    return inserted_ids
+
+def create_video_upload(upload_id, filename, stored_path, total_size, expected_sha256=None,
+                        detection_interval=None, enable_tree_detection=None):
+    """Registers a new chunked upload in the 'uploading' state, with the monitoring settings to use for it."""
+    now = datetime.now().isoformat()
+    with connect_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO video_uploads (upload_id, filename, stored_path, total_size, received_bytes,
+                                       expected_sha256, status, detection_interval, enable_tree_detection,
+                                       created_at, updated_at)
+            VALUES (?, ?, ?, ?, 0, ?, 'uploading', ?, ?, ?, ?)
+        ''', (upload_id, filename, stored_path, total_size, expected_sha256, detection_interval,
+              None if enable_tree_detection is None else int(bool(enable_tree_detection)), now, now))
+        conn.commit()
+
+def get_video_upload(upload_id):
+    """Fetches a chunked upload as a dict, or None if it does not exist."""
+    with connect_db() as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM video_uploads WHERE upload_id = ?', (upload_id,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+def get_video_upload_by_path(stored_path):
+    """Fetches the chunked upload writing to stored_path, or None."""
+    with connect_db() as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM video_uploads WHERE stored_path = ? ORDER BY created_at DESC LIMIT 1', (stored_path,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+def update_video_upload(upload_id, received_bytes, status=None, sha256=None):
+    """Records the committed byte offset of a chunked upload, and optionally its final status and checksum."""
+    with connect_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE video_uploads
+            SET received_bytes = ?, status = COALESCE(?, status), sha256 = COALESCE(?, sha256), updated_at = ?
+            WHERE upload_id = ?
+        ''', (received_bytes, status, sha256, datetime.now().isoformat(), upload_id))
+        conn.commit()
+
+def set_video_upload_job(upload_id, job_id):
+    """Links a chunked upload to the monitoring job processing it."""
+    with connect_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('UPDATE video_uploads SET job_id = ? WHERE upload_id = ?', (job_id, upload_id))
+        conn.commit()
+
+def insert_video_fingerprint(job_id, fingerprint):
+    """Stores the fingerprint (see utils.video_fingerprint.fingerprint_video) of the video processed by job_id."""
+    with connect_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO video_fingerprints (job_id, content_hash, prefix_hash, total_size, frame_count,
+                                            frame_hashes, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (job_id, fingerprint['content_hash'], fingerprint['prefix_hash'], fingerprint['total_size'],
+              fingerprint['frame_count'], ','.join(format(h, 'x') for h in fingerprint['frame_hashes']),
+              datetime.now().isoformat()))
+        conn.commit()
+
+def get_reusable_fingerprints(model_versions, detection_interval, enable_tree_detection,
+                              content_hash=None, total_size=None, frame_count=None):
+    """
+    Fetches fingerprints of videos fully processed with the same models and sampling config
+    that could match a new upload (same content hash, byte size or frame count). Jobs that ran
+    on a day retention has archived are left out: their detections are no longer in the hot table.
+    Returns:
+        list: Fingerprint dicts with 'job_id' pointing at the completed job.
+    """
+    with connect_db() as conn:
+        conn.row_factory = sqlite3.Row
+        conn.create_function('iso_to_epoch_ms', 1, _iso_to_epoch_ms_or_null, deterministic=True)
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT f.* FROM video_fingerprints f
+            JOIN monitoring_jobs j ON j.id = f.job_id
+            WHERE j.status = 'completed'
+              AND j.model_versions = ? AND j.detection_interval = ? AND j.enable_tree_detection = ?
+              AND (f.content_hash = ? OR f.total_size = ? OR f.frame_count = ?)
+              AND NOT EXISTS (SELECT 1 FROM detection_archive_partitions p
+                              WHERE p.day_end_ms > COALESCE(iso_to_epoch_ms(j.created_at), 0))
+            ORDER BY f.id DESC
+        ''', (json.dumps(model_versions or {}, sort_keys=True), detection_interval,
+              int(bool(enable_tree_detection)), content_hash, total_size, frame_count))
+        fingerprints = []
+        for row in cursor.fetchall():
+            fingerprint = dict(row)
+            fingerprint['frame_hashes'] = [int(h, 16) for h in fingerprint['frame_hashes'].split(',')] \
+                if fingerprint['frame_hashes'] else []
+            fingerprints.append(fingerprint)
+        return fingerprints
+
+def get_detections_for_job(job_id, as_dicts=False):
+    """
+    Fetches the detections of a job, following the link of a job that reused earlier results.
+    Rows are tuples in DETECTION_COLUMNS order, or dicts with as_dicts.
+    """
+    with connect_db() as conn:
+        row = conn.execute('SELECT linked_job_id FROM monitoring_jobs WHERE id = ?', (job_id,)).fetchone()
+        if row and row[0]:
+            job_id = row[0]
+        select, decode = _detection_reader(DETECTION_COLUMNS, as_dicts=as_dicts)
+        return _fetch_detections(conn, f'SELECT {select} FROM detections WHERE job_id = ? ORDER BY id',
+                                 (job_id,), decode, as_dicts)
+
+def insert_detections_bulk(detections, job_id=None):
+    """
+    Inserts many detection records with a single executemany in one transaction.
+    Args:
+        detections (list): Dicts with the keyword arguments accepted by insert_detection.
+        job_id (int): Job the rows belong to, unless a row carries its own 'job_id'.
+    Returns:
+        int: Number of rows inserted.
+    """
+    return len(commit_detection_batch(detections, job_id=job_id))
+
 def get_all_detections(limit: int = None):
     """Fetches all detection records from the database, optionally limited."""
+    select, decode = _detection_reader(DETECTION_COLUMNS)
     with connect_db() as conn:
         cursor = conn.cursor()
-        query = "SELECT * FROM detections ORDER BY timestamp DESC"
+        query = f"SELECT {select} FROM detections ORDER BY epoch_ms DESC, id DESC"
         params = []
         if limit is not None and isinstance(limit, int) and limit > 0:
             query += " LIMIT ?"
@@ -64,55 +963,536 @@ def get_all_detections(limit: int = None):
         
         cursor.execute(query, params)
         detections = cursor.fetchall()
-    return detections
+    return [decode(row) for row in detections]
 
-def get_detections_in_time_range(start_timestamp: str, end_timestamp: str):
+def get_detections_page(limit: int, before=None, fields=None, as_dicts=False):
+    """
+    Fetches one page of detections, newest first, using keyset pagination on (epoch_ms, id):
+    each page is an index range scan however deep the client has paged.
+    Args:
+        limit (int): Maximum number of rows to return.
+        before (tuple): (epoch_ms, id) key of the last row of the previous page, or None for the first page.
+        fields (list): Columns to return (subset of DETECTION_COLUMNS); all columns if None.
+        as_dicts (bool): Return each row as a dict keyed by field instead of a tuple.
+    Returns:
+        tuple: (rows as tuples in the order of fields, key for the next page or None if this is the last page).
+    Raises:
+        ValueError: If fields contains an unknown column.
+    """
+    columns = check_fields(fields)
+    extra = ('epoch_ms', 'id')
+    select, decode = _detection_reader(columns, extra=extra, as_dicts=as_dicts)
+    query = f"SELECT {select} FROM detections WHERE epoch_ms IS NOT NULL"
+    params = []
+    if before is not None:
+        query += " AND (epoch_ms, id) < (?, ?)"
+        params.extend(before)
+    query += " ORDER BY epoch_ms DESC, id DESC LIMIT ?"
+    params.append(limit + 1)
+    with connect_db() as conn:
+        rows = _fetch_detections(conn, query, params, decode, as_dicts)
+    next_key = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_key = (last['epoch_ms'], last['id']) if as_dicts else tuple(last[-2:])
+    if as_dicts:
+        return _drop_extras(rows[:limit], columns, extra), next_key
+    return [row[:-2] for row in rows[:limit]], next_key
+
+def get_detections_since(limit: int, since_id: int = None, since_epoch_ms: int = None, fields=None,
+                         as_dicts=False):
+    """
+    Fetches detections added after a cursor, oldest first, so a poller can continue from the
+    last row it received. since_id is a primary key range scan, since_epoch_ms uses idx_detections_time.
+    Args:
+        limit (int): Maximum number of rows to return.
+        since_id (int): Only rows with a greater id.
+        since_epoch_ms (int): Only rows with a later time.
+        fields (list): Columns to return (subset of DETECTION_COLUMNS); all columns if None.
+        as_dicts (bool): Return each row as a dict keyed by field instead of a tuple.
+    Returns:
+        tuple: (rows as tuples in the order of fields, id of the last row if more rows are waiting
+        after these, else None). The id is read even when fields leaves it out.
+    Raises:
+        ValueError: If fields contains an unknown column.
+    """
+    columns = check_fields(fields)
+    extra = ('id',)
+    select, decode = _detection_reader(columns, extra=extra, as_dicts=as_dicts)
+    if since_id is not None:
+        query, params = " WHERE id > ? ORDER BY id", [since_id]
+    else:
+        query, params = " WHERE epoch_ms > ? ORDER BY epoch_ms, id", [since_epoch_ms]
+    with connect_db() as conn:
+        rows = _fetch_detections(conn, f"SELECT {select} FROM detections" + query + " LIMIT ?",
+                                 params + [limit + 1], decode, as_dicts)
+    next_id = None
+    if len(rows) > limit:
+        next_id = rows[limit - 1]['id'] if as_dicts else rows[limit - 1][-1]
+    if as_dicts:
+        return _drop_extras(rows[:limit], columns, extra), next_id
+    return [row[:-1] for row in rows[:limit]], next_id
+
+def get_latest_detection_id():
+    """Id of the newest detection (0 if there are none); a single lookup at the end of the primary key."""
+    with connect_db() as conn:
+        return conn.execute('SELECT MAX(id) FROM detections').fetchone()[0] or 0
+
+def get_detections_in_time_range(start_timestamp: str, end_timestamp: str, as_dicts=False, database: str = None):
     """
     Fetches detection records within a specified time range (ISO 8601 format).
     Args:
         start_timestamp (str): Start of the time range (e.g., '2023-01-01T00:00:00.000000')
         end_timestamp (str): End of the time range (e.g., '2023-01-01T23:59:59.999999')
+        as_dicts (bool): Return each row as a dict keyed by column instead of a tuple.
+        database (str): Database file; DATABASE_NAME if None.
     Returns:
         list: A list of detection records.
+    Raises:
+        ValueError: If a timestamp is not valid ISO 8601.
+    """
+    start_ms, end_ms = to_epoch_ms(start_timestamp), to_epoch_ms(end_timestamp)
+    extra = ('epoch_ms',)
+    select, decode = _detection_reader(DETECTION_COLUMNS, extra=extra, as_dicts=as_dicts, database=database)
+    with connect_db(database) as conn:
+        detections = _fetch_detections(conn, f'''
+            SELECT {select} FROM detections
+            WHERE epoch_ms BETWEEN ? AND ?
+            ORDER BY epoch_ms DESC, id DESC
+        ''', (start_ms, end_ms), decode, as_dicts)
+    # When the window reaches data moved out by retention, merge in the matching archived rows
+    partitions = get_archive_partitions(start_ms, end_ms, database)
+    for path in partitions:
+        archived = read_archive(path, start_ms, end_ms)
+        detections.extend([dict(zip(ARCHIVE_COLUMNS, row)) for row in archived] if as_dicts else archived)
+    if as_dicts:
+        if partitions:
+            detections.sort(key=itemgetter('epoch_ms', 'id'), reverse=True)
+        return _drop_extras(detections, DETECTION_COLUMNS, extra)
+    if partitions:
+        detections.sort(key=lambda row: (row[-1], row[0]), reverse=True)
+    return [row[:-1] for row in detections]
+
+def search_detections(match: str = None, start_ms: int = None, end_ms: int = None, limit: int = 50,
+                      offset: int = 0, fields=None, as_dicts=False):
+    """
+    Full-text search over labels, video names and free-text notes, best matches (bm25) first and
+    newest first among equal matches, optionally limited to [start_ms, end_ms]. Without a match expression the window is listed
+    newest first. Detections moved to archives by retention are not searched.
+    Args:
+        match (str): FTS5 MATCH expression (see utils.search_query.to_fts_query).
+        limit (int): Maximum number of rows to return.
+        offset (int): Number of results to skip (for the following pages).
+        fields (list): Columns to return (subset of DETECTION_COLUMNS); all columns if None.
+        as_dicts (bool): Return each row as a dict keyed by field instead of a tuple.
+    Returns:
+        tuple: (rows as tuples in the order of fields, True if more results follow).
+    Raises:
+        ValueError: If fields contains an unknown column or match is not a valid expression.
     """
+    select, decode = _detection_reader(check_fields(fields), as_dicts=as_dicts)
+    where, params = [], []
+    if start_ms is not None:
+        where.append('epoch_ms >= ?')
+        params.append(start_ms)
+    if end_ms is not None:
+        where.append('epoch_ms <= ?')
+        params.append(end_ms)
+    where = (' WHERE ' + ' AND '.join(where)) if where else ''
+    if match:
+        query = (f'WITH hits AS (SELECT rowid AS id, rank FROM detections_fts WHERE detections_fts MATCH ?) '
+                 f'SELECT {select} FROM detections JOIN hits USING (id){where} ORDER BY hits.rank, epoch_ms DESC, id DESC')
+        params.insert(0, match)
+    else:
+        query = f'SELECT {select} FROM detections{where} ORDER BY epoch_ms DESC, id DESC'
     with connect_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT * FROM detections
-            WHERE timestamp BETWEEN ? AND ?
-            ORDER BY timestamp DESC
-        ''', (start_timestamp, end_timestamp))
-        detections = cursor.fetchall()
-    return detections
+        try:
+            rows = _fetch_detections(conn, query + ' LIMIT ? OFFSET ?', params + [limit + 1, offset], decode, as_dicts)
+        except sqlite3.OperationalError as e:
+            if 'fts5' in str(e):
+                raise ValueError(f"Invalid search expression: {e}")
+            raise
+    return rows[:limit], len(rows) > limit
+
+def iter_detection_chunks(start_ms: int = None, end_ms: int = None, fields=None, chunk_size: int = 1000,
+                          include_archives: bool = True, database: str = None):
+    """
+    Yields detections in [start_ms, end_ms] as lists of at most chunk_size row tuples (in the order
+    of fields), oldest first: archived partitions that overlap the window, then the hot table.
+    Each hot chunk is a separate keyset query on (epoch_ms, id), so a slow consumer never holds a
+    pooled connection or a long-lived read snapshot, and memory stays bounded by one chunk
+    (or one archived day).
+    Raises:
+        ValueError: If fields contains an unknown column.
+    """
+    columns = check_fields(fields)
+    return _iter_detection_chunks(columns, start_ms, end_ms, chunk_size, include_archives, database)
 
-def get_detection_counts_by_fruit():
-    """Counts detections by fruit type."""
+def _iter_detection_chunks(columns, start_ms, end_ms, chunk_size, include_archives, database=None):
+    indexes = [DETECTION_COLUMNS.index(column) for column in columns]
+    if include_archives:
+        for path in get_archive_partitions(start_ms, end_ms, database):
+            rows = read_archive(path, start_ms, end_ms)
+            rows.sort(key=lambda row: (row[-1], row[0]))
+            for offset in range(0, len(rows), chunk_size):
+                yield [tuple(row[i] for i in indexes) for row in rows[offset:offset + chunk_size]]
+
+    select, decode = _detection_reader(columns, extra=('epoch_ms', 'id'), database=database)
+    after = (start_ms if start_ms is not None else -2 ** 62, -1) # (epoch_ms, id) strictly before the first row
+    while True:
+        query = f"SELECT {select} FROM detections WHERE (epoch_ms, id) > (?, ?)"
+        params = list(after)
+        if end_ms is not None:
+            query += " AND epoch_ms <= ?"
+            params.append(end_ms)
+        with connect_db(database) as conn:
+            rows = conn.execute(query + " ORDER BY epoch_ms, id LIMIT ?", params + [chunk_size]).fetchall()
+        if not rows:
+            return
+        yield [decode(row)[:-2] for row in rows]
+        after = (rows[-1][-2], rows[-1][-1])
+
+def get_archive_partitions(start_ms: int = None, end_ms: int = None, database: str = None) -> list:
+    """Paths of the archive files whose day overlaps [start_ms, end_ms] (all archives if no bounds)."""
+    with connect_db(database) as conn:
+        rows = conn.execute('''
+            SELECT path FROM detection_archive_partitions
+            WHERE day_end_ms > COALESCE(?, day_end_ms - 1) AND day_start_ms <= COALESCE(?, day_start_ms)
+            ORDER BY day_start_ms
+        ''', (start_ms, end_ms)).fetchall()
+    return [row[0] for row in rows]
+
+def iter_detections_for_archive(day_start_ms: int, day_end_ms: int, chunk_size: int = 50000):
+    """
+    Yields chunks of hot detections in [day_start_ms, day_end_ms), oldest first, with epoch_ms
+    appended to each row (the layout of utils.detection_archive.ARCHIVE_COLUMNS).
+    """
+    select, decode = _detection_reader(DETECTION_COLUMNS, extra=('epoch_ms',))
+    last_id = 0
+    while True:
+        with connect_db() as conn:
+            rows = conn.execute(f'''
+                SELECT {select} FROM detections
+                WHERE epoch_ms >= ? AND epoch_ms < ? AND id > ? ORDER BY id LIMIT ?
+            ''', (day_start_ms, day_end_ms, last_id, chunk_size)).fetchall()
+        if not rows:
+            return
+        rows = [decode(row) for row in rows]
+        yield rows
+        last_id = rows[-1][0]
+
+def record_archive_partition(path: str, day_start_ms: int, day_end_ms: int, row_count: int, max_id: int):
+    """
+    Registers an archive file and deletes the rows it holds from the hot table in one transaction.
+    Rollups are left untouched, so aggregates still cover archived (and later expired) data.
+    """
     with connect_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT fruit_type, COUNT(*) FROM detections GROUP BY fruit_type')
-        return cursor.fetchall()
+        conn.execute('''
+            INSERT INTO detection_archive_partitions (path, day_start_ms, day_end_ms, row_count, max_id, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (path, day_start_ms, day_end_ms, row_count, max_id, datetime.now().isoformat()))
+        conn.execute('DELETE FROM detections WHERE epoch_ms >= ? AND epoch_ms < ? AND id <= ?',
+                     (day_start_ms, day_end_ms, max_id))
+        conn.commit()
 
-def get_detection_counts_by_disease():
-    """Counts detections by disease type."""
+def claim_archive_day(day_start_ms: int, owner: str, lease_seconds: float) -> bool:
+    """
+    Claims a day for archiving by owner for lease_seconds. Returns False while another owner holds
+    an unexpired claim; the claim of a pass that crashed is taken over once its lease has run out.
+    """
+    now_ms = int(time.time() * 1000)
     with connect_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT disease, COUNT(*) FROM detections GROUP BY disease')
-        return cursor.fetchall()
+        # The upsert takes the write lock, so the claim and the check below are one atomic step
+        conn.execute('''
+            INSERT INTO detection_archive_claims (day_start_ms, owner, expires_ms) VALUES (?, ?, ?)
+            ON CONFLICT (day_start_ms) DO UPDATE SET owner = excluded.owner, expires_ms = excluded.expires_ms
+            WHERE detection_archive_claims.owner = excluded.owner OR detection_archive_claims.expires_ms < ?
+        ''', (day_start_ms, owner, now_ms + int(lease_seconds * 1000), now_ms))
+        claimed = conn.execute('SELECT owner FROM detection_archive_claims WHERE day_start_ms = ?',
+                               (day_start_ms,)).fetchone()[0] == owner
+        conn.commit()
+    return claimed
+
+def release_archive_day(day_start_ms: int, owner: str):
+    """Drops owner's claim on a day (after its archive was recorded or abandoned)."""
+    with connect_db() as conn:
+        conn.execute('DELETE FROM detection_archive_claims WHERE day_start_ms = ? AND owner = ?', (day_start_ms, owner))
+        conn.commit()
+
+def get_claimed_archive_days() -> list:
+    """Start (epoch ms) of the days some retention pass currently holds an unexpired claim on."""
+    with connect_db() as conn:
+        rows = conn.execute('SELECT day_start_ms FROM detection_archive_claims WHERE expires_ms >= ?',
+                            (int(time.time() * 1000),)).fetchall()
+    return [row[0] for row in rows]
+
+def delete_archive_partitions_before(cutoff_ms: int) -> list:
+    """Forgets archive files of days ending before cutoff_ms and returns their paths (to be removed)."""
+    with connect_db() as conn:
+        paths = [row[0] for row in conn.execute(
+            'SELECT path FROM detection_archive_partitions WHERE day_end_ms <= ?', (cutoff_ms,)).fetchall()]
+        conn.execute('DELETE FROM detection_archive_partitions WHERE day_end_ms <= ?', (cutoff_ms,))
+        conn.commit()
+    return paths
+
+def _rollup_window(start_timestamp=None, end_timestamp=None):
+    """
+    Picks the rollup granularity and bucket bounds for an optional time window. All-time totals
+    read the daily rollups; windows read hourly buckets, so they are resolved to whole hours.
+    """
+    if start_timestamp is None and end_timestamp is None:
+        return 'day', None, None
+    start_bucket = bucket_start_ms(to_epoch_ms(start_timestamp), 'hour') if start_timestamp else None
+    end_ms = to_epoch_ms(end_timestamp) if end_timestamp else None
+    return 'hour', start_bucket, end_ms
+
+_aggregate_caches = {}
+_aggregate_caches_lock = threading.Lock()
+_label_maps = {}
+
+def _load_labels(database):
+    with connect_db(database) as conn:
+        return conn.execute("SELECT kind, id, name FROM labels UNION ALL SELECT 'video', id, name FROM videos").fetchall()
+
+def get_label_map(database: str = None) -> LabelMap:
+    """In-memory map between the label/video ids stored in detections and their strings."""
+    database = database or DATABASE_NAME
+    with _aggregate_caches_lock:
+        labels = _label_maps.get(database)
+        if labels is None:
+            labels = _label_maps[database] = LabelMap(lambda: _load_labels(database))
+        return labels
+
+def _load_aggregates(database):
+    with connect_db(database) as conn:
+        rows = conn.execute("SELECT NULLIF(fruit_type, ''), NULLIF(disease, ''), SUM(count) FROM detection_rollups "
+                            "WHERE granularity = 'day' GROUP BY fruit_type, disease").fetchall()
+    by_fruit, by_disease, total = {}, {}, 0
+    for fruit_type, disease, count in rows:
+        by_fruit[fruit_type] = by_fruit.get(fruit_type, 0) + count
+        by_disease[disease] = by_disease.get(disease, 0) + count
+        total += count
+    return total, by_fruit, by_disease
+
+def get_aggregate_cache(database: str = None) -> AggregateCache:
+    """In-memory all-time aggregates of a database, kept current by the insert path."""
+    database = database or DATABASE_NAME
+    with _aggregate_caches_lock:
+        cache = _aggregate_caches.get(database)
+        if cache is None:
+            cache = _aggregate_caches[database] = AggregateCache(lambda: _load_aggregates(database))
+        return cache
+
+def _commit_detections(conn, detections, inserted_ids, database=None):
+    """
+    Commits an insert transaction and applies its detections to the aggregate cache, in that order,
+    then feeds them to the alert rules (only committed detections can raise an alert).
+    """
+    cache = get_aggregate_cache(database)
+    with cache.committing():
+        conn.commit()
+        cache.apply([(d.get('fruit_type'), d.get('disease')) for d in detections])
+    alert_engine = get_alert_engine(database)
+    if alert_engine.has_rules:
+        now_ms = int(time.time() * 1000)
+        alert_engine.observe([(detection_id, _iso_to_epoch_ms_or_null(d.get('timestamp')) or now_ms, d.get('disease'),
+                               d.get('video_name') or parse_legacy_notes(d.get('notes'))[0])
+                              for d, detection_id in zip(detections, inserted_ids)])
+
+_alert_engines = {}
+
+def _load_alert_rules(database):
+    with connect_db(database) as conn:
+        rows = conn.execute(f"SELECT {', '.join(ALERT_RULE_FIELDS)} FROM alert_rules ORDER BY id").fetchall()
+    return [dict(zip(ALERT_RULE_FIELDS, row)) for row in rows]
+
+def get_alert_engine(database: str = None) -> AlertEngine:
+    """
+    In-memory alert rule engine of a database. Alerts are posted to the rule's webhook_url (or
+    ALERT_WEBHOOK_URL); services subscribe to it for local delivery.
+    """
+    database = database or DATABASE_NAME
+    with _aggregate_caches_lock:
+        engine = _alert_engines.get(database)
+        if engine is None:
+            engine = _alert_engines[database] = AlertEngine(lambda: _load_alert_rules(database))
+            engine.subscribe(WebhookNotifier(ALERT_WEBHOOK_URL))
+        return engine
+
+def create_alert_rule(min_count: int, window_minutes: float, disease: str = None, video_name: str = None,
+                      name: str = None, webhook_url: str = None):
+    """
+    Adds an alert rule: at least min_count non-healthy detections of disease within window_minutes
+    in video_name. disease None matches any disease, video_name None every video (each on its own).
+    Returns:
+        dict: The stored rule.
+    Raises:
+        ValueError: If min_count or window_minutes is not positive, or webhook_url is not an http(s) URL.
+    """
+    if int(min_count) < 1 or float(window_minutes) <= 0:
+        raise ValueError("'min_count' must be at least 1 and 'window_minutes' positive.")
+    if webhook_url is not None:
+        check_webhook_url(webhook_url)
+    with connect_db() as conn:
+        cursor = conn.execute('''
+            INSERT INTO alert_rules (name, disease, video_name, min_count, window_minutes, webhook_url, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (name, disease, video_name, int(min_count), float(window_minutes), webhook_url, datetime.now().isoformat()))
+        rule_id = cursor.lastrowid
+    get_alert_engine().reload()
+    return next(rule for rule in get_alert_rules() if rule['id'] == rule_id)
+
+def get_alert_rules():
+    """All alert rules, as dicts with ALERT_RULE_FIELDS."""
+    return _load_alert_rules(DATABASE_NAME)
+
+def delete_alert_rule(rule_id: int) -> bool:
+    """Removes an alert rule; returns False if it did not exist."""
+    with connect_db() as conn:
+        deleted = conn.execute('DELETE FROM alert_rules WHERE id = ?', (rule_id,)).rowcount > 0
+    if deleted:
+        get_alert_engine().reload()
+    return deleted
+
+def get_rollup_counts(group_by=None, start_timestamp=None, end_timestamp=None, database=None):
+    """
+    Counts detections from the rollup tables, optionally grouped by one label and limited to a window.
+    The cost depends on the number of buckets and labels, not on the number of detections.
+    Args:
+        group_by (str): 'fruit_type', 'disease' or 'ripeness'; None for the total.
+        start_timestamp (str): Optional ISO 8601 start of the window.
+        end_timestamp (str): Optional ISO 8601 end of the window.
+        database (str): Database file; DATABASE_NAME if None.
+    Returns:
+        list: (label, count) tuples, or the total as an int if group_by is None.
+    Raises:
+        ValueError: If group_by or a timestamp is invalid.
+    """
+    if group_by not in (None, 'fruit_type', 'disease', 'ripeness'):
+        raise ValueError(f"Cannot group detections by '{group_by}'.")
+    granularity, start_bucket, end_ms = _rollup_window(start_timestamp, end_timestamp)
+    query = 'FROM detection_rollups WHERE granularity = ?'
+    params = [granularity]
+    if start_bucket is not None:
+        query += ' AND bucket_start_ms >= ?'
+        params.append(start_bucket)
+    if end_ms is not None:
+        query += ' AND bucket_start_ms <= ?'
+        params.append(end_ms)
+    with connect_db(database) as conn:
+        if group_by is None:
+            return conn.execute('SELECT COALESCE(SUM(count), 0) ' + query, params).fetchone()[0]
+        return conn.execute(f"SELECT NULLIF({group_by}, ''), SUM(count) {query} GROUP BY {group_by}",
+                            params).fetchall()
+
+TREND_INTERVALS = {'minute': 60 * 1000, 'hour': 3600 * 1000, 'day': 24 * 3600 * 1000}
+TREND_MAX_BUCKETS = 20000
+
+def _like_pattern(text):
+    """Case-insensitive 'contains' pattern for LIKE ... ESCAPE '\\'."""
+    return '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+def get_detection_trend(interval: str, start_timestamp: str, end_timestamp: str, group_by: str = None,
+                        filters: dict = None):
+    """
+    Counts and mean confidences of detections per time bucket, optionally per label. Hourly and
+    daily buckets (local time) are read from the rollups, so archived and expired days are
+    included; minute buckets are aggregated in SQL over idx_detections_time from the hot table.
+    Either way the work and the result depend on the number of buckets, not of detections.
+    Args:
+        interval (str): 'minute', 'hour' or 'day'.
+        start_timestamp (str): ISO 8601 start of the range.
+        end_timestamp (str): ISO 8601 end of the range.
+        group_by (str): 'fruit_type', 'disease' or 'ripeness'; None for one series.
+        filters (dict): label column -> text the label must contain (case-insensitive), e.g. {'disease': 'scab'}.
+    Returns:
+        list: (bucket_start_ms, label or None, count, mean confidence_fruit, mean confidence_ripeness,
+               mean confidence_disease) tuples ordered by bucket; means are None without confidences.
+    Raises:
+        ValueError: If an argument is invalid or the range spans more than TREND_MAX_BUCKETS buckets.
+    """
+    if interval not in TREND_INTERVALS:
+        raise ValueError(f"Unknown interval '{interval}' (choose from {', '.join(TREND_INTERVALS)}).")
+    if group_by not in (None,) + LABEL_KINDS:
+        raise ValueError(f"Cannot group detections by '{group_by}'.")
+    filters = {column: value for column, value in (filters or {}).items() if value}
+    unknown = [column for column in filters if column not in LABEL_KINDS]
+    if unknown:
+        raise ValueError(f"Cannot filter detections by {', '.join(unknown)}.")
+    start_ms, end_ms = to_epoch_ms(start_timestamp), to_epoch_ms(end_timestamp)
+    if start_ms > end_ms:
+        raise ValueError("The start of the range is after its end.")
+    if (end_ms - start_ms) // TREND_INTERVALS[interval] + 1 > TREND_MAX_BUCKETS:
+        raise ValueError(f"The range holds more than {TREND_MAX_BUCKETS} {interval} buckets; use a longer interval.")
+
+    if interval == 'minute':
+        conditions, params = ['epoch_ms BETWEEN ? AND ?'], [start_ms, end_ms]
+        for column, value in filters.items():
+            conditions.append(f"{column}_id IN (SELECT id FROM labels WHERE kind = ? AND name LIKE ? ESCAPE '\\')")
+            params.extend([column, _like_pattern(value)])
+        label = f'{group_by}_id' if group_by else 'NULL'
+        query = f'''
+            SELECT epoch_ms / 60000 * 60000, {label}, COUNT(*),
+                   AVG(confidence_fruit), AVG(confidence_ripeness), AVG(confidence_disease)
+            FROM detections WHERE {' AND '.join(conditions)}
+            GROUP BY 1, 2 ORDER BY 1
+        '''
+    else:
+        conditions = ['granularity = ?', 'bucket_start_ms BETWEEN ? AND ?']
+        params = [interval, bucket_start_ms(start_ms, interval), end_ms]
+        for column, value in filters.items():
+            conditions.append(f"{column} LIKE ? ESCAPE '\\'")
+            params.append(_like_pattern(value))
+        label = f"NULLIF({group_by}, '')" if group_by else 'NULL'
+        query = f'''
+            SELECT bucket_start_ms, {label}, SUM(count),
+                   SUM(sum_confidence_fruit) / NULLIF(SUM(n_confidence_fruit), 0),
+                   SUM(sum_confidence_ripeness) / NULLIF(SUM(n_confidence_ripeness), 0),
+                   SUM(sum_confidence_disease) / NULLIF(SUM(n_confidence_disease), 0)
+            FROM detection_rollups WHERE {' AND '.join(conditions)}
+            GROUP BY 1, 2 ORDER BY 1
+        '''
+    with connect_db() as conn:
+        rows = conn.execute(query, params).fetchall()
+    if interval == 'minute' and group_by:
+        labels = get_label_map()
+        rows = [(bucket, labels.name(group_by, label_id)) + tuple(rest) for bucket, label_id, *rest in rows]
+    return rows
+
+def get_detection_counts_by_fruit(start_timestamp=None, end_timestamp=None):
+    """
+    Counts detections by fruit type. All-time counts come from the in-memory aggregate cache;
+    a time window is answered from the rollups.
+    """
+    if start_timestamp is None and end_timestamp is None:
+        return get_aggregate_cache().counts_by_fruit()
+    return get_rollup_counts('fruit_type', start_timestamp, end_timestamp)
+
+def get_detection_counts_by_disease(start_timestamp=None, end_timestamp=None):
+    """
+    Counts detections by disease type. All-time counts come from the in-memory aggregate cache;
+    a time window is answered from the rollups.
+    """
+    if start_timestamp is None and end_timestamp is None:
+        return get_aggregate_cache().counts_by_disease()
+    return get_rollup_counts('disease', start_timestamp, end_timestamp)
 
 def get_latest_detection_by_disease(disease_name):
     """Gets the timestamp of the latest detection for a specific disease."""
+    disease_id = get_label_map().id_of('disease', disease_name)
+    if disease_id is None:
+        return None
     with connect_db() as conn:
         cursor = conn.cursor()
-        cursor.execute('SELECT timestamp FROM detections WHERE disease = ? ORDER BY timestamp DESC LIMIT 1', (disease_name,))
+        cursor.execute('SELECT timestamp FROM detections WHERE disease_id = ? ORDER BY epoch_ms DESC, id DESC LIMIT 1', (disease_id,))
         result = cursor.fetchone()
         return result[0] if result else None
 
-def get_total_detections():
-    """Gets the total number of detections."""
-    with connect_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM detections')
-        return cursor.fetchone()[0]
+def get_total_detections(start_timestamp=None, end_timestamp=None):
+    """Gets the total number of detections (from the aggregate cache), or within a time window (from the rollups)."""
+    if start_timestamp is None and end_timestamp is None:
+        return get_aggregate_cache().total()
+    return get_rollup_counts(None, start_timestamp, end_timestamp)
 
 # Example Usage (for testing)
 if __name__ == "__main__":
@@ -126,14 +1506,7 @@ if __name__ == "__main__":
     time.sleep(0.1)
     # Simulate a detection from a previous day
     yesterday = (datetime.now() - timedelta(days=1)).isoformat()
-    conn = sqlite3.connect(DATABASE_NAME)
-    c = conn.cursor()
-    c.execute('''
-        INSERT INTO detections (timestamp, fruit_type, ripeness, disease, notes)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (yesterday, "banana", "ripe", "Banana___healthy", "Yesterday's banana"))
-    conn.commit()
-    conn.close()
+    insert_detection("banana", "ripe", "Banana___healthy", notes="Yesterday's banana", timestamp=yesterday)
 
     start_of_today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
     end_of_today = datetime.now().replace(hour=23, minute=59, second=59, microsecond=999999).isoformat()
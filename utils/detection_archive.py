@@ -0,0 +1,114 @@
+# detection_archive.py
+
+import gzip
+import json
+import os
+import tempfile
+
+# Parquet needs pyarrow (optional). Without it archives are written as gzip-compressed NDJSON.
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# Columns of an archived detection: the detections table columns plus the integer time
+ARCHIVE_COLUMNS = ('id', 'timestamp', 'fruit_type', 'ripeness', 'disease',
+                   'confidence_fruit', 'confidence_ripeness', 'confidence_disease',
+                   'image_capture_path', 'notes', 'job_id', 'epoch_ms')
+
+
+def archive_extension() -> str:
+    return '.parquet' if pq is not None else '.ndjson.gz'
+
+
+def parquet_schema(columns=ARCHIVE_COLUMNS):
+    """Arrow schema for detection rows with the given columns (subset of ARCHIVE_COLUMNS)."""
+    string, integer, real = pa.string(), pa.int64(), pa.float64()
+    types = {'id': integer, 'job_id': integer, 'epoch_ms': integer,
+             'confidence_fruit': real, 'confidence_ripeness': real, 'confidence_disease': real}
+    return pa.schema([(column, types.get(column, string)) for column in columns])
+
+
+def rows_to_arrow_table(rows: list, columns=ARCHIVE_COLUMNS):
+    """Builds an Arrow table from row tuples laid out as columns."""
+    schema = parquet_schema(columns)
+    values = list(zip(*rows)) if rows else [[] for _ in columns]
+    return pa.Table.from_arrays([pa.array(column_values, type=field.type)
+                                 for column_values, field in zip(values, schema)], schema=schema)
+
+
+class ArchiveWriter:
+    def __init__(self, path: str):
+        """
+        Streams detection rows (tuples in ARCHIVE_COLUMNS order) into one compressed archive file.
+        Data goes to a uniquely named temporary file next to it that is fsynced and renamed into
+        place by close(), so a crash never leaves a truncated archive under the final name.
+        """
+        self.path = path
+        self.row_count = 0
+        descriptor, self._temporary_path = tempfile.mkstemp(suffix='.tmp', prefix=os.path.basename(path) + '.',
+                                                            dir=os.path.dirname(path) or '.')
+        os.close(descriptor)
+        if pq is not None:
+            self._writer = pq.ParquetWriter(self._temporary_path, parquet_schema(), compression='zstd')
+        else:
+            self._file = gzip.open(self._temporary_path, 'wt', encoding='utf-8')
+
+    def write_rows(self, rows: list):
+        if not rows:
+            return
+        if pq is not None:
+            self._writer.write_table(rows_to_arrow_table(rows))
+        else:
+            for row in rows:
+                self._file.write(json.dumps(dict(zip(ARCHIVE_COLUMNS, row))) + '\n')
+        self.row_count += len(rows)
+
+    def close(self) -> str:
+        if pq is not None:
+            self._writer.close()
+        else:
+            self._file.close()
+        with open(self._temporary_path, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(self._temporary_path, self.path)
+        return self.path
+
+    def abort(self):
+        """Discards a partially written archive."""
+        try:
+            if pq is not None:
+                self._writer.close()
+            else:
+                self._file.close()
+        finally:
+            if os.path.exists(self._temporary_path):
+                os.remove(self._temporary_path)
+
+
+def read_archive(path: str, start_ms: int = None, end_ms: int = None) -> list:
+    """
+    Reads archived detections, optionally only those with start_ms <= epoch_ms <= end_ms.
+
+    Returns:
+        list: Tuples in ARCHIVE_COLUMNS order.
+    """
+    if path.endswith('.parquet'):
+        if pq is None:
+            raise RuntimeError(f"Reading {path} requires pyarrow.")
+        filters = []
+        if start_ms is not None:
+            filters.append(('epoch_ms', '>=', start_ms))
+        if end_ms is not None:
+            filters.append(('epoch_ms', '<=', end_ms))
+        table = pq.read_table(path, columns=list(ARCHIVE_COLUMNS), filters=filters or None)
+        return list(zip(*(table.column(column).to_pylist() for column in ARCHIVE_COLUMNS)))
+    rows = []
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            epoch_ms = record['epoch_ms']
+            if (start_ms is None or epoch_ms >= start_ms) and (end_ms is None or epoch_ms <= end_ms):
+                rows.append(tuple(record[column] for column in ARCHIVE_COLUMNS))
+    return rows
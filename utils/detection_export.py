@@ -0,0 +1,95 @@
+# detection_export.py
+
+import csv
+import io
+
+from utils.detection_archive import pq, rows_to_arrow_table
+from utils.serialization import dumps_lines
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+class _ChunkSink:
+    """Write-only file object that hands out whatever was written since the last take()."""
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data, self._chunks = b''.join(self._chunks), []
+        return data
+
+
+def _ndjson(chunks, columns):
+    for rows in chunks:
+        yield dumps_lines(dict(zip(columns, row)) for row in rows)
+
+
+def _csv(chunks, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _parquet(chunks, columns):
+    # One row group per chunk; bytes are sent as soon as each row group is written and the footer comes last
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, rows_to_arrow_table([], columns).schema, compression='zstd')
+    try:
+        for rows in chunks:
+            writer.write_table(rows_to_arrow_table(rows, columns))
+            data = sink.take()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+def stream_export(chunks, columns: list, export_format: str):
+    """
+    Encodes detection row chunks (see database_manager.iter_detection_chunks) incrementally.
+
+    Args:
+        chunks (iterable): Lists of row tuples in the order of columns.
+        columns (list): Column names.
+        export_format (str): 'ndjson', 'csv' or 'parquet'.
+    Returns:
+        generator: str or bytes pieces of the encoded output.
+    Raises:
+        ValueError: For an unknown format, or 'parquet' without pyarrow installed.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format '{export_format}' (choose from {', '.join(EXPORT_FORMATS)}).")
+    if export_format == 'parquet':
+        if pq is None:
+            raise ValueError("Parquet export requires pyarrow to be installed.")
+        return _parquet(chunks, columns)
+    return _ndjson(chunks, columns) if export_format == 'ndjson' else _csv(chunks, columns)
@@ -0,0 +1,345 @@
+# detection_store.py
+
+import os
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+from utils import database_manager
+from utils.database_manager import DETECTION_COLUMNS, check_fields, compose_notes, parse_legacy_notes, to_epoch_ms
+
+# Optional backends: DuckDB for analytic scans, Postgres (psycopg2) for writers on several nodes
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+try:
+    import psycopg2
+    import psycopg2.extras
+    import psycopg2.pool
+except ImportError:
+    psycopg2 = None
+
+# Backend selection: DETECTION_STORE=sqlite|duckdb|postgres; DETECTION_STORE_DSN is the DuckDB file
+# or the Postgres connection string
+DETECTION_STORE = os.environ.get('DETECTION_STORE', 'sqlite')
+DETECTION_STORE_DSN = os.environ.get('DETECTION_STORE_DSN')
+DEFAULT_DUCKDB_PATH = 'plant_monitor.duckdb'
+DEFAULT_POSTGRES_DSN = 'dbname=plant_monitor host=localhost'
+POSTGRES_MIN_CONNECTIONS = 1
+POSTGRES_MAX_CONNECTIONS = 8
+
+# Row layout of the DuckDB and Postgres tables: text labels (both compress repeated strings on
+# their own), structured notes and the integer time
+_STORED_COLUMNS = ('id', 'timestamp', 'fruit_type', 'ripeness', 'disease',
+                   'confidence_fruit', 'confidence_ripeness', 'confidence_disease', 'image_capture_path',
+                   'video_name', 'frame_index', 'track_index', 'notes', 'job_id', 'epoch_ms')
+_STORED_SELECT = ', '.join(_STORED_COLUMNS)
+_GROUP_COLUMNS = ('fruit_type', 'disease', 'ripeness')
+
+
+def _stored_row(detection: dict, job_id=None) -> tuple:
+    """Detection dict (insert_detection keywords) as a _STORED_COLUMNS tuple without the id."""
+    timestamp = detection.get('timestamp') or datetime.now().isoformat()
+    if detection.get('video_name') is not None:
+        video_name, frame_index, track_index, notes = (detection['video_name'], detection.get('frame_index'),
+                                                       detection.get('track_index'), detection.get('notes'))
+    else:
+        video_name, frame_index, track_index, notes = parse_legacy_notes(detection.get('notes'))
+    return (timestamp, detection.get('fruit_type'), detection.get('ripeness'), detection.get('disease'),
+            detection.get('confidence_fruit'), detection.get('confidence_ripeness'), detection.get('confidence_disease'),
+            detection.get('image_capture_path'), video_name, frame_index, track_index, notes,
+            detection.get('job_id', job_id), to_epoch_ms(timestamp))
+
+
+def _public_row(row) -> tuple:
+    """_STORED_COLUMNS tuple -> DETECTION_COLUMNS tuple."""
+    return row[:9] + (compose_notes(*row[9:13]), row[13])
+
+
+def _check_group_by(group_by):
+    if group_by not in (None,) + _GROUP_COLUMNS:
+        raise ValueError(f"Cannot group detections by '{group_by}'.")
+
+
+class DetectionStore(ABC):
+    """
+    Storage backend for detections: single and batched inserts, time-range queries, label counts
+    and chunked streaming export. Rows are returned in the DETECTION_COLUMNS layout whatever the
+    backend. Times are ISO 8601 strings for queries and epoch milliseconds for export, as in
+    utils.database_manager.
+    """
+    name = None
+
+    @abstractmethod
+    def init(self):
+        """Creates the schema if needed."""
+
+    @abstractmethod
+    def insert_detections(self, detections: list, job_id: int = None) -> list:
+        """Inserts detection dicts in one transaction and returns their ids in order."""
+
+    def insert_detection(self, detection: dict) -> int:
+        return self.insert_detections([detection])[0]
+
+    @abstractmethod
+    def get_detections_in_time_range(self, start_timestamp: str, end_timestamp: str) -> list:
+        """Detections within the window, newest first."""
+
+    @abstractmethod
+    def get_counts(self, group_by: str = None, start_timestamp: str = None, end_timestamp: str = None):
+        """(label, count) tuples grouped by 'fruit_type', 'disease' or 'ripeness', or the total if group_by is None."""
+
+    @abstractmethod
+    def iter_detection_chunks(self, start_ms: int = None, end_ms: int = None, fields=None, chunk_size: int = 1000):
+        """Yields lists of at most chunk_size rows (in the order of fields), oldest first."""
+
+    def close(self):
+        pass
+
+
+class SQLiteDetectionStore(DetectionStore):
+    """
+    A monitoring database (utils.database_manager), DATABASE_NAME unless another file is given.
+    Inserts maintain the rollups and the aggregate cache, so windowed counts are resolved to
+    whole hours; export includes archived days.
+    """
+    name = 'sqlite'
+
+    def __init__(self, database: str = None):
+        self.database = database
+
+    def init(self):
+        database_manager.init_db(self.database)
+
+    def insert_detections(self, detections, job_id=None):
+        return database_manager.commit_detection_batch(detections, job_id=job_id, database=self.database)
+
+    def get_detections_in_time_range(self, start_timestamp, end_timestamp):
+        return database_manager.get_detections_in_time_range(start_timestamp, end_timestamp, database=self.database)
+
+    def get_counts(self, group_by=None, start_timestamp=None, end_timestamp=None):
+        return database_manager.get_rollup_counts(group_by, start_timestamp, end_timestamp, database=self.database)
+
+    def iter_detection_chunks(self, start_ms=None, end_ms=None, fields=None, chunk_size=1000):
+        return database_manager.iter_detection_chunks(start_ms, end_ms, fields, chunk_size, database=self.database)
+
+    def close(self):
+        database_manager.close_db_connections()
+
+
+class _SQLDetectionStore(DetectionStore):
+    """Queries shared by the DuckDB and Postgres stores; subclasses provide _execute and insert_detections."""
+    placeholder = '?'
+
+    def _after(self, after):
+        """Keyset condition for rows after (epoch_ms, id), with its parameters."""
+        p = self.placeholder
+        return f'(epoch_ms, id) > ({p}, {p})', list(after)
+
+    @abstractmethod
+    def _execute(self, query: str, params=()) -> list:
+        """Runs a query and returns the fetched rows."""
+
+    def get_detections_in_time_range(self, start_timestamp, end_timestamp):
+        p = self.placeholder
+        rows = self._execute(f'SELECT {_STORED_SELECT} FROM detections WHERE epoch_ms BETWEEN {p} AND {p} '
+                             'ORDER BY epoch_ms DESC, id DESC', (to_epoch_ms(start_timestamp), to_epoch_ms(end_timestamp)))
+        return [_public_row(row) for row in rows]
+
+    def get_counts(self, group_by=None, start_timestamp=None, end_timestamp=None):
+        _check_group_by(group_by)
+        p = self.placeholder
+        where, params = [], []
+        if start_timestamp:
+            where.append(f'epoch_ms >= {p}')
+            params.append(to_epoch_ms(start_timestamp))
+        if end_timestamp:
+            where.append(f'epoch_ms <= {p}')
+            params.append(to_epoch_ms(end_timestamp))
+        where = (' WHERE ' + ' AND '.join(where)) if where else ''
+        if group_by is None:
+            return self._execute('SELECT COUNT(*) FROM detections' + where, params)[0][0]
+        return [tuple(row) for row in self._execute(
+            f'SELECT {group_by}, COUNT(*) FROM detections{where} GROUP BY {group_by}', params)]
+
+    def iter_detection_chunks(self, start_ms=None, end_ms=None, fields=None, chunk_size=1000):
+        columns = check_fields(fields)
+        return self._iter_detection_chunks(columns, start_ms, end_ms, chunk_size)
+
+    def _iter_detection_chunks(self, columns, start_ms, end_ms, chunk_size):
+        indexes = [DETECTION_COLUMNS.index(column) for column in columns]
+        p = self.placeholder
+        after = (start_ms if start_ms is not None else -2 ** 62, -1)
+        while True:
+            condition, params = self._after(after)
+            query = f'SELECT {_STORED_SELECT} FROM detections WHERE {condition}'
+            if end_ms is not None:
+                query += f' AND epoch_ms <= {p}'
+                params.append(end_ms)
+            rows = self._execute(query + f' ORDER BY epoch_ms, id LIMIT {p}', params + [chunk_size])
+            if not rows:
+                return
+            yield [tuple(public[i] for i in indexes) for public in map(_public_row, rows)]
+            after = (rows[-1][-1], rows[-1][0])
+
+
+class DuckDBDetectionStore(_SQLDetectionStore):
+    """
+    DuckDB file for analytic scans: columnar storage with dictionary-compressed labels, so
+    counts and range scans over millions of rows read only the columns they need.
+    DuckDB allows one writing process; threads share the connection through cursors.
+    """
+    name = 'duckdb'
+
+    def __init__(self, path: str = DEFAULT_DUCKDB_PATH):
+        if duckdb is None:
+            raise RuntimeError("The DuckDB detection store requires the duckdb package.")
+        self.path = path
+        self._conn = duckdb.connect(path)
+        self._lock = threading.Lock()
+
+    def _after(self, after):
+        return '(epoch_ms > ? OR (epoch_ms = ? AND id > ?))', [after[0], after[0], after[1]]
+
+    def _execute(self, query, params=()):
+        cursor = self._conn.cursor()
+        try:
+            return cursor.execute(query, list(params)).fetchall()
+        finally:
+            cursor.close()
+
+    def init(self):
+        self._execute('CREATE SEQUENCE IF NOT EXISTS detection_ids START 1')
+        self._execute('''
+            CREATE TABLE IF NOT EXISTS detections (
+                id BIGINT PRIMARY KEY DEFAULT nextval('detection_ids'),
+                timestamp VARCHAR NOT NULL,
+                fruit_type VARCHAR,
+                ripeness VARCHAR,
+                disease VARCHAR,
+                confidence_fruit DOUBLE,
+                confidence_ripeness DOUBLE,
+                confidence_disease DOUBLE,
+                image_capture_path VARCHAR,
+                video_name VARCHAR,
+                frame_index INTEGER,
+                track_index INTEGER,
+                notes VARCHAR,
+                job_id BIGINT,
+                epoch_ms BIGINT
+            )
+        ''')
+
+    def insert_detections(self, detections, job_id=None):
+        rows = [_stored_row(d, job_id) for d in detections]
+        if not rows:
+            return []
+        with self._lock:
+            cursor = self._conn.cursor()
+            try:
+                # Ids are drawn up front, so the batch needs no RETURNING and they come back in order
+                ids = [row[0] for row in cursor.execute(
+                    "SELECT nextval('detection_ids') FROM range(?)", [len(rows)]).fetchall()]
+                cursor.execute('BEGIN TRANSACTION')
+                try:
+                    cursor.executemany(f"INSERT INTO detections ({_STORED_SELECT}) VALUES ({', '.join('?' * len(_STORED_COLUMNS))})",
+                                       [(detection_id,) + row for detection_id, row in zip(ids, rows)])
+                    cursor.execute('COMMIT')
+                except Exception:
+                    cursor.execute('ROLLBACK')
+                    raise
+            finally:
+                cursor.close()
+        return ids
+
+    def close(self):
+        self._conn.close()
+
+
+class PostgresDetectionStore(_SQLDetectionStore):
+    """
+    Postgres through a thread-safe psycopg2 connection pool, for writers on several nodes.
+    Batches go in with one multi-row INSERT ... RETURNING id.
+    """
+    name = 'postgres'
+    placeholder = '%s'
+
+    def __init__(self, dsn: str = DEFAULT_POSTGRES_DSN, min_connections: int = POSTGRES_MIN_CONNECTIONS,
+                 max_connections: int = POSTGRES_MAX_CONNECTIONS):
+        if psycopg2 is None:
+            raise RuntimeError("The Postgres detection store requires the psycopg2 package.")
+        self.dsn = dsn
+        self._pool = psycopg2.pool.ThreadedConnectionPool(min_connections, max_connections, dsn)
+
+    def _run(self, work):
+        """Runs work(cursor) in a transaction on a pooled connection."""
+        conn = self._pool.getconn()
+        try:
+            with conn, conn.cursor() as cursor:  # commits on success, rolls back on error
+                return work(cursor)
+        finally:
+            self._pool.putconn(conn)
+
+    def _execute(self, query, params=()):
+        def work(cursor):
+            cursor.execute(query, list(params))
+            return cursor.fetchall() if cursor.description else []
+        return self._run(work)
+
+    def init(self):
+        self._execute('''
+            CREATE TABLE IF NOT EXISTS detections (
+                id BIGSERIAL PRIMARY KEY,
+                timestamp TEXT NOT NULL,
+                fruit_type TEXT,
+                ripeness TEXT,
+                disease TEXT,
+                confidence_fruit DOUBLE PRECISION,
+                confidence_ripeness DOUBLE PRECISION,
+                confidence_disease DOUBLE PRECISION,
+                image_capture_path TEXT,
+                video_name TEXT,
+                frame_index INTEGER,
+                track_index INTEGER,
+                notes TEXT,
+                job_id BIGINT,
+                epoch_ms BIGINT
+            )
+        ''')
+        self._execute('CREATE INDEX IF NOT EXISTS idx_detections_time ON detections (epoch_ms, id)')
+        self._execute('CREATE INDEX IF NOT EXISTS idx_detections_disease_time ON detections (disease, epoch_ms)')
+        self._execute('CREATE INDEX IF NOT EXISTS idx_detections_fruit_time ON detections (fruit_type, epoch_ms)')
+
+    def insert_detections(self, detections, job_id=None):
+        rows = [_stored_row(d, job_id) for d in detections]
+        if not rows:
+            return []
+
+        def work(cursor):
+            # RETURNING rows come back in VALUES order for a single multi-row INSERT
+            returned = psycopg2.extras.execute_values(
+                cursor, f"INSERT INTO detections ({', '.join(_STORED_COLUMNS[1:])}) VALUES %s RETURNING id",
+                rows, page_size=len(rows), fetch=True)
+            return [row[0] for row in returned]
+        return self._run(work)
+
+    def close(self):
+        self._pool.closeall()
+
+
+def get_detection_store(backend: str = None, dsn: str = None) -> DetectionStore:
+    """
+    Opens the configured detection store (DETECTION_STORE / DETECTION_STORE_DSN unless given).
+    Raises:
+        ValueError: For an unknown backend.
+    """
+    backend = backend or DETECTION_STORE
+    dsn = dsn or DETECTION_STORE_DSN
+    if backend == 'sqlite':
+        return SQLiteDetectionStore(dsn)
+    if backend == 'duckdb':
+        return DuckDBDetectionStore(dsn or DEFAULT_DUCKDB_PATH)
+    if backend == 'postgres':
+        return PostgresDetectionStore(dsn or DEFAULT_POSTGRES_DSN)
+    raise ValueError(f"Unknown detection store '{backend}' (choose from sqlite, duckdb, postgres).")
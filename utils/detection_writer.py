@@ -0,0 +1,193 @@
+# detection_writer.py
+
+import sqlite3
+import threading
+import time
+
+from utils.database_manager import commit_detection_batch
+from utils.metrics import REGISTRY, hot_path_log
+
+writer_flushes_total = REGISTRY.counter('detection_writer_flushes_total', 'Transactions committed by the detection writer.')
+writer_rows_total = REGISTRY.counter('detection_writer_rows_total', 'Detection rows committed by the detection writer.')
+writer_errors_total = REGISTRY.counter('detection_writer_errors_total', 'Failed detection writer transactions.')
+writer_dropped_rows_total = REGISTRY.counter('detection_writer_dropped_rows_total', 'Detection rows the writer could not commit and dropped.')
+writer_pending_rows = REGISTRY.gauge('detection_writer_pending_rows', 'Detection rows waiting to be committed.')
+
+
+class DetectionWriter:
+    def __init__(self, max_rows: int = 200, max_delay: float = 1.0, retry_delay: float = 1.0, max_attempts: int = 5):
+        """
+        Write-behind buffer for detections. Callers hand over rows (and optionally a job
+        checkpoint) and return immediately; a background thread commits everything buffered
+        in one executemany transaction once max_rows rows are waiting or the oldest entry is
+        max_delay seconds old. Checkpoints travel with their rows, so a stored checkpoint
+        never runs ahead of the detections it covers.
+
+        Only transient errors (a locked or busy database) are retried, at most max_attempts times.
+        If the batch still fails its rows are committed one at a time, so a bad row is logged and
+        dropped instead of holding up everything buffered behind it.
+
+        Args:
+            max_rows (int): Row count that triggers a flush.
+            max_delay (float): Longest time (seconds) a submitted entry waits before being committed.
+            retry_delay (float): Pause before retrying a failed transaction.
+            max_attempts (int): Attempts per transaction when the database is locked or busy.
+        """
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        self._condition = threading.Condition()
+        self._entries = []  # (ticket, detections, job_id, checkpoint, on_commit)
+        self._pending_rows = 0
+        self._oldest_time = None
+        self._submitted = 0
+        self._committed = 0
+        self._flush_requested = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='detection_writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, detections: list, job_id: int = None, checkpoint: tuple = None, on_commit=None) -> int:
+        """
+        Buffers detections for job_id, optionally with the checkpoint (last_committed_frame, total_frames)
+        that becomes durable together with them.
+
+        Args:
+            on_commit (callable): Called from the writer thread with the inserted ids once committed
+                                  (in the order of detections; None for a row that had to be dropped).
+        Returns:
+            int: Ticket to pass to wait() for durability.
+        """
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("DetectionWriter is closed.")
+            self._submitted += 1
+            ticket = self._submitted
+            self._entries.append((ticket, list(detections), job_id, checkpoint, on_commit))
+            self._pending_rows += len(detections)
+            if self._oldest_time is None:
+                self._oldest_time = time.monotonic()
+            writer_pending_rows.set(self._pending_rows)
+            if self._pending_rows >= self.max_rows:
+                self._condition.notify_all()
+            return ticket
+
+    def wait(self, ticket: int = None, timeout: float = None) -> bool:
+        """
+        Blocks until the entry with this ticket (default: everything submitted so far) is committed.
+
+        Returns:
+            bool: False if the timeout expired first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            ticket = self._submitted if ticket is None else ticket
+            while self._committed < ticket:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+
+    def flush(self, timeout: float = None) -> bool:
+        """Commits everything buffered now and waits for it to be durable."""
+        with self._condition:
+            self._flush_requested = True
+            self._condition.notify_all()
+        return self.wait(timeout=timeout)
+
+    def close(self, timeout: float = None):
+        """Flushes the buffer and stops the writer thread (call on shutdown)."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+
+    def _commit(self, detections, checkpoints):
+        """commit_detection_batch, retrying transient errors (locked/busy database) up to max_attempts times."""
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                inserted_ids = commit_detection_batch(detections, checkpoints)
+                writer_flushes_total.inc()
+                writer_rows_total.inc(len(inserted_ids))
+                return inserted_ids
+            except sqlite3.OperationalError as e:
+                writer_errors_total.inc()
+                message = str(e).lower()
+                if attempt == self.max_attempts or ('locked' not in message and 'busy' not in message):
+                    raise
+                hot_path_log('detection_writer_error', f"ERROR: Detection writer found the database busy, retrying: {e}")
+                time.sleep(self.retry_delay)
+            except Exception:
+                writer_errors_total.inc()
+                raise
+
+    def _commit_rows(self, detections, checkpoints):
+        """Commits rows one per transaction, dropping those that fail, then the checkpoints; returns ids with None for dropped rows."""
+        inserted_ids = []
+        for detection in detections:
+            try:
+                inserted_ids.extend(self._commit([detection], None))
+            except Exception as e:
+                writer_dropped_rows_total.inc()
+                print(f"ERROR: Detection writer dropped a detection it could not commit ({e}): {detection}")
+                inserted_ids.append(None)
+        if checkpoints:
+            try:
+                self._commit([], checkpoints)
+            except Exception as e:
+                print(f"ERROR: Detection writer could not store the checkpoints {checkpoints}: {e}")
+        return inserted_ids
+
+    def _take_batch(self):
+        """Waits until a flush is due and removes the buffered entries; returns None once closed and drained."""
+        with self._condition:
+            while True:
+                if self._entries:
+                    age = time.monotonic() - self._oldest_time
+                    if (self._pending_rows >= self.max_rows or age >= self.max_delay
+                            or self._flush_requested or self._closed):
+                        break
+                    self._condition.wait(self.max_delay - age)
+                elif self._closed:
+                    return None
+                else:
+                    self._flush_requested = False
+                    self._condition.wait()
+            entries, self._entries = self._entries, []
+            self._pending_rows = 0
+            self._oldest_time = None
+            self._flush_requested = False
+            writer_pending_rows.set(0)
+            return entries
+
+    def _run(self):
+        while True:
+            entries = self._take_batch()
+            if entries is None:
+                return
+            detections, checkpoints = [], {}
+            for _, entry_detections, job_id, checkpoint, _ in entries:
+                detections.extend(dict(d, job_id=d.get('job_id', job_id)) for d in entry_detections)
+                if checkpoint is not None:
+                    checkpoints[job_id] = checkpoint  # later checkpoints of a job supersede earlier ones
+            try:
+                inserted_ids = self._commit(detections, checkpoints)
+            except Exception as e:
+                hot_path_log('detection_writer_error', f"ERROR: Detection writer failed to commit {len(detections)} rows, "
+                                                       f"committing them one at a time: {e}")
+                inserted_ids = self._commit_rows(detections, checkpoints)
+
+            offset = 0
+            for _, entry_detections, _, _, on_commit in entries:
+                entry_ids = inserted_ids[offset:offset + len(entry_detections)]
+                offset += len(entry_detections)
+                if on_commit is not None:
+                    try:
+                        on_commit(entry_ids)
+                    except Exception as e:
+                        hot_path_log('detection_writer_callback_error', f"ERROR: Detection writer callback failed: {e}")
+            with self._condition:
+                self._committed = entries[-1][0]
+                self._condition.notify_all()
@@ -0,0 +1,107 @@
+# event_stream.py
+
+import json
+import threading
+from collections import deque
+
+
+class EventBroker:
+    def __init__(self, history_size: int = 1000, keepalive_seconds: float = 15.0):
+        """
+        In-process publish/subscribe hub used to push monitoring events to browsers
+        as Server-Sent Events.
+
+        Args:
+            history_size (int): How many replayable events are kept so reconnecting
+                                clients can resume from their Last-Event-ID.
+            keepalive_seconds (float): Interval for comment lines that keep idle
+                                       connections open through proxies.
+        """
+        self.keepalive_seconds = keepalive_seconds
+        self._cond = threading.Condition()
+        self._history = deque(maxlen=history_size)
+        self._latest = {}  # event type -> (id, data) for coalesced events such as progress
+        self._last_id = 0
+        self._evicted_up_to = 0  # id of the newest event dropped from the history
+
+    @property
+    def last_event_id(self) -> int:
+        with self._cond:
+            return self._last_id
+
+    def publish(self, event_type: str, data, coalesce: bool = False) -> int:
+        """
+        Publishes an event to all listeners.
+
+        Args:
+            event_type (str): SSE event name (e.g. 'detection', 'progress').
+            data: JSON-serialisable payload.
+            coalesce (bool): When True only the most recent event of this type is kept,
+                             so high-frequency ticks never push detections out of the history.
+        Returns:
+            int: The id assigned to the event.
+        """
+        with self._cond:
+            self._last_id += 1
+            event = (self._last_id, event_type, data)
+            if coalesce:
+                self._latest[event_type] = event
+            else:
+                if len(self._history) == self._history.maxlen:
+                    self._evicted_up_to = self._history[0][0]
+                self._history.append(event)
+            self._cond.notify_all()
+            return self._last_id
+
+    def _pending_events(self, after_id: int):
+        """Returns events newer than after_id, or None if the history no longer reaches back that far."""
+        if after_id < self._evicted_up_to:
+            return None
+        events = [event for event in self._history if event[0] > after_id]
+        events.extend(event for event in self._latest.values() if event[0] > after_id)
+        events.sort(key=lambda event: event[0])
+        return events
+
+    @staticmethod
+    def _format(event_id: int, event_type: str, data) -> str:
+        return f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+    def stream(self, last_event_id: int = None):
+        """
+        Generator producing the SSE wire format for one client.
+
+        Args:
+            last_event_id (int): Id of the last event the client saw. Missed events are
+                                 replayed; if they were already evicted a 'reset' event tells
+                                 the client to reload its state through the REST endpoints.
+        """
+        with self._cond:
+            initial = None if last_event_id is None else self._pending_events(last_event_id)
+            if initial is None:
+                # New client, or one whose resume point was evicted: send the current
+                # snapshot of coalesced events stamped with the current id.
+                cursor = self._last_id
+                initial = [(cursor, event_type, data) for _, event_type, data in
+                           sorted(self._latest.values(), key=lambda event: event[0])]
+                if last_event_id is not None:
+                    initial.append((cursor, 'reset', {}))
+            else:
+                cursor = last_event_id
+
+        yield "retry: 3000\n\n"
+        for event in initial:
+            yield self._format(*event)
+            cursor = max(cursor, event[0])
+
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._last_id > cursor, timeout=self.keepalive_seconds)
+                events = self._pending_events(cursor)
+                if events is None:
+                    events = [(self._last_id, 'reset', {})]
+            if not events:
+                yield ": keepalive\n\n"
+                continue
+            for event in events:
+                yield self._format(*event)
+                cursor = max(cursor, event[0])
@@ -0,0 +1,119 @@
+# frame_broadcaster.py
+
+import threading
+import time
+
+import cv2
+
+from utils.metrics import stage_timer
+
+
+class FrameBroadcaster:
+    def __init__(self, max_fps: float = 15.0, jpeg_quality: int = 80, output_size: tuple = None,
+                 keepalive_seconds: float = 5.0):
+        """
+        Encodes each new video frame to JPEG exactly once and fans the same bytes
+        out to every connected MJPEG client.
+
+        Args:
+            max_fps (float): Upper bound on how many frames per second are encoded and sent.
+            jpeg_quality (int): JPEG quality passed to cv2.imencode (1-100).
+            output_size (tuple): Optional (width, height) the frames are resized to before encoding.
+            keepalive_seconds (float): When no new frame arrives for this long, the last frame is
+                                       re-sent so disconnected clients are noticed and released.
+        """
+        self.max_fps = max_fps
+        self.jpeg_quality = jpeg_quality
+        self.output_size = output_size
+        self.keepalive_seconds = keepalive_seconds
+
+        self._cond = threading.Condition()
+        self._raw_frame = None
+        self._raw_version = 0
+        self._jpeg_bytes = None
+        self._version = 0
+        self._subscribers = 0
+
+        self._encoder_thread = threading.Thread(target=self._encode_loop, daemon=True)
+        self._encoder_thread.start()
+
+    @property
+    def subscriber_count(self) -> int:
+        """Number of clients currently consuming the MJPEG stream."""
+        with self._cond:
+            return self._subscribers
+
+    @property
+    def version(self) -> int:
+        """Counter incremented every time a new JPEG frame is available."""
+        with self._cond:
+            return self._version
+
+    def publish(self, frame):
+        """Hands a new BGR frame to the broadcaster. Cheap; encoding happens on the encoder thread."""
+        with self._cond:
+            self._raw_frame = frame
+            self._raw_version += 1
+            self._cond.notify_all()
+
+    def _encode_loop(self):
+        encoded_raw_version = 0
+        last_encode_time = 0.0
+        while True:
+            with self._cond:
+                # Only encode when a newer frame exists and somebody is watching.
+                while self._raw_version == encoded_raw_version or self._subscribers == 0:
+                    self._cond.wait()
+                frame = self._raw_frame
+                encoded_raw_version = self._raw_version
+
+            if self.max_fps:
+                wait = (1.0 / self.max_fps) - (time.time() - last_encode_time)
+                if wait > 0:
+                    time.sleep(wait)
+                    with self._cond:
+                        # Pick up whatever arrived while throttling.
+                        frame = self._raw_frame
+                        encoded_raw_version = self._raw_version
+            last_encode_time = time.time()
+
+            try:
+                with stage_timer('mjpeg_encode'):
+                    if self.output_size:
+                        frame = cv2.resize(frame, self.output_size, interpolation=cv2.INTER_AREA)
+                    ret, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), int(self.jpeg_quality)])
+            except Exception as e:
+                print(f"ERROR: Failed to encode frame for MJPEG stream: {e}")
+                continue
+            if not ret:
+                # Skip this frame and wait for the next one instead of spinning on it.
+                continue
+
+            with self._cond:
+                self._jpeg_bytes = buffer.tobytes()
+                self._version += 1
+                self._cond.notify_all()
+
+    def frames(self):
+        """
+        Generator yielding multipart MJPEG chunks for one client. The generator blocks until
+        a newer frame is available (or the keepalive expires) instead of re-encoding on a timer.
+        """
+        with self._cond:
+            self._subscribers += 1
+            self._cond.notify_all()
+        last_version = 0
+        try:
+            while True:
+                with self._cond:
+                    if self._version == last_version:
+                        self._cond.wait_for(lambda: self._version != last_version, timeout=self.keepalive_seconds)
+                    if self._jpeg_bytes is None:
+                        continue
+                    last_version = self._version
+                    frame_bytes = self._jpeg_bytes
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+        finally:
+            with self._cond:
+                self._subscribers -= 1
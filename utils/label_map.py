@@ -0,0 +1,73 @@
+# label_map.py
+
+import threading
+
+LABEL_KINDS = ('fruit_type', 'ripeness', 'disease')
+
+
+class LabelMap:
+    def __init__(self, loader):
+        """
+        In-process copy of the label dictionaries. Detection rows store small integer ids for their
+        fruit type, ripeness, disease and video; reads turn them back into strings with this map
+        instead of joining the lookup tables.
+
+        Only committed ids are ever loaded, so an id inserted by a transaction that later rolls back
+        never enters the map. An unknown id (a label added since the last load, possibly by another
+        process) triggers one reload; labels are never deleted, so loaded entries stay valid.
+
+        Args:
+            loader (callable): Returns (kind, id, name) rows for every label and video
+                               (kind is one of LABEL_KINDS or 'video').
+        """
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._names = {}
+        self._ids = {}
+        self._loaded = False
+
+    def reload(self):
+        rows = self._loader()
+        names, ids = {}, {}
+        for kind, label_id, name in rows:
+            names.setdefault(kind, {})[label_id] = name
+            ids.setdefault(kind, {})[name] = label_id
+        with self._lock:
+            self._names, self._ids, self._loaded = names, ids, True
+
+    def name(self, kind: str, label_id: int):
+        """String for a stored id (None for None)."""
+        if label_id is None:
+            return None
+        name = self._names.get(kind, {}).get(label_id)
+        if name is None:
+            self.reload()
+            name = self._names.get(kind, {}).get(label_id)
+        return name
+
+    def names(self, kind: str) -> dict:
+        """
+        The loaded id -> name dict of a kind, for decoding many rows without a method call per value.
+        A later reload replaces it rather than changing it, so callers fall back to name() on a miss.
+        """
+        if not self._loaded:
+            self.reload()
+        return self._names.get(kind, {})
+
+    def id_of(self, kind: str, name: str):
+        """Committed id of a label, or None if it has never been stored."""
+        if name is None:
+            return None
+        if not self._loaded:
+            self.reload()
+        label_id = self._ids.get(kind, {}).get(name)
+        if label_id is None:
+            self.reload()
+            label_id = self._ids.get(kind, {}).get(name)
+        return label_id
+
+    def known_id(self, kind: str, name: str):
+        """Id of a label if it is already in the map (no reload after the first load); used by the insert path."""
+        if not self._loaded:
+            self.reload()
+        return self._ids.get(kind, {}).get(name)
@@ -0,0 +1,123 @@
+# mtl_model.py
+
+import torch
+import torch.nn as nn
+from torchvision import models, transforms
+
+# Multitask MobileNetV2: shared backbone with fruit, ripeness and disease heads
+class MultitaskModelMobileNetV2(nn.Module):
+    def __init__(self, num_fruit_classes, num_ripeness_classes, num_disease_classes, pretrained=True, freeze_backbone=False):
+        super(MultitaskModelMobileNetV2, self).__init__()
+        self.mobilenet = models.mobilenet_v2(pretrained=pretrained)
+        self.backbone = self.mobilenet.features
+        self.backbone_output_size = self.mobilenet.classifier[1].in_features
+
+        if freeze_backbone:
+            for param in self.backbone.parameters():
+                param.requires_grad = False
+
+        self.fc_fruit = nn.Sequential(
+            nn.Linear(self.backbone_output_size, 512),
+            nn.ReLU(),
+            nn.Dropout(0.5),
+            nn.Linear(512, num_fruit_classes)
+        )
+
+        self.fc_ripeness = nn.Sequential(
+            nn.Linear(self.backbone_output_size, 512),
+            nn.ReLU(),
+            nn.Dropout(0.5),
+            nn.Linear(512, num_ripeness_classes)
+        )
+
+        self.fc_disease = nn.Sequential(
+            nn.Linear(self.backbone_output_size, 512),
+            nn.ReLU(),
+            nn.Dropout(0.5),
+            nn.Linear(512, num_disease_classes)
+        )
+
+    def forward(self, x):
+        features = self.backbone(x)
+        features = torch.mean(features, [2, 3])
+        features = features.view(features.size(0), -1)
+        fruit_output = self.fc_fruit(features)
+        ripeness_output = self.fc_ripeness(features)
+        disease_output = self.fc_disease(features)
+        return fruit_output, ripeness_output, disease_output
+
+# Class names, in the order of the model outputs
+fruit_class_names = ['apple', 'grapes', 'orange', 'strawberry']
+disease_class_names = ['Apple___Apple_scab', 'Apple___Black_rot', 'Apple___Cedar_apple_rust', 'Apple___healthy', 'Grape___Black_rot', 'Grape___Esca_(Black_Measles)', 'Grape___Leaf_blight_(Isariopsis_Leaf_Spot)', 'Grape___healthy', 'Orange___Haunglongbing_(Citrus_greening)', 'Strawberry___Leaf_scorch', 'Strawberry___healthy']
+ripeness_class_names = ['ripe', 'unripe']
+
+# Preprocessing used at training time
+test_transforms = transforms.Compose([
+    transforms.Resize((224, 224)),
+    transforms.ToTensor(),
+    transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+])
+
+
+def load_mtl_model(model_path: str = None, device: torch.device = None) -> nn.Module:
+    """
+    Builds the multitask model and loads its weights.
+
+    Args:
+        model_path (str): Path to the saved state dict. If None the model keeps its random
+                          initialisation (used for dry-run benchmarks).
+        device (torch.device): Target device; defaults to CUDA when available.
+    """
+    device = device or torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model = MultitaskModelMobileNetV2(
+        num_fruit_classes=len(fruit_class_names),
+        num_ripeness_classes=len(ripeness_class_names),
+        num_disease_classes=len(disease_class_names),
+        pretrained=False,
+        freeze_backbone=False
+    )
+    if model_path is not None:
+        model.load_state_dict(torch.load(model_path, map_location=torch.device('cpu'))) # Load to CPU first
+    model.to(device)
+    model.eval()
+    return model
+
+
+class MTLClassifier:
+    def __init__(self, model_path: str = None, device: torch.device = None):
+        """
+        In-process fruit / ripeness / disease classifier, for callers that do not go
+        through the MTL HTTP API (e.g. batch processing).
+        """
+        self.device = device or torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.model = load_mtl_model(model_path, self.device)
+
+    def predict_batch(self, images: list) -> list:
+        """
+        Classifies a list of PIL images in a single forward pass.
+
+        Returns:
+            list[dict]: One dict per image with the same keys as the MTL API response
+                        plus softmax confidences.
+        """
+        if not images:
+            return []
+        batch = torch.stack([test_transforms(image.convert("RGB")) for image in images]).to(self.device)
+        with torch.no_grad():
+            outputs = self.model(batch)
+        fruit_probs, ripeness_probs, disease_probs = (torch.softmax(output, dim=1) for output in outputs)
+        fruit_conf, fruit_idx = fruit_probs.max(1)
+        ripeness_conf, ripeness_idx = ripeness_probs.max(1)
+        disease_conf, disease_idx = disease_probs.max(1)
+
+        predictions = []
+        for i in range(len(images)):
+            predictions.append({
+                "fruit": fruit_class_names[fruit_idx[i].item()],
+                "ripeness": ripeness_class_names[ripeness_idx[i].item()],
+                "disease": disease_class_names[disease_idx[i].item()],
+                "confidence_fruit": fruit_conf[i].item(),
+                "confidence_ripeness": ripeness_conf[i].item(),
+                "confidence_disease": disease_conf[i].item()
+            })
+        return predictions
@@ -0,0 +1,261 @@
+# profiling.py
+
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import Response, jsonify, request
+
+
+class SamplingProfiler:
+    def __init__(self):
+        """
+        Low-overhead statistical profiler for a running process. A background thread
+        snapshots the stacks of all threads (including the monitoring loop) at a fixed
+        interval and aggregates them into flamegraph 'collapsed stack' lines.
+        """
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._stacks = Counter()
+        self._samples = 0
+        self._started_at = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_seconds: float = 0.005, max_seconds: float = 300.0) -> bool:
+        """Starts sampling; returns False if a capture is already running. Stops by itself after max_seconds."""
+        with self._lock:
+            if self.is_running:
+                return False
+            self._stacks = Counter()
+            self._samples = 0
+            self._started_at = time.monotonic()
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, args=(interval_seconds, max_seconds),
+                                            name='sampling_profiler', daemon=True)
+            self._thread.start()
+            return True
+
+    def _run(self, interval_seconds, max_seconds):
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + max_seconds
+        while not self._stop_event.wait(interval_seconds) and time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, f"thread-{thread_id}"))
+                self._stacks[';'.join(reversed(stack))] += 1
+            self._samples += 1
+
+    def stop(self) -> str:
+        """Stops sampling and returns the collapsed stacks ('frame;frame;frame count' per line)."""
+        with self._lock:
+            self._stop_event.set()
+            if self._thread is not None:
+                self._thread.join()
+                self._thread = None
+            return ''.join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+
+class CProfileCapture:
+    def __init__(self):
+        """
+        Time-boxed cProfile capture. cProfile only sees the thread that enables it, so
+        threads opt in: long-running loops call tick() once per iteration and request
+        handlers wrap their work in section(). Both cost a single clock read when idle.
+        """
+        self._lock = threading.Lock()
+        self._deadline = 0.0
+        self._profiles = []
+        self._local = threading.local()
+
+    def arm(self, seconds: float) -> bool:
+        """Starts a capture window; returns False if one is already open."""
+        with self._lock:
+            if time.monotonic() < self._deadline:
+                return False
+            self._profiles = []
+            self._deadline = time.monotonic() + seconds
+            return True
+
+    def _submit(self, profile):
+        with self._lock:
+            self._profiles.append(profile)
+
+    def tick(self):
+        """Per-iteration hook for long-running threads such as monitoring_loop."""
+        profile = getattr(self._local, 'profile', None)
+        if time.monotonic() < self._deadline:
+            if profile is None:
+                self._local.profile = cProfile.Profile()
+                self._local.profile.enable()
+        elif profile is not None:
+            self.release()
+
+    def release(self):
+        """Flushes this thread's profile, e.g. when a loop exits during a capture."""
+        profile = getattr(self._local, 'profile', None)
+        if profile is not None:
+            profile.disable()
+            self._local.profile = None
+            self._submit(profile)
+
+    @contextmanager
+    def section(self):
+        """Profiles the enclosed block when a capture window is open."""
+        if time.monotonic() >= self._deadline or getattr(self._local, 'profile', None) is not None:
+            yield
+            return
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self._submit(profile)
+
+    def collect(self, sort: str = 'cumulative', limit: int = 60) -> str:
+        """Waits for the window to close and returns the merged statistics as text."""
+        remaining = self._deadline - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+        # Give looping threads one more iteration to notice the deadline and hand in their profile
+        time.sleep(0.5)
+        with self._lock:
+            profiles, self._profiles = self._profiles, []
+        if not profiles:
+            return "No profiled activity during the capture window.\n"
+        output = io.StringIO()
+        stats = pstats.Stats(profiles[0], stream=output)
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.sort_stats(sort).print_stats(limit)
+        return output.getvalue()
+
+
+class TorchForwardProfiler:
+    def __init__(self):
+        """Optionally wraps the next N model forward passes in torch.profiler."""
+        self._lock = threading.Lock()
+        self._remaining = 0
+        self._results = []
+        self._done = threading.Event()
+
+    def arm(self, forwards: int) -> bool:
+        with self._lock:
+            if self._remaining > 0:
+                return False
+            self._remaining = forwards
+            self._results = []
+            self._done.clear()
+            return True
+
+    @contextmanager
+    def forward(self):
+        """Wrap a model forward pass; profiled only while a capture is armed."""
+        with self._lock:
+            active = self._remaining > 0
+        if not active:
+            yield
+            return
+        import torch
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        with torch.profiler.profile(activities=activities, record_shapes=True) as prof:
+            yield
+        with self._lock:
+            if self._remaining > 0:
+                self._results.append(prof.key_averages().table(sort_by='self_cpu_time_total', row_limit=25))
+                self._remaining -= 1
+                if self._remaining == 0:
+                    self._done.set()
+
+    def collect(self, timeout: float) -> str:
+        self._done.wait(timeout)
+        with self._lock:
+            self._remaining = 0
+            results, self._results = self._results, []
+        if not results:
+            return "No forward passes ran during the capture window.\n"
+        return '\n\n'.join(f"--- forward {i + 1} ---\n{table}" for i, table in enumerate(results))
+
+
+def register_profiling_routes(app, cprofile_capture: CProfileCapture, torch_profiler: TorchForwardProfiler = None):
+    """
+    Adds admin endpoints to a Flask app:
+      POST /admin/profile/sampling/start?interval_ms=5&max_seconds=300
+      POST /admin/profile/sampling/stop          -> collapsed stacks (flamegraph.pl / speedscope input)
+      GET  /admin/profile/cprofile?seconds=10&sort=cumulative&limit=60
+      GET  /admin/profile/torch?forwards=5&timeout=30   (only when torch_profiler is given)
+    The endpoints are disabled unless the PROFILING_ADMIN_TOKEN environment variable is set;
+    requests must then send it in X-Admin-Token.
+    """
+    sampling_profiler = SamplingProfiler()
+
+    def unauthorized():
+        token = os.environ.get('PROFILING_ADMIN_TOKEN')
+        if not token:
+            return jsonify({"error": "Profiling is disabled (PROFILING_ADMIN_TOKEN is not set)."}), 404
+        if not hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode(), token.encode()):
+            return jsonify({"error": "Invalid or missing X-Admin-Token."}), 403
+        return None
+
+    @app.route('/admin/profile/sampling/start', methods=['POST'])
+    def start_sampling_profile():
+        denied = unauthorized()
+        if denied:
+            return denied
+        interval_ms = request.args.get('interval_ms', 5, type=float)
+        max_seconds = min(request.args.get('max_seconds', 300, type=float), 600)
+        if not sampling_profiler.start(max(interval_ms, 1) / 1000.0, max_seconds):
+            return jsonify({"error": "A sampling capture is already running."}), 409
+        return jsonify({"status": f"Sampling every {interval_ms} ms (stops after {max_seconds} s)."})
+
+    @app.route('/admin/profile/sampling/stop', methods=['POST'])
+    def stop_sampling_profile():
+        denied = unauthorized()
+        if denied:
+            return denied
+        collapsed = sampling_profiler.stop()
+        return Response(collapsed, mimetype='text/plain',
+                        headers={'Content-Disposition': 'attachment; filename=profile.folded'})
+
+    @app.route('/admin/profile/cprofile', methods=['GET'])
+    def cprofile_capture_endpoint():
+        denied = unauthorized()
+        if denied:
+            return denied
+        seconds = min(request.args.get('seconds', 10, type=float), 120)
+        if not cprofile_capture.arm(seconds):
+            return jsonify({"error": "A cProfile capture is already running."}), 409
+        report = cprofile_capture.collect(sort=request.args.get('sort', 'cumulative'),
+                                          limit=request.args.get('limit', 60, type=int))
+        return Response(report, mimetype='text/plain')
+
+    if torch_profiler is not None:
+        @app.route('/admin/profile/torch', methods=['GET'])
+        def torch_profile_endpoint():
+            denied = unauthorized()
+            if denied:
+                return denied
+            if not torch_profiler.arm(request.args.get('forwards', 5, type=int)):
+                return jsonify({"error": "A torch.profiler capture is already running."}), 409
+            report = torch_profiler.collect(timeout=min(request.args.get('timeout', 30, type=float), 300))
+            return Response(report, mimetype='text/plain')
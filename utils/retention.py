@@ -0,0 +1,163 @@
+# retention.py
+
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from utils.database_manager import connect_db, bucket_start_ms, get_archive_partitions, \
+                                   iter_detections_for_archive, record_archive_partition, \
+                                   delete_archive_partitions_before, claim_archive_day, release_archive_day, \
+                                   get_claimed_archive_days
+from utils.detection_archive import ArchiveWriter, archive_extension
+
+
+def _next_day_start_ms(day_start_ms: int) -> int:
+    # Calendar arithmetic on the local date, so days stay correct across DST changes
+    day = datetime.fromtimestamp(day_start_ms / 1000).date() + timedelta(days=1)
+    return int(datetime(day.year, day.month, day.day).timestamp() * 1000)
+
+
+class RetentionManager:
+    def __init__(self, archive_folder: str, hot_days: int = 30, archive_days: int = 365,
+                 vacuum_pages: int = 2000, convert_to_incremental_vacuum: bool = True,
+                 claim_lease_seconds: float = 6 * 3600):
+        """
+        Keeps the detections table small. Whole local days older than hot_days are moved into one
+        compressed archive file per day (Parquet with pyarrow, gzip NDJSON otherwise) and deleted
+        from the table; archives older than archive_days are removed, after which only the
+        hourly/daily rollups remain for that period. Freed pages are returned with incremental
+        VACUUM, a few at a time.
+
+        Passes in several processes may share the database: each day is claimed in the database
+        before it is archived, and a day claimed by another pass is left to it.
+
+        Args:
+            archive_folder (str): Directory of the archive files.
+            hot_days (int): Age (days) after which detections leave the hot table.
+            archive_days (int): Age (days) after which archive files are deleted; None keeps them forever.
+            vacuum_pages (int): Pages released per incremental VACUUM step.
+            convert_to_incremental_vacuum (bool): Run one full VACUUM to enable auto_vacuum=INCREMENTAL
+                on a database created before it was set. The VACUUM holds the write lock for as long as it
+                runs, so only enable this offline, never next to a live writer.
+            claim_lease_seconds (float): How long a day claim lasts; a crashed pass's days are retried after it.
+        """
+        self.archive_folder = archive_folder
+        self.hot_days = hot_days
+        self.archive_days = archive_days
+        self.vacuum_pages = vacuum_pages
+        self.convert_to_incremental_vacuum = convert_to_incremental_vacuum
+        self.claim_lease_seconds = claim_lease_seconds
+        self._owner = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        os.makedirs(archive_folder, exist_ok=True)
+
+    def _archive_path(self, day_start_ms: int) -> str:
+        day = datetime.fromtimestamp(day_start_ms / 1000).strftime('%Y-%m-%d')
+        path = os.path.join(self.archive_folder, f"detections_{day}{archive_extension()}")
+        part = 1
+        # Rows stored late for an already archived day go to an extra part file
+        while os.path.exists(path):
+            part += 1
+            path = os.path.join(self.archive_folder, f"detections_{day}.part{part}{archive_extension()}")
+        return path
+
+    def _remove_orphans(self):
+        """
+        Deletes archive files not in the manifest (a crash between writing and recording them).
+        Temporary files and the files of days claimed by a running pass may still be in progress.
+        """
+        known = {os.path.normpath(path) for path in get_archive_partitions()}
+        claimed = {datetime.fromtimestamp(day_start_ms / 1000).strftime('%Y-%m-%d')
+                   for day_start_ms in get_claimed_archive_days()}
+        for name in os.listdir(self.archive_folder):
+            path = os.path.normpath(os.path.join(self.archive_folder, name))
+            if not name.startswith('detections_') or name.endswith('.tmp') or path in known:
+                continue
+            if name[len('detections_'):len('detections_') + 10] in claimed:
+                continue
+            os.remove(path)
+
+    def archive_day(self, day_start_ms: int) -> int:
+        """
+        Moves one local day of detections to an archive file; returns the number of rows moved
+        (0 if another pass holds the day).
+        """
+        if not claim_archive_day(day_start_ms, self._owner, self.claim_lease_seconds):
+            return 0
+        try:
+            day_end_ms = _next_day_start_ms(day_start_ms)
+            writer = ArchiveWriter(self._archive_path(day_start_ms))
+            max_id = 0
+            try:
+                for rows in iter_detections_for_archive(day_start_ms, day_end_ms):
+                    writer.write_rows(rows)
+                    max_id = rows[-1][0]
+            except Exception:
+                writer.abort()
+                raise
+            if writer.row_count == 0:
+                writer.abort()
+                return 0
+            path = writer.close()
+            record_archive_partition(path, day_start_ms, day_end_ms, writer.row_count, max_id)
+            return writer.row_count
+        finally:
+            release_archive_day(day_start_ms, self._owner)
+
+    def _days_to_archive(self, cutoff_ms: int) -> list:
+        with connect_db() as conn:
+            conn.create_function('bucket_start_ms', 2, bucket_start_ms, deterministic=True)
+            rows = conn.execute("SELECT DISTINCT bucket_start_ms(epoch_ms, 'day') FROM detections "
+                                "WHERE epoch_ms < ? ORDER BY 1", (cutoff_ms,)).fetchall()
+        return [row[0] for row in rows]
+
+    def _incremental_vacuum(self):
+        with connect_db() as conn:
+            mode = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+            if mode != 2 and self.convert_to_incremental_vacuum:
+                print("Retention: converting the database to incremental auto-vacuum (one full VACUUM)...")
+                conn.commit()
+                conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                conn.execute('VACUUM')
+            elif mode == 2:
+                conn.execute(f'PRAGMA incremental_vacuum({int(self.vacuum_pages)})').fetchall()
+
+    def run_once(self, now: datetime = None) -> dict:
+        """Runs one retention pass and returns what it did."""
+        with self._lock:
+            now = now or datetime.now()
+            summary = {'archived_days': 0, 'archived_rows': 0, 'expired_archives': 0}
+            self._remove_orphans()
+            cutoff_ms = bucket_start_ms(int((now - timedelta(days=self.hot_days)).timestamp() * 1000), 'day')
+            for day_start_ms in self._days_to_archive(cutoff_ms):
+                moved = self.archive_day(day_start_ms)
+                if moved:
+                    summary['archived_days'] += 1
+                    summary['archived_rows'] += moved
+            if self.archive_days is not None:
+                expiry_ms = int((now - timedelta(days=self.archive_days)).timestamp() * 1000)
+                for path in delete_archive_partitions_before(expiry_ms):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    summary['expired_archives'] += 1
+            self._incremental_vacuum()
+            return summary
+
+    def start(self, interval_seconds: float) -> threading.Thread:
+        """Runs a retention pass every interval_seconds on a daemon thread."""
+        def run():
+            stop = threading.Event()
+            while not stop.wait(interval_seconds):
+                try:
+                    summary = self.run_once()
+                    if summary['archived_rows'] or summary['expired_archives']:
+                        print(f"Retention: {summary}")
+                except Exception as e:
+                    print(f"ERROR: Retention pass failed: {e}")
+
+        thread = threading.Thread(target=run, name='retention', daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,82 @@
+# sampling_controller.py
+
+import threading
+
+
+class AdaptiveSamplingController:
+    def __init__(self, initial_interval: float, min_interval: float = 0.5, max_interval: float = 60.0,
+                 target_latency: float = 2.0, cpu_budget: float = 0.5, smoothing: float = 0.3,
+                 max_step_factor: float = 2.0):
+        """
+        Adjusts the detection interval at runtime from measured per-frame processing time.
+
+        The detection pipeline is treated as a single server that receives one sampled frame
+        per interval. With a service time S and utilisation u = S / interval, queueing delay
+        grows like S / (1 - u). The controller picks the largest utilisation that keeps that
+        latency under target_latency and never exceeds cpu_budget, then sets interval = S / u.
+
+        Args:
+            initial_interval (float): Starting interval in seconds (e.g. the one chosen at upload).
+            min_interval (float): Lower bound on the interval (highest sampling rate).
+            max_interval (float): Upper bound on the interval (lowest sampling rate).
+            target_latency (float): Desired end-to-end detection latency in seconds.
+            cpu_budget (float): Fraction of wall time the detection pipeline may occupy (0-1].
+            smoothing (float): Weight of the newest measurement in the moving average.
+            max_step_factor (float): Largest factor the interval may change by in one update.
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_latency = target_latency
+        self.cpu_budget = cpu_budget
+        self.smoothing = smoothing
+        self.max_step_factor = max_step_factor
+        self._lock = threading.Lock()
+        self._interval = self._clamp(initial_interval)
+        self._service_time = None
+        self._samples = 0
+
+    def _clamp(self, interval: float) -> float:
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    @property
+    def interval(self) -> float:
+        with self._lock:
+            return self._interval
+
+    def observe(self, processing_seconds: float) -> float:
+        """
+        Records how long one sampled frame took (detect + classify + store) and returns
+        the interval to use until the next sampled frame.
+        """
+        with self._lock:
+            if self._service_time is None:
+                self._service_time = processing_seconds
+            else:
+                self._service_time += self.smoothing * (processing_seconds - self._service_time)
+            self._samples += 1
+
+            service_time = self._service_time
+            # Utilisation allowed by the latency target; at or past the target, fall back to the slowest rate
+            latency_utilisation = 1.0 - service_time / self.target_latency if self.target_latency > 0 else 1.0
+            utilisation = min(self.cpu_budget, latency_utilisation)
+            desired = service_time / utilisation if utilisation > 0 else self.max_interval
+
+            # Rate-limit changes so one slow frame does not swing the interval wildly
+            desired = min(max(desired, self._interval / self.max_step_factor), self._interval * self.max_step_factor)
+            self._interval = self._clamp(desired)
+            return self._interval
+
+    def snapshot(self) -> dict:
+        """Current state for the progress endpoint."""
+        with self._lock:
+            return {
+                "detection_interval": self._interval,
+                "sampling_rate_hz": 1.0 / self._interval if self._interval > 0 else None,
+                "avg_processing_seconds": self._service_time,
+                "utilisation": (self._service_time / self._interval) if self._service_time is not None else None,
+                "min_interval": self.min_interval,
+                "max_interval": self.max_interval,
+                "target_latency": self.target_latency,
+                "cpu_budget": self.cpu_budget,
+                "samples": self._samples
+            }
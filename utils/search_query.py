@@ -0,0 +1,85 @@
+# search_query.py
+
+import re
+from datetime import datetime, timedelta
+
+_UNITS = {'minute': timedelta(minutes=1), 'hour': timedelta(hours=1), 'day': timedelta(days=1),
+          'week': timedelta(weeks=1), 'month': timedelta(days=30)}
+_NUMBERS = {'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7,
+            'ten': 10, 'twelve': 12, 'twenty-four': 24}
+_DATE = r'(\d{4}-\d{2}-\d{2})'
+
+# Checked in order; each returns (start, end) given the match and now
+_TIME_PHRASES = [
+    (re.compile(r'\b(?:in the |over the |during the )?(?:last|past) (\d+|' + '|'.join(_NUMBERS) + r') (minute|hour|day|week|month)s?\b'),
+     lambda m, now: (now - _UNITS[m.group(2)] * (int(m.group(1)) if m.group(1).isdigit() else _NUMBERS[m.group(1)]), now)),
+    (re.compile(r'\b(?:in the |over the |during the )?(?:last|past) (minute|hour|day|week|month)\b'),
+     lambda m, now: (now - _UNITS[m.group(1)], now)),
+    (re.compile(r'\btoday\b'),
+     lambda m, now: (now.replace(hour=0, minute=0, second=0, microsecond=0), now)),
+    (re.compile(r'\byesterday\b'),
+     lambda m, now: (now.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1),
+                     now.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(microseconds=1))),
+    (re.compile(r'\bthis week\b'),
+     lambda m, now: ((now - timedelta(days=now.weekday())).replace(hour=0, minute=0, second=0, microsecond=0), now)),
+    (re.compile(r'\bthis month\b'),
+     lambda m, now: (now.replace(day=1, hour=0, minute=0, second=0, microsecond=0), now)),
+    (re.compile(r'\bbetween ' + _DATE + r' and ' + _DATE + r'\b'),
+     lambda m, now: (datetime.fromisoformat(m.group(1)),
+                     datetime.fromisoformat(m.group(2)) + timedelta(days=1) - timedelta(microseconds=1))),
+    (re.compile(r'\b(?:since|after|from) ' + _DATE + r'\b'),
+     lambda m, now: (datetime.fromisoformat(m.group(1)), now)),
+    (re.compile(r'\b(?:on )?' + _DATE + r'\b'),
+     lambda m, now: (datetime.fromisoformat(m.group(1)),
+                     datetime.fromisoformat(m.group(1)) + timedelta(days=1) - timedelta(microseconds=1))),
+]
+
+# Filler words of natural-language queries that would otherwise have to appear in every match
+_STOPWORDS = {'a', 'an', 'and', 'any', 'at', 'detection', 'detections', 'for', 'find', 'from', 'in', 'me',
+              'of', 'on', 'show', 'the', 'with'}
+
+
+def extract_time_range(text: str, now: datetime = None) -> tuple:
+    """
+    Removes the first time phrase ('last week', 'past 3 days', 'yesterday', 'since 2024-05-01', ...)
+    from text.
+
+    Returns:
+        tuple: (remaining text, start datetime or None, end datetime or None); datetimes are local.
+    """
+    now = now or datetime.now()
+    lowered = text.lower()
+    for pattern, resolve in _TIME_PHRASES:
+        match = pattern.search(lowered)
+        if match:
+            start, end = resolve(match, now)
+            return (text[:match.start()] + ' ' + text[match.end():]).strip(), start, end
+    return text.strip(), None, None
+
+
+def to_fts_query(text: str):
+    """
+    Turns free text into an FTS5 MATCH expression: every remaining word must match, as a prefix
+    (so 'blig' finds 'blight'), and is quoted so file names like orchard_3.mp4 are taken literally.
+
+    Returns:
+        str: The expression, or None if no searchable words are left.
+    """
+    terms = []
+    for word in re.findall(r'[^\s"]+', text):
+        if word.lower() in _STOPWORDS or not re.search(r'\w', word):
+            continue
+        terms.append('"' + word.replace('"', '""') + '"*')
+    return ' '.join(terms) or None
+
+
+def parse_search_query(text: str, now: datetime = None) -> dict:
+    """
+    Splits a search like 'black rot in orchard_3.mp4 last week' into an FTS5 MATCH expression
+    and a time window.
+
+    Returns:
+        dict: 'match' (str or None), 'start' and 'end' (datetime or None).
+    """
+    remaining, start, end = extract_time_range(text or '', now)
+    return {'match': to_fts_query(remaining), 'start': start, 'end': end}
@@ -0,0 +1,37 @@
+# serialization.py
+
+import json
+
+# orjson (optional) encodes detection lists several times faster than the json module.
+# Without it the same compact JSON is produced by json.dumps.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value):
+    # Values the API may hand over besides JSON's own types (a BLOB column, a datetime)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', errors='replace')
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _json_dumps(value) -> bytes:
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False, default=_default).encode('utf-8')
+
+
+def dumps(value) -> bytes:
+    """Encodes value as compact UTF-8 JSON; dict keys keep their insertion order (the column order of detection rows)."""
+    if orjson is not None:
+        return orjson.dumps(value, default=_default)
+    return _json_dumps(value)
+
+
+def dumps_lines(rows) -> bytes:
+    """Encodes an iterable of values as NDJSON (one compact JSON document per line)."""
+    if orjson is not None:
+        return b''.join(orjson.dumps(row, default=_default, option=orjson.OPT_APPEND_NEWLINE) for row in rows)
+    return b''.join(_json_dumps(row) + b'\n' for row in rows)
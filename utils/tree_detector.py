@@ -1,11 +1,14 @@
 # tree_detector.py
 
 import os
+import time
 import cv2
 import numpy as np
 from ultralytics import YOLO
 from PIL import Image # For converting NumPy arrays to PIL Images if needed
 
+from utils.metrics import stage_timer, STAGE_SECONDS
+
 class TreeDetector:
     def __init__(self, model_path: str):
         """
@@ -19,6 +22,16 @@ class TreeDetector:
         
         self.model = YOLO(model_path)
         print(f"Tree detection model loaded successfully from: {model_path}")
+
+    @classmethod
+    def random_init(cls, model_config: str = 'yolov8n.yaml'):
+        """
+        Builds a detector with randomly initialised weights from an architecture config,
+        for dry-run benchmarks where no trained model is available.
+        """
+        detector = cls.__new__(cls)
+        detector.model = YOLO(model_config)
+        return detector
         
 
     def detect_trees(self, image_np: np.ndarray, confidence_threshold: float = 0.5) -> list[Image.Image]:
@@ -43,7 +56,9 @@ class TreeDetector:
 
         # Run inference
         # The 'verbose=False' prevents excessive logging during detection for cleaner output
-        results = self.model(image_rgb, verbose=False) 
+        with stage_timer('detect'):
+            results = self.model(image_rgb, verbose=False) 
+        crop_start = time.perf_counter()
         
         cropped_tree_images = []
 
@@ -74,6 +89,7 @@ class TreeDetector:
                             cropped_tree_images.append(cropped_pil)
                             # print(f"DEBUG: Detected tree with confidence {confidence:.2f}, cropped size {cropped_pil.size}")
 
+        STAGE_SECONDS.labels(stage='crop').observe(time.perf_counter() - crop_start)
         return cropped_tree_images
 
 # --- Example Usage (for testing this module) ---
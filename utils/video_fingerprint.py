@@ -0,0 +1,103 @@
+# video_fingerprint.py
+
+import hashlib
+import os
+
+import cv2
+
+
+def save_stream_with_hash(stream, path: str, read_size: int = 1024 * 1024) -> str:
+    """
+    Copies an upload stream to disk while hashing it, so the content hash is ready
+    as soon as the last byte is written (no second pass over the file).
+
+    Returns:
+        str: Hex SHA-256 digest of the written bytes.
+    """
+    hasher = hashlib.sha256()
+    with open(path, 'wb') as f:
+        while True:
+            block = stream.read(read_size)
+            if not block:
+                break
+            hasher.update(block)
+            f.write(block)
+    return hasher.hexdigest()
+
+
+def compute_prefix_hash(path: str, prefix_bytes: int = 1024 * 1024) -> str:
+    """SHA-256 of the first prefix_bytes of a file; cheap enough to check before an upload finishes."""
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read(prefix_bytes)).hexdigest()
+
+
+def _dhash(frame, hash_size: int = 8) -> int:
+    """64-bit difference hash of a BGR frame; robust to re-encoding and small resizes."""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    resized = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    diff = resized[:, 1:] > resized[:, :-1]
+    value = 0
+    for bit in diff.flatten():
+        value = (value << 1) | int(bit)
+    return value
+
+
+def compute_frame_hashes(path: str, samples: int = 16) -> tuple:
+    """
+    Perceptual hashes of frames sampled evenly across the video.
+
+    Returns:
+        tuple: (frame_count, list of integer dHashes). The list is empty if the video cannot be read.
+    """
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        return 0, []
+    try:
+        frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        hashes = []
+        if frame_count <= 0:
+            return frame_count, hashes
+        step = max(frame_count // samples, 1)
+        for index in range(0, frame_count, step)[:samples]:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, index)
+            ret, frame = capture.read()
+            if ret:
+                hashes.append(_dhash(frame))
+        return frame_count, hashes
+    finally:
+        capture.release()
+
+
+def fingerprint_video(path: str, content_hash: str, prefix_bytes: int = 1024 * 1024, samples: int = 16) -> dict:
+    """
+    Builds the fingerprint stored for every processed video.
+
+    Args:
+        path (str): Path to the complete video file.
+        content_hash (str): SHA-256 computed while the upload streamed to disk.
+        prefix_bytes (int): Size of the prefix hashed for early matching of in-progress uploads.
+        samples (int): Number of frames hashed perceptually.
+    """
+    frame_count, frame_hashes = compute_frame_hashes(path, samples)
+    return {
+        'content_hash': content_hash,
+        'prefix_hash': compute_prefix_hash(path, prefix_bytes),
+        'total_size': os.path.getsize(path),
+        'frame_count': frame_count,
+        'frame_hashes': frame_hashes
+    }
+
+
+def frame_hashes_match(hashes_a: list, hashes_b: list, max_distance: int = 6) -> bool:
+    """True when both videos sampled the same number of frames and each pair differs in at most max_distance bits."""
+    if not hashes_a or len(hashes_a) != len(hashes_b):
+        return False
+    return all(bin(a ^ b).count('1') <= max_distance for a, b in zip(hashes_a, hashes_b))
+
+
+def fingerprints_match(fingerprint: dict, candidate: dict, max_distance: int = 6) -> bool:
+    """Identical bytes always match; otherwise re-encoded copies match on the perceptual frame hashes."""
+    if fingerprint['content_hash'] and fingerprint['content_hash'] == candidate['content_hash']:
+        return True
+    return (fingerprint['frame_count'] == candidate['frame_count']
+            and frame_hashes_match(fingerprint['frame_hashes'], candidate['frame_hashes'], max_distance))